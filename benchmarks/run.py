@@ -0,0 +1,371 @@
+""" Times File Patrole on a synthetic tree and saves the results as JSON
+
+Run from the repository root:
+
+    python -m benchmarks.run --files 10000 --output results.json
+    python -m benchmarks.run --files 10000 --compare results.json
+
+Trees are written under /dev/shm when it exists so disk speed
+doesn't skew the timings. Notifications stay off, so nothing
+is sent to Twilio.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import argparse
+import platform
+import statistics
+import contextlib
+from datetime import datetime
+
+from benchmarks.tree import SIZE_DISTRIBUTIONS, generate_tree, list_tree, mutate_tree
+
+# Settings recorded with the results, as they change the timings
+RECORDED_SETTINGS = [
+    "PT_BASELINE_FORMAT",
+    "PT_HASH_ALGORITHM",
+    "PT_HASH_WORKERS",
+    "PT_HASH_EXECUTOR",
+    "PT_SCAN_WORKERS",
+    "PT_FINGERPRINT_THRESHOLD",
+    "PT_EVENT_DEBOUNCE",
+    "PT_LOG_FLUSH_INTERVAL",
+    "PT_SCAN_INTERVAL",
+]
+
+# Timings compared between runs and whether lower is better
+COMPARED_TIMINGS = {
+    "create_baseline": "median",
+    "load_baseline": "median",
+    "scan_pass": "median",
+    "detect_to_log": "last",
+}
+
+
+def default_root() -> str:
+    return "/dev/shm" if os.path.isdir("/dev/shm") else os.path.realpath(os.environ.get("TMPDIR", "/tmp"))
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Benchmarks File Patrole on a synthetic tree.")
+
+    parser.add_argument("--files", type=int, default=10000, help="Number of files in the tree.")
+    parser.add_argument("--mean-size", type=int, default=4096, metavar="BYTES", help="Mean file size.")
+    parser.add_argument("--distribution", choices=list(SIZE_DISTRIBUTIONS), default="lognormal", help="File size distribution.")
+    parser.add_argument("--depth", type=int, default=3, help="Directory levels below the root.")
+    parser.add_argument("--fanout", type=int, default=4, help="Subdirectories of each directory.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generator.")
+
+    parser.add_argument("--adds", type=int, default=25, help="Files added by the mutation.")
+    parser.add_argument("--edits", type=int, default=25, help="Files edited by the mutation.")
+    parser.add_argument("--deletes", type=int, default=25, help="Files deleted by the mutation.")
+    parser.add_argument("--renames", type=int, default=25, help="Files renamed by the mutation.")
+
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each timing, the median is compared.")
+    parser.add_argument("--baseline-format", choices=["text", "sqlite"], default="text", help="Format of the baseline.")
+    parser.add_argument("--watch", action="store_true", default=False, help="Detect the mutation with inotify instead of polling.")
+    parser.add_argument("--timeout", type=float, default=60, metavar="SECONDS", help="Longest wait for the mutation to be logged.")
+
+    parser.add_argument("--root", default=default_root(), help="Directory the tree is generated in, defaults to /dev/shm.")
+    parser.add_argument("--keep", action="store_true", default=False, help="Keep the generated tree.")
+    parser.add_argument("--output", metavar="JSON", help="Save the results to this file.")
+    parser.add_argument("--compare", metavar="JSON", help="Compare with earlier results, exiting with 1 on a regression.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Slowdown ratio reported as a regression, defaults to 0.2.")
+
+    return parser.parse_args()
+
+
+def configure(work_dir, args):
+    """ Points the config at the work directory before lib is used """
+
+    from config import Config
+
+    config = Config()
+
+    settings = {
+        "PT_BASELINE_PATH": os.path.join(work_dir, "baseline"),
+        "PT_MONITOR_DIRS": os.path.join(work_dir, "tree"),
+        "PT_IGNORED_DIRS": os.path.join(work_dir, "baseline") + "/",
+        "PT_LOG_LOCATION": os.path.join(work_dir, "logs"),
+        "PT_LOG_FORMAT": "jsonl",
+        "PT_BASELINE_FORMAT": args.baseline_format,
+        "PT_SCAN_INTERVAL": os.environ.get("PT_SCAN_INTERVAL", "0.1"),
+    }
+
+    for key, value in settings.items():
+        config.set(key, value)
+
+    for directory in ("baseline", "logs"):
+        os.makedirs(os.path.join(work_dir, directory), exist_ok=True)
+
+    return config
+
+
+def summarize(runs) -> dict:
+    return {
+        "runs": runs,
+        "min": min(runs),
+        "median": statistics.median(runs),
+    }
+
+
+def quietly(function, *args, **kwargs):
+    """ Calls a function with its prints silenced """
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+
+def time_create_baseline(config, repeat, files) -> tuple:
+    """ Times create_new_baseline, returns the timings and the last baseline """
+
+    from lib import file_handlers as fh
+    from lib.sqlite_baseline import SQLiteBaseline
+
+    baseline_path = config.get("PT_BASELINE_PATH")
+    runs = []
+
+    for _ in range(repeat):
+        # Shared stores would keep writing to the deleted database
+        SQLiteBaseline.close_all()
+        shutil.rmtree(baseline_path, ignore_errors=True)
+
+        started = time.perf_counter()
+        quietly(fh.create_new_baseline, baseline_path, "")
+        runs.append(time.perf_counter() - started)
+
+    SQLiteBaseline.close_all()
+
+    result = summarize(runs)
+    result["files_per_sec"] = files / result["median"]
+
+    return result, fh.get_baseline_files()[0]
+
+
+def time_load_baseline(baseline_file, repeat, files) -> dict:
+    from lib import file_handlers as fh
+    from lib.sqlite_baseline import SQLiteBaseline
+
+    runs = []
+
+    for _ in range(repeat):
+        started = time.perf_counter()
+        baseline = quietly(fh.open_baseline, baseline_file)
+        runs.append(time.perf_counter() - started)
+
+        if isinstance(baseline, SQLiteBaseline):
+            baseline.close()
+
+    result = summarize(runs)
+    result["files_per_sec"] = files / result["median"]
+
+    return result
+
+
+def time_scan_pass(config, baseline_file, repeat, files) -> dict:
+    """ Times one pass of the monitoring worker over the unchanged tree """
+
+    from lib import workers, file_handlers as fh
+    from lib.scheduler import Throttle
+
+    baseline = quietly(fh.open_baseline, baseline_file)
+    config.set("SELECTED_BASELINE_FILE", baseline_file)
+
+    message_queue = queue.Queue()
+    runs = []
+
+    shard_pool = workers.create_shard_pool()
+
+    try:
+        with fh.create_hash_pool(baseline.algorithm) as hash_pool:
+            for _ in range(repeat):
+                started = time.perf_counter()
+                workers.scan_directories(
+                    config.get("PT_MONITOR_DIRS"), message_queue, "", baseline, hash_pool,
+                    throttle=Throttle(), shard_pool=shard_pool,
+                )
+                baseline.flush()
+                runs.append(time.perf_counter() - started)
+
+    finally:
+        if shard_pool:
+            shard_pool.shutdown()
+
+    result = summarize(runs)
+    result["files_per_sec"] = files / result["median"]
+    result["events"] = message_queue.qsize()
+
+    return result
+
+
+def read_log_records(log_dir) -> int:
+    count = 0
+
+    for name in os.listdir(log_dir):
+        with open(os.path.join(log_dir, name), "rb") as file:
+            count += file.read().count(b"\n")
+
+    return count
+
+
+def time_detect_to_log(config, baseline_file, args) -> dict:
+    """ Runs the whole monitor, mutates the tree and times until each event is logged
+
+    Observers print from their own threads, so stdout is
+    silenced for the whole run.
+    """
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        return _time_detect_to_log(config, baseline_file, args)
+
+
+def _time_detect_to_log(config, baseline_file, args) -> dict:
+    from lib import daemon, log_listener, workers, file_handlers as fh
+
+    if args.watch:
+        config.enable_option("watch")
+
+    log_dir = config.get("PT_LOG_LOCATION")
+    message_queue = queue.Queue()
+
+    log_listener.setup_log_event_handlers()
+    monitoring_thread = fh.start_monitoring(baseline_file, "", message_queue)
+
+    try:
+        # Mutate once the monitor has caught up with the tree
+        workers.pass_completed.wait(args.timeout)
+        workers.pass_completed.clear()
+
+        started = time.perf_counter()
+        mutations = mutate_tree(
+            config.get("PT_MONITOR_DIRS"), args.adds, args.edits, args.deletes, args.renames, args.mean_size, args.seed + 1
+        )
+        mutated = time.perf_counter() - started
+
+        expected = len(mutations)
+        deadline = started + args.timeout
+        arrivals = []
+
+        # Poll the log for the records as they land
+        while len(arrivals) < expected and time.perf_counter() < deadline:
+            logged = read_log_records(log_dir)
+            now = time.perf_counter() - started
+            arrivals.extend([now] * (logged - len(arrivals)))
+            time.sleep(0.005)
+
+    finally:
+        daemon.shutdown(monitoring_thread, message_queue)
+
+    result = {
+        "events": expected,
+        "logged": len(arrivals),
+        "mutation_seconds": mutated,
+        "mode": "watch" if args.watch else "poll",
+    }
+
+    if arrivals:
+        result.update(
+            first=arrivals[0],
+            median=statistics.median(arrivals),
+            p95=arrivals[min(len(arrivals) - 1, int(len(arrivals) * 0.95))],
+            last=arrivals[-1],
+        )
+
+    return result
+
+
+def compare_results(previous, current, tolerance) -> list:
+    """ Prints each timing against earlier results, returns the regressions """
+
+    regressions = []
+
+    for name, statistic in COMPARED_TIMINGS.items():
+        old = previous.get("results", {}).get(name, {}).get(statistic)
+        new = current["results"].get(name, {}).get(statistic)
+
+        if not old or new is None:
+            continue
+
+        ratio = new / old
+        flag = ""
+
+        if ratio > 1 + tolerance:
+            flag = "  REGRESSION"
+            regressions.append(name)
+
+        print(f"{name:<16} {statistic:<6} {old:10.4f}s -> {new:10.4f}s  x{ratio:.2f}{flag}")
+
+    return regressions
+
+
+def main() -> int:
+    args = parse_arguments()
+
+    work_dir = os.path.join(args.root, f"file_patrole_bench_{os.getpid()}")
+    tree_dir = os.path.join(work_dir, "tree")
+
+    try:
+        started = time.perf_counter()
+        total_bytes = generate_tree(tree_dir, args.files, args.mean_size, args.distribution, args.depth, args.fanout, args.seed)
+        print(f"Generated {args.files} files ({total_bytes:,} bytes) in {time.perf_counter() - started:.2f}s under {tree_dir}")
+
+        config = configure(work_dir, args)
+
+        results = {}
+
+        results["create_baseline"], baseline_file = time_create_baseline(config, args.repeat, args.files)
+        print(f"create_baseline  {results['create_baseline']['median']:.4f}s")
+
+        results["load_baseline"] = time_load_baseline(baseline_file, args.repeat, args.files)
+        print(f"load_baseline    {results['load_baseline']['median']:.4f}s")
+
+        results["scan_pass"] = time_scan_pass(config, baseline_file, args.repeat, args.files)
+        print(f"scan_pass        {results['scan_pass']['median']:.4f}s")
+
+        results["detect_to_log"] = time_detect_to_log(config, baseline_file, args)
+        latency = results["detect_to_log"]
+        print(f"detect_to_log    {latency.get('last', float('nan')):.4f}s ({latency['logged']}/{latency['events']} events logged)")
+
+        report = {
+            "timestamp": datetime.now().isoformat(),
+            "host": platform.node(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "root": args.root,
+            "parameters": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "keep")},
+            "settings": {key: config.get(key) for key in RECORDED_SETTINGS},
+            "tree": {"files": args.files, "bytes": total_bytes, "final_files": len(list_tree(tree_dir))},
+            "results": results,
+        }
+
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+        print(f"Saved results to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            previous = json.load(file)
+
+        if previous.get("parameters") != report["parameters"]:
+            print("Warning: the runs were made with different parameters.")
+
+        if compare_results(previous, report, args.tolerance):
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
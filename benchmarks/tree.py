@@ -0,0 +1,112 @@
+import os
+import random
+from typing import NamedTuple
+
+# Size distributions of generated files, each a function of the generator
+SIZE_DISTRIBUTIONS = {
+    # Mostly small files with a long tail, like a source tree or /etc
+    "lognormal": lambda rng, mean: int(rng.lognormvariate(0, 1.5) * mean / 3.08),
+    "uniform": lambda rng, mean: rng.randint(0, 2 * mean),
+    "fixed": lambda rng, mean: mean,
+}
+
+
+class Mutations(NamedTuple):
+    """ Paths changed by mutate_tree, renamed maps old to new paths """
+
+    added: list
+    edited: list
+    deleted: list
+    renamed: dict
+
+    def __len__(self):
+        return len(self.added) + len(self.edited) + len(self.deleted) + len(self.renamed)
+
+
+def tree_directories(root, depth, fanout) -> list:
+    """ Returns the directories of a tree `depth` levels deep with `fanout` children each """
+
+    directories = [root]
+    level = [root]
+
+    for _ in range(depth):
+        level = [os.path.join(parent, f"d{i}") for parent in level for i in range(fanout)]
+        directories.extend(level)
+
+    return directories
+
+
+def write_file(file_path, size, rng):
+    # Random bytes so no two files share a hash
+    with open(file_path, "wb") as file:
+        file.write(rng.randbytes(size))
+
+
+def generate_tree(root, files, mean_size=4096, distribution="lognormal", depth=3, fanout=4, seed=0) -> int:
+    """ Writes `files` files spread evenly over a synthetic directory tree
+
+    Returns the total number of bytes written.
+    """
+
+    rng = random.Random(seed)
+    sizes = SIZE_DISTRIBUTIONS[distribution]
+    directories = tree_directories(root, depth, fanout)
+
+    for directory in directories:
+        os.makedirs(directory, exist_ok=True)
+
+    total = 0
+
+    for i in range(files):
+        size = max(0, sizes(rng, mean_size))
+        write_file(os.path.join(directories[i % len(directories)], f"f{i}.dat"), size, rng)
+        total += size
+
+    return total
+
+
+def list_tree(root) -> list:
+    return sorted(
+        os.path.join(directory, name)
+        for directory, _, names in os.walk(root)
+        for name in names
+    )
+
+
+def mutate_tree(root, adds=0, edits=0, deletes=0, renames=0, mean_size=4096, seed=1) -> Mutations:
+    """ Adds, edits, deletes and renames random files of a tree
+
+    No file is touched twice, so each change maps to one event.
+    """
+
+    rng = random.Random(seed)
+
+    existing = list_tree(root)
+    targets = rng.sample(existing, min(len(existing), edits + deletes + renames))
+
+    edited = targets[:edits]
+    deleted = targets[edits:edits + deletes]
+    renamed = {}
+
+    for file_path in edited:
+        # Appends so the size changes along with the content
+        with open(file_path, "ab") as file:
+            file.write(rng.randbytes(max(1, mean_size // 4)))
+
+    for file_path in deleted:
+        os.remove(file_path)
+
+    for file_path in targets[edits + deletes:]:
+        new_path = f"{file_path}.renamed"
+        os.rename(file_path, new_path)
+        renamed[file_path] = new_path
+
+    directories = sorted({os.path.dirname(p) for p in existing}) or [root]
+    added = []
+
+    for i in range(adds):
+        file_path = os.path.join(rng.choice(directories), f"new{seed}_{i}.dat")
+        write_file(file_path, mean_size, rng)
+        added.append(file_path)
+
+    return Mutations(added, edited, deleted, renamed)
@@ -0,0 +1,248 @@
+""" Checks the Twilio notifier against a local HTTP stand-in of the REST API
+
+Run from the repository root:
+
+    python -m benchmarks.twilio_standin
+
+The stand-in answers on 127.0.0.1 and `TWILIO_API_BASE_URL`
+points the client at it, so no credentials are needed and
+nothing reaches Twilio. Each check prints its outcome and the
+exit status is 1 if any failed.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Messages per second of the stand-in runs
+RATE = 10
+
+# Retries of a failed send, as in the default configuration
+RETRIES = 3
+
+
+class StandIn(ThreadingHTTPServer):
+    """ Records the messages posted to it and answers with queued statuses
+
+    `statuses` are answered in order, then every message is
+    created with 201.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+
+        self.requests = []
+        self.statuses = []
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def reset(self, statuses=()):
+        with self._lock:
+            self.requests = []
+            self.statuses = list(statuses)
+
+    def record(self, path, form) -> int:
+        with self._lock:
+            self.requests.append((time.monotonic(), path, form))
+
+            return self.statuses.pop(0) if self.statuses else 201
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        form = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode("utf-8")).items()}
+
+        status = self.server.record(self.path, form)
+
+        if status == 201:
+            payload = {"sid": f"SM{len(self.server.requests):032d}", "status": "queued", "body": form.get("Body")}
+        else:
+            payload = {"code": 20000 + status, "message": f"Stand-in error {status}", "status": status}
+
+        body = json.dumps(payload).encode("utf-8")
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def configure(server):
+    """ Points the notifier at the stand-in, before it is first imported """
+
+    os.environ.update({
+        "TWILIO_API_BASE_URL": server.url,
+        "TWILIO_ACCOUNT_SID": "AC" + "0" * 32,
+        "TWILIO_AUTH_TOKEN": "stand-in",
+        "TWILIO_WHATSAPP_NUMBER": "+15550000001",
+        "TWILIO_VIRTUAL_PHONE": "+15550000002",
+        "ADMIN_PHONE": "+15550000003",
+        "TWILIO_MAX_RATE": str(RATE),
+        "TWILIO_MAX_RETRIES": str(RETRIES),
+    })
+
+    # Never send the local requests through a proxy
+    os.environ["NO_PROXY"] = ",".join(filter(None, [os.environ.get("NO_PROXY"), "127.0.0.1"]))
+
+    from lib.vendor import twilio as tw
+
+    # Retries in milliseconds rather than seconds
+    tw.BACKOFF_BASE = 0.01
+    tw.BACKOFF_CAP = 0.05
+
+    return tw
+
+
+def check_base_url(server, tw):
+    client = tw.get_client()
+    asyncio.run(tw.send_sms("base url"))
+
+    assert client.api.base_url == server.url, f"client uses {client.api.base_url}"
+    assert len(server.requests) == 1, f"{len(server.requests)} requests reached the stand-in"
+
+    path = server.requests[0][1]
+    assert path == f"/2010-04-01/Accounts/{client.account_sid}/Messages.json", f"posted to {path}"
+
+
+def check_rate_limit(server, tw):
+    count = 5
+
+    async def send_all():
+        await asyncio.gather(*(tw.send_sms(f"paced {i}") for i in range(count)))
+
+    asyncio.run(send_all())
+
+    times = sorted(received for received, _, _ in server.requests)
+    gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+
+    assert len(times) == count, f"{len(times)} of {count} messages sent"
+
+    # Requests travel on separate threads, so arrivals jitter around the slots
+    assert times[-1] - times[0] >= (count - 1) / RATE * 0.9, f"sent within {times[-1] - times[0]:.3f}s"
+    assert min(gaps) >= 1 / RATE * 0.5, f"gaps of {min(gaps):.3f}s"
+
+
+def check_retries(server, tw):
+    server.reset([429, 503])
+    message = asyncio.run(tw.send_sms("retried"))
+
+    assert len(server.requests) == 3, f"{len(server.requests)} attempts"
+    assert message.sid, "no message created"
+
+
+def check_retries_exhausted(server, tw):
+    server.reset([500] * (RETRIES + 1))
+
+    try:
+        asyncio.run(tw.send_sms("failing"))
+    except tw.TwilioRestException as e:
+        assert e.status == 500, f"failed with {e.status}"
+    else:
+        raise AssertionError("the send succeeded")
+
+    assert len(server.requests) == RETRIES + 1, f"{len(server.requests)} attempts"
+
+
+def check_fails_fast(server, tw):
+    server.reset([400])
+
+    try:
+        asyncio.run(tw.send_sms("rejected"))
+    except tw.TwilioRestException as e:
+        assert e.status == 400, f"failed with {e.status}"
+    else:
+        raise AssertionError("the send succeeded")
+
+    assert len(server.requests) == 1, f"{len(server.requests)} attempts"
+
+
+def check_truncation(server, tw):
+    asyncio.run(tw.send_sms("x" * (tw.MAX_BODY_LENGTH * 2)))
+
+    body = server.requests[0][2]["Body"]
+
+    assert len(body) == tw.MAX_BODY_LENGTH, f"body of {len(body)} characters"
+    assert body.endswith("..."), "body not marked as truncated"
+
+
+def check_digest(server, tw):
+    from lib.digest import Digest
+
+    window = 0.3
+    digest = Digest(tw.send_whatsapp, window, lambda count: f"{count} event(s)")
+
+    async def notify():
+        for i in range(3):
+            digest.add([("FILE_MODIFIED", {"file_path": f"/etc/file_{i}"})])
+            await asyncio.sleep(window / 10)
+
+        await asyncio.sleep(window * 2)
+
+    asyncio.run(notify())
+
+    assert len(server.requests) == 1, f"{len(server.requests)} messages for one window"
+
+    form = server.requests[0][2]
+    assert form["Body"] == "3 event(s)\n3 files modified under /etc", f"sent {form['Body']!r}"
+    assert form["To"].startswith("whatsapp:"), f"sent to {form['To']}"
+
+
+CHECKS = [
+    check_base_url,
+    check_rate_limit,
+    check_retries,
+    check_retries_exhausted,
+    check_fails_fast,
+    check_truncation,
+    check_digest,
+]
+
+
+def main() -> int:
+    server = StandIn()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    failures = 0
+
+    try:
+        tw = configure(server)
+
+        for check in CHECKS:
+            server.reset()
+
+            # A fresh slot for each check, so earlier sends don't delay it
+            tw.rate_limiter = tw.RateLimiter(RATE)
+
+            try:
+                check(server, tw)
+                print(f"ok    {check.__name__}")
+
+            except Exception as e:
+                failures += 1
+                print(f"FAIL  {check.__name__}: {e!r}")
+
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
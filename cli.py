@@ -1,8 +1,10 @@
 import os
 import sys
-import enquiries
 import argparse
-from lib import utils, file_handlers as fh 
+from lib import collector, hashing, utils, scheduler, file_handlers as fh
+from lib.daemon import EXIT_FAILURE, EXIT_USAGE
+from lib.ignore import read_ignore_file
+from lib.logger import parse_fsync_policy
 from config import Config
 import logging
 
@@ -19,6 +21,8 @@ def quit():
 def show_menu(curFile, message_queue):
     """ Displays the main menu """
 
+    import enquiries  # Only the interactive mode needs it
+
     # Initialize choice
     choice = None
     
@@ -69,21 +73,141 @@ def parse_arguments():
 
     parser.add_argument("-p", "--path", type=str, help=f"File path, in {valid_file_types} format, containing a list of directories to monitor.")
 
+    parser.add_argument("--daemon", action="store_true", default=False, help="Monitor without any prompt until SIGTERM, e.g. as a systemd service.")
+
+    parser.add_argument("--baseline", type=str, metavar="PATH", help="Baseline monitored in daemon mode, defaults to the only one in the baseline directory.")
+
+    parser.add_argument("--agent", type=str, metavar="ADDRESS", help="Stream events to a collector at HOST:PORT or unix:PATH, spooling them to disk while it is unreachable.")
+
+    parser.add_argument("--collector", type=str, metavar="ADDRESS", help="Collect and store the events of agents on HOST:PORT or unix:PATH until SIGTERM.")
+
     parser.add_argument("-n", "--notify", action="store_true", default=False, help="Enable notifications for file changes.")
 
+    parser.add_argument("--digest", type=float, metavar="SECONDS", help="Send one notification summarizing the events of each window of this length.")
+
+    parser.add_argument("--ignore", action="append", metavar="PATTERN", help="Gitignore-style pattern of files and directories to skip. Can be repeated.")
+
+    parser.add_argument("--ignore-file", type=str, metavar="FILE", help="File of gitignore-style patterns to skip, one per line.")
+
+    parser.add_argument("--log-format", choices=["text", "jsonl"], help="Format of the event log, defaults to text.")
+
+    parser.add_argument("--log-rotate", choices=["daily", "size"], help="Start a new log file each day (default), or only when it reaches --log-max-size.")
+
+    parser.add_argument("--log-max-size", type=utils.parse_size, metavar="SIZE", help="Roll the log over to a new file once it reaches this size.")
+
+    parser.add_argument("--log-fsync", type=parse_fsync_policy, metavar="POLICY", help="fsync the log 'never' (default), after every 'flush', or every N seconds.")
+
+    parser.add_argument("--metrics-textfile", type=str, metavar="PATH", help="Write Prometheus metrics to this file, e.g. for node_exporter's textfile collector.")
+
+    parser.add_argument("--metrics-port", type=int, metavar="PORT", help="Serve Prometheus metrics on this localhost port.")
+
+    parser.add_argument("--baseline-format", choices=["text", "sqlite"], help="Format of new baselines, defaults to text.")
+
+    parser.add_argument("--import-baseline", type=str, metavar="TXT", help="Convert a text baseline into an SQLite baseline and exit.")
+
+    parser.add_argument("--export-baseline", type=str, metavar="DB", help="Convert an SQLite baseline into a text baseline and exit.")
+
+    parser.add_argument("--compare", type=str, nargs="+", metavar=("BASELINE", "OTHER"), help="Compare a baseline with another one, or with a live scan when only one is given, and exit.")
+
+    parser.add_argument("--diff", type=str, nargs=2, metavar=("OLD", "NEW"), help="Stream the added, removed and changed files between two baselines and exit.")
+
+    parser.add_argument("--resume", action="store_true", default=False, help="Finish creating the latest interrupted baseline and exit.")
+
+    parser.add_argument("--checkpoint-interval", type=float, metavar="SECONDS", help="Checkpoint baselines being created on this schedule so they can be resumed, defaults to 60.")
+
+    parser.add_argument("--compact", type=str, metavar="BASELINE", help="Rewrite a baseline with only the latest entry per path and exit.")
+
+    parser.add_argument("-w", "--watch", action="store_true", default=False, help="Watch for changes with inotify instead of continuously rescanning (Linux only).")
+
+    parser.add_argument("--hash-algorithm", choices=hashing.supported_algorithms(), help="Hash algorithm of new baselines, defaults to sha256. blake3 and xxh* need their optional packages.")
+
+    parser.add_argument("--hash-buffer-size", type=utils.parse_size, metavar="SIZE", help="Read buffer size used while hashing, defaults to 1M.")
+
+    parser.add_argument("--mmap-threshold", type=utils.parse_size, metavar="SIZE", help="Memory-map files of at least this size while hashing. Only for files that are never truncated in place.")
+
+    parser.add_argument("--hash-workers", type=int, metavar="N", help="Number of workers hashing files in parallel.")
+
+    parser.add_argument("--hash-executor", choices=["thread", "process"], help="Hash on a thread pool (default) or on a process pool for CPU-bound algorithms.")
+
+    parser.add_argument("--scan-workers", type=int, metavar="N", help="Number of processes walking the monitored directories in parallel, split by root and large subtree.")
+
+    parser.add_argument("--debounce", type=float, metavar="SECONDS", help="Window in which events of the same file are coalesced before being handled, defaults to 0.25.")
+
+    parser.add_argument("--scan-interval", type=float, metavar="SECONDS", help="Minimum time between the start of consecutive scan passes.")
+
+    parser.add_argument("--max-bytes-per-sec", type=utils.parse_size, metavar="SIZE", help="Hashing bandwidth budget, e.g. 50M.")
+
+    parser.add_argument("--max-files-per-sec", type=float, metavar="N", help="Number of files hashed per second budget.")
+
+    parser.add_argument("--nice", type=int, metavar="N", help="Increment the CPU nice value of the process.")
+
+    parser.add_argument("--ionice", choices=list(scheduler.IONICE_CLASSES), help="I/O scheduling class of the process (Linux only).")
+
+    parser.add_argument("--fingerprint-threshold", type=utils.parse_size, metavar="SIZE", help="Fingerprint files of at least this size from sampled blocks and only hash them fully when the fingerprint changes.")
+
+    parser.add_argument("--fingerprint-blocks", type=int, metavar="N", help="Blocks sampled between the head and tail of fingerprinted files, defaults to 8.")
+
+    parser.add_argument("--audit-interval", type=float, metavar="SECONDS", help="Fully hash fingerprinted files on this schedule, defaults to a day. 0 disables audits.")
+
+    parser.add_argument("--paranoid-interval", type=float, metavar="SECONDS", help="Rehash every file on this schedule even if its metadata is unchanged.")
+
 
    # TODO: 
    # parser.add_argument(
    #     "-l", "--log", type=str, help="List of directories to save log files."
    # )
 
-    return parser.parse_args()
+    args = parser.parse_args()
+
+    if args.baseline and not args.daemon:
+        parser.error("--baseline is only used with --daemon")
+
+    if args.compare:
+        # Directories after the baselines are the monitored
+        # ones, which the option swallows otherwise
+        while len(args.compare) > 1 and os.path.isdir(args.compare[-1]):
+            try:
+                args.monitor_dirs.insert(0, fh.is_valid_directory(args.compare.pop()))
+            except argparse.ArgumentTypeError as e:
+                parser.error(str(e))
+
+        if len(args.compare) > 2:
+            parser.error("--compare takes one or two baselines")
+
+        for baseline_file in args.compare:
+            if not os.path.isfile(baseline_file):
+                parser.error(f"--compare: {baseline_file} is not a baseline file")
+
+    return args
 
 
 def handle_command(args):
     """ Handles command-line arguments """
 
     try:
+        # Convert baselines between formats and exit
+        if args.import_baseline:
+            fh.import_baseline(args.import_baseline)
+            sys.exit(0)
+
+        if args.export_baseline:
+            fh.export_baseline(args.export_baseline)
+            sys.exit(0)
+
+        # Diff or compact baselines and exit
+        if args.diff:
+            fh.diff_baselines(*args.diff)
+            sys.exit(0)
+
+        if args.compact:
+            fh.compact_baseline(args.compact)
+            sys.exit(0)
+
+        # Compare two baselines and exit
+        if args.compare and len(args.compare) == 2:
+            fh.compare_baselines(*args.compare)
+            sys.exit(0)
+
         # Set verbose
         if (args.verbose):
             config.enable_option("verbose_mode")
@@ -94,9 +218,123 @@ def handle_command(args):
             config.enable_option("notify")
             print("\r\nNOTIFICATIONS ENABLED.\r\n")
 
+        if args.digest is not None:
+            config.set("PT_NOTIFY_DIGEST_WINDOW", str(args.digest))
+
+        # Add to the ignored patterns
+        ignore_patterns = list(args.ignore or [])
+
+        if args.ignore_file:
+            ignore_patterns.extend(read_ignore_file(args.ignore_file))
+
+        if ignore_patterns:
+            config.set("PT_IGNORED_DIRS", ",".join([config.get("PT_IGNORED_DIRS"), *ignore_patterns]))
+
+        # Set the event log
+        if args.log_format:
+            config.set("PT_LOG_FORMAT", args.log_format)
+
+        if args.log_rotate:
+            config.set("PT_LOG_ROTATE", args.log_rotate)
+
+        if args.log_max_size is not None:
+            config.set("PT_LOG_MAX_BYTES", str(args.log_max_size))
+
+        if args.log_fsync:
+            config.set("PT_LOG_FSYNC", args.log_fsync)
+
+        # Set the metrics exporters
+        if args.metrics_textfile:
+            config.set("PT_METRICS_TEXTFILE", args.metrics_textfile)
+
+        if args.metrics_port is not None:
+            config.set("PT_METRICS_PORT", str(args.metrics_port))
+
+        # Set the format of new baselines
+        if args.baseline_format:
+            config.set("PT_BASELINE_FORMAT", args.baseline_format)
+
+        # Set event-driven watching
+        if (args.watch):
+            config.enable_option("watch")
+
+        # Set the hashing algorithm and read path
+        if args.hash_algorithm:
+            hashing.new_hash(args.hash_algorithm)
+            config.set("PT_HASH_ALGORITHM", args.hash_algorithm)
+
+        if args.hash_buffer_size is not None:
+            config.set("PT_HASH_BUFFER_SIZE", str(args.hash_buffer_size))
+
+        if args.mmap_threshold is not None:
+            config.set("PT_HASH_MMAP_THRESHOLD", str(args.mmap_threshold))
+
+        # Set the hashing pool
+        if args.hash_workers is not None:
+            config.set("PT_HASH_WORKERS", str(args.hash_workers))
+
+        if args.hash_executor:
+            config.set("PT_HASH_EXECUTOR", args.hash_executor)
+
+        if args.scan_workers is not None:
+            config.set("PT_SCAN_WORKERS", str(args.scan_workers))
+
+        # Set the event coalescing window
+        if args.debounce is not None:
+            config.set("PT_EVENT_DEBOUNCE", str(args.debounce))
+
+        # Set the scan pacing
+        if args.scan_interval is not None:
+            config.set("PT_SCAN_INTERVAL", str(args.scan_interval))
+
+        if args.max_bytes_per_sec is not None:
+            config.set("PT_HASH_BYTES_PER_SEC", str(args.max_bytes_per_sec))
+
+        if args.max_files_per_sec is not None:
+            config.set("PT_HASH_FILES_PER_SEC", str(args.max_files_per_sec))
+
+        if args.nice is not None:
+            config.set("PT_NICE", str(args.nice))
+
+        if args.ionice:
+            config.set("PT_IONICE_CLASS", args.ionice)
+
+        # Set the fingerprint tier of large files
+        if args.fingerprint_threshold is not None:
+            config.set("PT_FINGERPRINT_THRESHOLD", str(args.fingerprint_threshold))
+
+        if args.fingerprint_blocks is not None:
+            config.set("PT_FINGERPRINT_BLOCKS", str(args.fingerprint_blocks))
+
+        if args.audit_interval is not None:
+            config.set("PT_FINGERPRINT_AUDIT_INTERVAL", str(args.audit_interval))
+
+        # Set the full rehash schedule
+        if args.paranoid_interval is not None:
+            config.set("PT_PARANOID_INTERVAL", str(args.paranoid_interval))
+
+        # Stream events to a collector
+        if args.agent:
+            config.set("PT_AGENT_COLLECTOR", args.agent)
+
+        # Collect the events of agents until stopped
+        if args.collector:
+            sys.exit(collector.run_collector(args.collector))
+
+        # Set the checkpoints of new baselines
+        if args.checkpoint_interval is not None:
+            config.set("PT_CHECKPOINT_INTERVAL", str(args.checkpoint_interval))
+
+        # Finish an interrupted baseline and exit,
+        # its directories come from the checkpoint
+        if args.resume:
+            fh.resume_baseline()
+            sys.exit(0)
+
         # Obtain the directories to be monitored
         # from either a positional argument, file, or stdin
-        # in that same order of priority
+        # in that same order of priority, daemons
+        # read the environment instead of stdin
         if args.monitor_dirs:
             monitor_dirs = args.monitor_dirs
             monitor_dirs = ",".join(monitor_dirs)
@@ -117,14 +355,27 @@ def handle_command(args):
             else:
                 logging.error(f"No such file, {args.file}, exists. Enter a valid file path.")
 
+        elif args.daemon:
+            # Under a service manager stdin is /dev/null or closed
+            if not os.environ.get("PT_MONITOR_DIRS", "").strip():
+                print("No directories to monitor, pass them as arguments or set PT_MONITOR_DIRS.")
+                sys.exit(EXIT_USAGE)
+
         elif not sys.stdin.isatty():
             monitor_dirs = sys.stdin.read().strip()
             config.set("PT_MONITOR_DIRS", monitor_dirs)
             print("Directories to monitor: ", monitor_dirs)
 
         else:
-            raise ValueError("No directories to monitor")
+            # The menu monitors the default directories
+            logging.warning(f"No directories to monitor given, using {config.get('PT_MONITOR_DIRS')}")
+
+        # Compare a baseline with a live scan and exit
+        if args.compare:
+            fh.compare_baselines(args.compare[0])
+            sys.exit(0)
 
     except Exception as e:
         logging.critical(e)
+        sys.exit(EXIT_FAILURE)
 
@@ -12,6 +12,7 @@ class Config:
         "dev_mode": False,
         "verbose_mode": False,
         "notify": False,
+        "watch": False,
     }
 
     def __new__(cls):
@@ -29,10 +30,88 @@ class Config:
             "PT_MONITOR_DIRS": os.environ.get(
                 "PT_MONITOR_DIRS", "./"
             ),
+            # Directory of the event logs and their format, "text" or "jsonl"
+            "PT_LOG_LOCATION": os.environ.get("PT_LOG_LOCATION", "./"),
+            "PT_LOG_FORMAT": os.environ.get("PT_LOG_FORMAT", "text"),
+            # Bytes buffered and seconds a record may wait before a write
+            "PT_LOG_FLUSH_BYTES": os.environ.get("PT_LOG_FLUSH_BYTES", str(1 << 20)),
+            "PT_LOG_FLUSH_INTERVAL": os.environ.get("PT_LOG_FLUSH_INTERVAL", "1"),
+            # "never", "flush" or seconds between fsyncs of the log
+            "PT_LOG_FSYNC": os.environ.get("PT_LOG_FSYNC", "never"),
+            # "daily" or "size" log files and the size they roll over at, 0 never
+            "PT_LOG_ROTATE": os.environ.get("PT_LOG_ROTATE", "daily"),
+            "PT_LOG_MAX_BYTES": os.environ.get("PT_LOG_MAX_BYTES", "0"),
+            # Seconds from launch to the first scan a daemon should stay within
+            "PT_STARTUP_TARGET": os.environ.get("PT_STARTUP_TARGET", "1"),
+            # Prometheus textfile rewritten every PT_METRICS_INTERVAL seconds, empty disables it
+            "PT_METRICS_TEXTFILE": os.environ.get("PT_METRICS_TEXTFILE", ""),
+            "PT_METRICS_INTERVAL": os.environ.get("PT_METRICS_INTERVAL", "15"),
+            # Port and address metrics are served on, 0 disables the endpoint
+            "PT_METRICS_PORT": os.environ.get("PT_METRICS_PORT", "0"),
+            "PT_METRICS_HOST": os.environ.get("PT_METRICS_HOST", "127.0.0.1"),
+            # Seconds between checkpoints of a baseline being created, 0 disables them
+            "PT_CHECKPOINT_INTERVAL": os.environ.get("PT_CHECKPOINT_INTERVAL", "60"),
+            # Seconds between progress reports while creating a baseline, 0 disables them
+            "PT_PROGRESS_INTERVAL": os.environ.get("PT_PROGRESS_INTERVAL", "10"),
+            # 1 counts the files left with a second walk for an exact ETA, 0 estimates it from the walk
+            "PT_PROGRESS_COUNT": os.environ.get("PT_PROGRESS_COUNT", "0"),
+            # Collector agents stream events to, e.g. "host:7468" or "unix:/run/file_patrole.sock", empty disables it
+            "PT_AGENT_COLLECTOR": os.environ.get("PT_AGENT_COLLECTOR", ""),
+            # Events spooled while the collector is unreachable, defaults to agent.spool in PT_LOG_LOCATION
+            "PT_AGENT_SPOOL_PATH": os.environ.get("PT_AGENT_SPOOL_PATH", ""),
+            "PT_AGENT_SPOOL_MAX_BYTES": os.environ.get("PT_AGENT_SPOOL_MAX_BYTES", str(100 << 20)),
+            # Seconds between attempts to reach the collector
+            "PT_AGENT_RETRY_INTERVAL": os.environ.get("PT_AGENT_RETRY_INTERVAL", "5"),
+            # Format of new baselines, "text" or "sqlite"
+            "PT_BASELINE_FORMAT": os.environ.get("PT_BASELINE_FORMAT", "text"),
+            # Entries sorted in memory at once when diffing or compacting
+            "PT_SORT_CHUNK_RECORDS": os.environ.get("PT_SORT_CHUNK_RECORDS", "500000"),
+            # Seconds between full rehash passes, 0 disables them
+            "PT_PARANOID_INTERVAL": os.environ.get("PT_PARANOID_INTERVAL", "0"),
+            # Seconds between rescans of subtrees inotify can't watch
+            "PT_WATCH_RESCAN_INTERVAL": os.environ.get("PT_WATCH_RESCAN_INTERVAL", "60"),
+            # Seconds between the start of consecutive scan passes
+            "PT_SCAN_INTERVAL": os.environ.get("PT_SCAN_INTERVAL", "0"),
+            # Hashing budget, 0 is unlimited
+            "PT_HASH_BYTES_PER_SEC": os.environ.get("PT_HASH_BYTES_PER_SEC", "0"),
+            "PT_HASH_FILES_PER_SEC": os.environ.get("PT_HASH_FILES_PER_SEC", "0"),
+            # CPU and I/O priority of the process
+            "PT_NICE": os.environ.get("PT_NICE", "0"),
+            "PT_IONICE_CLASS": os.environ.get("PT_IONICE_CLASS", ""),
+            # Hash algorithm of new baselines
+            "PT_HASH_ALGORITHM": os.environ.get("PT_HASH_ALGORITHM", "sha256"),
+            # Read buffer size and size from which files are mmap'ed, 0 never maps
+            "PT_HASH_BUFFER_SIZE": os.environ.get("PT_HASH_BUFFER_SIZE", str(1 << 20)),
+            "PT_HASH_MMAP_THRESHOLD": os.environ.get("PT_HASH_MMAP_THRESHOLD", "0"),
+            # Size from which files are fingerprinted instead of fully hashed, 0 never
+            "PT_FINGERPRINT_THRESHOLD": os.environ.get("PT_FINGERPRINT_THRESHOLD", "0"),
+            # Blocks sampled between the head and tail and their size
+            "PT_FINGERPRINT_BLOCKS": os.environ.get("PT_FINGERPRINT_BLOCKS", "8"),
+            "PT_FINGERPRINT_BLOCK_SIZE": os.environ.get("PT_FINGERPRINT_BLOCK_SIZE", str(1 << 16)),
+            # Seconds between full hashes of fingerprinted files, 0 never
+            "PT_FINGERPRINT_AUDIT_INTERVAL": os.environ.get("PT_FINGERPRINT_AUDIT_INTERVAL", "86400"),
+            # Seconds events are collected for coalescing and the most per batch
+            "PT_EVENT_DEBOUNCE": os.environ.get("PT_EVENT_DEBOUNCE", "0.25"),
+            "PT_EVENT_BATCH_SIZE": os.environ.get("PT_EVENT_BATCH_SIZE", "1000"),
+            # Seconds of events summarized per notification, 0 sends each batch
+            "PT_NOTIFY_DIGEST_WINDOW": os.environ.get("PT_NOTIFY_DIGEST_WINDOW", "0"),
+            # Events remembered to suppress repeats and seconds they are remembered
+            "PT_DEDUP_MAX_ENTRIES": os.environ.get("PT_DEDUP_MAX_ENTRIES", "100000"),
+            "PT_DEDUP_TTL": os.environ.get("PT_DEDUP_TTL", "86400"),
+            # Observers run at once and seconds each may take, 0 waits forever
+            "PT_OBSERVER_CONCURRENCY": os.environ.get("PT_OBSERVER_CONCURRENCY", "8"),
+            "PT_OBSERVER_TIMEOUT": os.environ.get("PT_OBSERVER_TIMEOUT", "30"),
+            # Hashing pool size, defaults to the number of CPUs
+            "PT_HASH_WORKERS": os.environ.get("PT_HASH_WORKERS", str(os.cpu_count() or 1)),
+            # Either "thread" or "process"
+            "PT_HASH_EXECUTOR": os.environ.get("PT_HASH_EXECUTOR", "thread"),
+            # Processes walking the monitored roots, 1 walks in the monitoring thread
+            "PT_SCAN_WORKERS": os.environ.get("PT_SCAN_WORKERS", "1"),
         }
+        # Comma separated gitignore-style patterns
         self.config["PT_IGNORED_DIRS"] = os.environ.get(
             "PT_IGNORED_DIRS",
-            f"{os.path.dirname(self.config['PT_BASELINE_PATH'])}, .git",
+            f"{self.config['PT_BASELINE_PATH']}/, .git/",
         )
 
     def get(self, key: str) -> str:
@@ -1 +1 @@
-__all__ = ['event', 'log_listener', 'logger', 'utils']
+__all__ = ['baseline', 'event', 'log_listener', 'logger', 'utils']
@@ -0,0 +1,283 @@
+import os
+import time
+import uuid
+import queue
+import atexit
+import platform
+import threading
+from lib import metrics
+from lib.transport import connect, decode_frame, encode_frame, read_frame
+from lib.utils import get_timestamp
+from config import Config
+
+DEFAULT_SPOOL_MAX_BYTES = 100 << 20
+DEFAULT_RETRY_INTERVAL = 5.0
+
+# Seconds a connect, send or acknowledgement may take
+DEFAULT_TIMEOUT = 10.0
+
+# Queued to stop the sender
+_CLOSE = object()
+
+# Agent of the process, started on first use
+_agent = None
+_agent_lock = threading.Lock()
+
+
+def event_record(event_type, data, hostname, user) -> dict:
+    """ Returns the record of an event sent to the collector, shaped like a log record """
+
+    verb = event_type.lower().removeprefix("file_")
+
+    record = {
+        "timestamp": get_timestamp(),
+        "event": event_type.lower(),
+        "file_path": data["file_path"],
+        "hostname": hostname,
+        "user": user,
+        "control_hash": data.get("control_hash"),
+        "file_hash": data.get("file_hash"),
+        "description": f"The file {data['file_path']} has been {verb} on {hostname}",
+    }
+
+    if "old_path" in data:
+        record["old_path"] = data["old_path"]
+        record["description"] = f"The file {data['old_path']} has been {verb} to {data['file_path']} on {hostname}"
+
+    return record
+
+
+class Agent:
+    """ Streams batches of events to a collector from a background thread
+
+    Batches queued while a frame is sent go out together in the
+    next one. Each frame waits for the collector to acknowledge
+    it. While the collector is unreachable frames are appended
+    to a spool file, up to `max_spool_bytes`, and once it is back
+    the spool is sent in order before anything newer. Frames
+    carry an id so the collector drops any sent twice, e.g. when
+    an acknowledgement was lost.
+    """
+
+    def __init__(
+        self,
+        address,
+        spool_path,
+        hostname,
+        max_spool_bytes=DEFAULT_SPOOL_MAX_BYTES,
+        retry_interval=DEFAULT_RETRY_INTERVAL,
+        timeout=DEFAULT_TIMEOUT,
+    ):
+        self.address = address
+        self.spool_path = spool_path
+        self.hostname = hostname
+        self.max_spool_bytes = int(max_spool_bytes)
+        self.retry_interval = float(retry_interval)
+        self.timeout = float(timeout)
+
+        self.dropped = 0
+
+        # Frame ids are unique across restarts
+        self._session = uuid.uuid4().hex
+        self._sequence = 0
+
+        self._socket = None
+        self._reader = None
+        self._next_attempt = 0.0
+        self._unreachable = False
+
+        # Bytes of the spool already delivered
+        self._spool_offset = 0
+
+        self._queue = queue.Queue()
+
+        metrics.AGENT_SPOOL_BYTES.set_function(self.spool_size)
+
+        self._thread = threading.Thread(target=self._run, name="agent", daemon=True)
+        self._thread.start()
+
+    def send(self, records):
+        """ Queues a list of records for the collector """
+        self._queue.put(records)
+
+    def close(self, timeout=None):
+        """ Sends or spools what is queued, then stops the sender """
+
+        self._queue.put(_CLOSE)
+        self._thread.join(timeout)
+
+    def spool_size(self) -> int:
+        try:
+            return os.path.getsize(self.spool_path) - self._spool_offset
+        except FileNotFoundError:
+            return 0
+
+    def _run(self):
+        while True:
+            try:
+                batches = [self._queue.get(timeout=self.retry_interval)]
+            except queue.Empty:
+                batches = []
+
+            while True:
+                try:
+                    batches.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            closing = _CLOSE in batches
+            records = [record for batch in batches if batch is not _CLOSE for record in batch]
+
+            try:
+                if records:
+                    self._forward(self._frame(records), len(records))
+                elif self.spool_size():
+                    self._deliver_spool()
+
+            except OSError as e:
+                print(f"Failed spooling events to {self.spool_path}: {e}")
+
+            if closing:
+                self._disconnect()
+                return
+
+    def _frame(self, records) -> bytes:
+        self._sequence += 1
+
+        return encode_frame({
+            "id": f"{self.hostname}:{self._session}:{self._sequence}",
+            "host": self.hostname,
+            "events": records,
+        })
+
+    def _forward(self, frame, count):
+        # Older frames go first, so a frame only skips the spool when it's empty
+        if not self.spool_size() and self._send(frame):
+            metrics.FORWARDED_EVENTS.inc(count)
+            return
+
+        self._spool(frame)
+        self._deliver_spool()
+
+    def _spool(self, frame):
+        if self.spool_size() + len(frame) > self.max_spool_bytes:
+            self.dropped += 1
+            print(f"Agent spool {self.spool_path} is full, dropped a batch of events.")
+            return
+
+        directory = os.path.dirname(self.spool_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with open(self.spool_path, "ab") as file:
+            file.write(frame)
+
+    def _deliver_spool(self):
+        """ Sends the spooled frames in order, stopping at the first failure """
+
+        if not self.spool_size():
+            return
+
+        with open(self.spool_path, "rb") as file:
+            file.seek(self._spool_offset)
+
+            while True:
+                try:
+                    frame = read_frame(file)
+                except ValueError as e:
+                    print(f"Discarding the rest of the corrupt spool {self.spool_path}: {e}")
+                    break
+
+                if frame is None:
+                    break
+
+                if not self._send(frame):
+                    return
+
+                self._spool_offset = file.tell()
+                metrics.FORWARDED_EVENTS.inc(len(decode_frame(frame)["events"]))
+
+        os.remove(self.spool_path)
+        self._spool_offset = 0
+
+    def _send(self, frame) -> bool:
+        """ Sends a frame and waits for its acknowledgement, returns False if the collector is unreachable """
+
+        if self._socket is None:
+            if time.monotonic() < self._next_attempt:
+                return False
+
+            try:
+                self._socket = connect(self.address, self.timeout)
+                self._reader = self._socket.makefile("rb")
+            except OSError as e:
+                # Only the first of the failed retries is reported
+                if not self._unreachable:
+                    print(f"Collector {self.address} is unreachable, spooling events: {e}")
+                    self._unreachable = True
+
+                self._next_attempt = time.monotonic() + self.retry_interval
+                return False
+
+            if self._unreachable:
+                print(f"Reconnected to collector {self.address}.")
+                self._unreachable = False
+
+        try:
+            self._socket.sendall(frame)
+
+            reply = read_frame(self._reader)
+            if reply is None:
+                raise ConnectionError("connection closed before the acknowledgement")
+
+            if decode_frame(reply).get("ack") != decode_frame(frame)["id"]:
+                raise ConnectionError("unexpected acknowledgement")
+
+            return True
+
+        except (OSError, ValueError) as e:
+            print(f"Lost the collector {self.address}, spooling events: {e}")
+            self._disconnect()
+            self._unreachable = True
+            self._next_attempt = time.monotonic() + self.retry_interval
+            return False
+
+    def _disconnect(self):
+        if self._socket is not None:
+            self._reader.close()
+            self._socket.close()
+            self._socket = self._reader = None
+
+
+def get_agent() -> Agent:
+    """ Returns the shared agent, started from the config on first use """
+
+    global _agent
+
+    with _agent_lock:
+        if _agent is None:
+            config = Config()
+
+            _agent = Agent(
+                config.get("PT_AGENT_COLLECTOR"),
+                config.get("PT_AGENT_SPOOL_PATH") or os.path.join(config.get("PT_LOG_LOCATION"), "agent.spool"),
+                platform.node(),
+                max_spool_bytes=int(config.get("PT_AGENT_SPOOL_MAX_BYTES") or DEFAULT_SPOOL_MAX_BYTES),
+                retry_interval=float(config.get("PT_AGENT_RETRY_INTERVAL") or DEFAULT_RETRY_INTERVAL),
+            )
+
+            atexit.register(_agent.close)
+
+        return _agent
+
+
+def close_agent(timeout=None):
+    """ Sends or spools what the shared agent has queued, if it was started """
+
+    global _agent
+
+    with _agent_lock:
+        if _agent is not None:
+            atexit.unregister(_agent.close)
+            _agent.close(timeout)
+            _agent = None
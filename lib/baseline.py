@@ -0,0 +1,427 @@
+import os
+import fcntl
+from contextlib import contextmanager
+from typing import NamedTuple, Optional
+from lib.hashing import DEFAULT_ALGORITHM
+
+# Number of stat fields stored after the hash
+_STAT_FIELDS = 4
+
+# First line of text baselines
+HEADER_PREFIX = "# file_patrole baseline"
+FORMAT_VERSION = 2
+
+# Read buffer of the text baseline loader
+BUFFER_SIZE = 1 << 20
+
+# Hash of lines recording that a path was removed
+TOMBSTONE = "-"
+
+# Sidecar locked while a text baseline is appended to or rewritten
+LOCK_SUFFIX = ".lock"
+
+# Tiers a record's hash can be checked with
+TIER_FULL = "full"
+TIER_FINGERPRINT = "fingerprint"
+
+
+class BaselineRecord(NamedTuple):
+    """ A single entry of a baseline
+
+    The stat fields are None for records loaded from
+    legacy 'path | hash' lines, which forces a rehash.
+    Large files also record the fingerprint their
+    hash was last confirmed against.
+    """
+
+    file_hash: str
+    size: Optional[int] = None
+    mtime_ns: Optional[int] = None
+    ctime_ns: Optional[int] = None
+    inode: Optional[int] = None
+    fingerprint: Optional[str] = None
+
+    @classmethod
+    def from_stat(cls, file_hash: str, file_stat: os.stat_result, fingerprint=None):
+        """ Creates a record from a hash and the file's stat result """
+        return cls(file_hash, *stat_signature(file_stat), fingerprint)
+
+    @property
+    def signature(self) -> tuple:
+        return (self.size, self.mtime_ns, self.ctime_ns, self.inode)
+
+    @property
+    def tier(self) -> str:
+        """ Returns which tier vouches for the hash, "full" or "fingerprint" """
+        return TIER_FULL if self.fingerprint is None else TIER_FINGERPRINT
+
+    def matches_stat(self, file_stat: os.stat_result) -> bool:
+        """ Checks whether the file is unchanged since it was hashed """
+        return self.signature == stat_signature(file_stat)
+
+
+def stat_signature(file_stat: os.stat_result) -> tuple:
+    """ Returns the (size, mtime_ns, ctime_ns, inode) tuple of a stat result """
+    return (
+        file_stat.st_size,
+        file_stat.st_mtime_ns,
+        file_stat.st_ctime_ns,
+        file_stat.st_ino,
+    )
+
+
+def parse_baseline_line(line: str):
+    """ Parses a baseline line into a (path, record) pair
+
+    Lines are either 'path | hash | size | mtime_ns | ctime_ns | inode',
+    optionally followed by '| fingerprint', or the legacy 'path | hash'.
+    """
+
+    fields = [f.strip() for f in line.rsplit("|", _STAT_FIELDS + 2)]
+
+    if len(fields) == _STAT_FIELDS + 3 and all(f.isdigit() for f in fields[2:-1]):
+        file_path, file_hash, *signature, fingerprint = fields
+        return file_path, BaselineRecord(file_hash, *map(int, signature), fingerprint)
+
+    fields = [f.strip() for f in line.rsplit("|", _STAT_FIELDS + 1)]
+
+    if len(fields) == _STAT_FIELDS + 2 and all(f.isdigit() for f in fields[2:]):
+        file_path, file_hash, *signature = fields
+        return file_path, BaselineRecord(file_hash, *map(int, signature))
+
+    fields = line.rsplit("|", 1)
+
+    if len(fields) != 2:
+        raise ValueError(f"Malformed baseline line: '{line.strip()}'")
+
+    file_path, file_hash = [f.strip() for f in fields]
+
+    return file_path, BaselineRecord(file_hash)
+
+
+def format_baseline_line(file_path: str, record: BaselineRecord) -> str:
+    """ Formats a baseline record as a baseline line """
+
+    if record.size is None:
+        return f"{file_path} | {record.file_hash}\n"
+
+    signature = " | ".join(str(f) for f in record.signature)
+
+    if record.fingerprint is not None:
+        return f"{file_path} | {record.file_hash} | {signature} | {record.fingerprint}\n"
+
+    return f"{file_path} | {record.file_hash} | {signature}\n"
+
+
+def format_tombstone_line(file_path: str) -> str:
+    """ Formats the line recording that a path left the baseline """
+    return f"{file_path} | {TOMBSTONE}\n"
+
+
+def format_baseline_header(encoding="utf-8", algorithm=DEFAULT_ALGORITHM) -> str:
+    """ Formats the header line declaring how a text baseline is encoded and hashed """
+    return f"{HEADER_PREFIX} v{FORMAT_VERSION} encoding={encoding} algorithm={algorithm}\n"
+
+
+@contextmanager
+def lock_baseline(file_path):
+    """ Holds an exclusive lock on a text baseline
+
+    The lock is taken on a sidecar file, as compaction replaces
+    the baseline and a lock on it would stay with the old inode.
+    """
+
+    with open(file_path + LOCK_SUFFIX, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def read_baseline_header(file_path) -> dict:
+    """ Returns the fields declared in a text baseline's header
+
+    Legacy baselines have no header and return an empty dict.
+    """
+
+    with open(file_path, "rb") as file:
+        first_line = file.readline(1024).decode("ascii", errors="replace")
+
+    if not first_line.startswith(HEADER_PREFIX):
+        return {}
+
+    fields = dict(
+        field.split("=", 1) for field in first_line.split() if "=" in field
+    )
+    fields["version"] = first_line[len(HEADER_PREFIX):].split()[0].lstrip("v")
+
+    return fields
+
+
+def _open_baseline_text(file_path, encoding=None, buffer_size=BUFFER_SIZE):
+    """ Opens a text baseline positioned after its header
+
+    Returns the file and the header fields.
+    """
+
+    header = read_baseline_header(file_path)
+    encoding = encoding or header.get("encoding")
+
+    file = open(file_path, "r", encoding=encoding, buffering=buffer_size)
+
+    if header:
+        file.readline()
+
+    return file, header
+
+
+def read_baseline_lines(file_path, encoding=None):
+    """ Yields the (path, record) pairs of a text baseline
+
+    The declared encoding is used unless one is given. Relative
+    paths from older baselines are made absolute. Removed paths
+    are yielded with a TOMBSTONE hash.
+    """
+
+    file, _ = _open_baseline_text(file_path, encoding)
+
+    with file:
+        for file_line in file:
+            if not file_line.strip():
+                continue
+
+            path, record = parse_baseline_line(file_line)
+
+            if not os.path.isabs(path):
+                path = os.path.abspath(path)
+
+            yield path, record
+
+
+def load_text_baseline(file_path, encoding=None, buffer_size=BUFFER_SIZE):
+    """ Loads a text baseline into a Baseline
+
+    Streams the file through a fixed-size buffer and only splits
+    each line into its path and the rest. Records are parsed the
+    first time they are accessed.
+    """
+
+    file, header = _open_baseline_text(file_path, encoding, buffer_size)
+
+    baseline = Baseline(source=file_path, algorithm=header.get("algorithm", DEFAULT_ALGORITHM))
+    records = baseline._records
+    sep = os.sep
+
+    with file:
+        for file_line in file:
+            path, _, entry = file_line.partition(" | ")
+
+            # Slow path for paths containing the separator,
+            # relative paths and malformed lines
+            if (
+                entry.count(" | ") not in (0, _STAT_FIELDS, _STAT_FIELDS + 1)
+                or not entry
+                or path[:1] != sep
+            ):
+                if not file_line.strip():
+                    continue
+
+                path, entry = parse_baseline_line(file_line)
+
+                if not os.path.isabs(path):
+                    path = os.path.abspath(path)
+
+            # Later lines supersede earlier ones
+            if entry[:1] == TOMBSTONE and entry.strip() == TOMBSTONE:
+                records.pop(path, None)
+            else:
+                records[path] = entry
+
+    return baseline
+
+
+def _parse_record_tail(tail) -> BaselineRecord:
+    """ Parses the part of a baseline line following the path """
+
+    fields = tail.split(" | ")
+
+    if len(fields) == _STAT_FIELDS + 1:
+        return BaselineRecord(fields[0], *map(int, fields[1:]))
+
+    if len(fields) == _STAT_FIELDS + 2:
+        return BaselineRecord(fields[0], *map(int, fields[1:-1]), fields[-1].strip())
+
+    return BaselineRecord(fields[0].strip())
+
+
+class Baseline:
+    """ In-memory baseline index
+
+    Maps each file path to its record and keeps reverse
+    indexes of hashes and inodes to paths so lookups by any of
+    them are O(1). Records loaded from text stay unparsed until
+    first used and each reverse index is built on its first lookup.
+    """
+
+    def __init__(self, source=None, algorithm=DEFAULT_ALGORITHM):
+        # Baseline file the index was loaded from
+        self.source = source
+        # Algorithm every hash of the baseline was computed with
+        self.algorithm = algorithm
+
+        # Path to record, or to the unparsed rest of its line
+        self._records: dict = {}
+        # Hash to a path, or to a set of paths once shared
+        self._paths_by_hash = None
+        # Inode to a path, or to a set of paths
+        self._paths_by_inode = None
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, file_path):
+        return file_path in self._records
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def get(self, file_path, default=None):
+        """ Returns the record of the specified path """
+
+        record = self._records.get(file_path)
+        if record is None:
+            return default
+
+        if type(record) is not BaselineRecord:
+            record = self._records[file_path] = _parse_record_tail(record)
+
+        return record
+
+    def get_hash(self, file_path):
+        """ Returns the hash recorded for the specified path """
+        record = self.get(file_path)
+        return record.file_hash if record else None
+
+    def items(self):
+        for file_path in self._records:
+            yield file_path, self.get(file_path)
+
+    def set(self, file_path, record):
+        """ Adds or replaces the record of the specified path """
+
+        if isinstance(record, str):
+            record = BaselineRecord(record)
+
+        if self._paths_by_hash is not None or self._paths_by_inode is not None:
+            previous = self.get(file_path)
+            if previous is not None:
+                self._unindex_record(file_path, previous)
+
+            self._index_record(file_path, record)
+
+        self._records[file_path] = record
+
+        return record
+
+    def remove(self, file_path):
+        """ Removes the specified path and returns its record """
+
+        record = self.get(file_path)
+        if record is None:
+            return None
+
+        del self._records[file_path]
+
+        self._unindex_record(file_path, record)
+
+        return record
+
+    def paths_under(self, directory):
+        """ Returns every path below the specified directory """
+
+        prefix = os.path.join(directory, "")
+
+        return [p for p in self._records if p.startswith(prefix)]
+
+    def flush(self):
+        """ Nothing to persist, the text baseline is appended to by observers """
+
+    def has_hash(self, file_hash) -> bool:
+        """ Checks whether any path has the specified hash """
+        return file_hash in self._get_hash_index()
+
+    def paths_for_hash(self, file_hash) -> frozenset:
+        """ Returns every path that has the specified hash """
+
+        paths = self._get_hash_index().get(file_hash, ())
+
+        return frozenset((paths,) if type(paths) is str else paths)
+
+    def paths_for_inode(self, inode) -> frozenset:
+        """ Returns every path recorded with the specified inode """
+
+        paths = self._get_inode_index().get(inode, ())
+
+        return frozenset((paths,) if type(paths) is str else paths)
+
+    def _get_hash_index(self) -> dict:
+        if self._paths_by_hash is None:
+            self._paths_by_hash = {}
+
+            for file_path, record in self.items():
+                self._index(self._paths_by_hash, file_path, record.file_hash)
+
+        return self._paths_by_hash
+
+    def _get_inode_index(self) -> dict:
+        if self._paths_by_inode is None:
+            self._paths_by_inode = {}
+
+            for file_path, record in self.items():
+                if record.inode is not None:
+                    self._index(self._paths_by_inode, file_path, record.inode)
+
+        return self._paths_by_inode
+
+    def _index_record(self, file_path, record):
+        if self._paths_by_hash is not None:
+            self._index(self._paths_by_hash, file_path, record.file_hash)
+
+        if self._paths_by_inode is not None and record.inode is not None:
+            self._index(self._paths_by_inode, file_path, record.inode)
+
+    def _unindex_record(self, file_path, record):
+        if self._paths_by_hash is not None:
+            self._unindex(self._paths_by_hash, file_path, record.file_hash)
+
+        if self._paths_by_inode is not None and record.inode is not None:
+            self._unindex(self._paths_by_inode, file_path, record.inode)
+
+    @staticmethod
+    def _index(index, file_path, key):
+        paths = index.get(key)
+
+        # Most keys belong to a single path
+        if paths is None:
+            index[key] = file_path
+        elif type(paths) is str:
+            if paths != file_path:
+                index[key] = {paths, file_path}
+        else:
+            paths.add(file_path)
+
+    @staticmethod
+    def _unindex(index, file_path, key):
+        paths = index.get(key)
+        if paths is None:
+            return
+
+        if type(paths) is str:
+            if paths == file_path:
+                del index[key]
+            return
+
+        paths.discard(file_path)
+        if len(paths) == 1:
+            index[key] = paths.pop()
@@ -0,0 +1,163 @@
+import os
+import heapq
+import tempfile
+from itertools import chain, islice
+from lib.baseline import (
+    TOMBSTONE,
+    format_baseline_header,
+    format_baseline_line,
+    lock_baseline,
+    parse_baseline_line,
+    read_baseline_header,
+    read_baseline_lines,
+)
+from lib.hashing import DEFAULT_ALGORITHM
+from lib.sqlite_baseline import SQLiteBaseline
+
+# Records sorted in memory at once by the external sort
+DEFAULT_CHUNK_RECORDS = 500_000
+
+
+def _write_run(directory, index, records):
+    run_path = os.path.join(directory, f"run_{index:06d}.txt")
+
+    with open(run_path, "w", encoding="utf-8", errors="surrogateescape") as run:
+        for file_path in sorted(records):
+            run.write(format_baseline_line(file_path, records[file_path]))
+
+    return run_path
+
+
+def _read_run(run_path, index):
+    with open(run_path, "r", encoding="utf-8", errors="surrogateescape") as run:
+        for line in run:
+            file_path, record = parse_baseline_line(line)
+            # Later runs hold later entries
+            yield file_path, -index, record
+
+
+def sort_text_baseline(baseline_file, encoding=None, chunk_records=DEFAULT_CHUNK_RECORDS):
+    """ Yields the latest (path, record) of every path, sorted by path
+
+    Sorts runs of `chunk_records` entries in memory and merges them
+    from temporary files, so memory stays bounded whatever the size
+    of the baseline. A baseline that fits in one run skips the
+    files. Later entries for a path supersede earlier ones and
+    paths whose latest entry is a tombstone are dropped.
+    """
+
+    records = read_baseline_lines(baseline_file, encoding)
+
+    # Deduplicate within the run, last entry wins
+    chunk = dict(islice(records, chunk_records))
+    following = next(records, None)
+
+    if following is None:
+        for file_path in sorted(chunk):
+            if chunk[file_path].file_hash != TOMBSTONE:
+                yield file_path, chunk[file_path]
+        return
+
+    records = chain([following], records)
+
+    with tempfile.TemporaryDirectory(prefix="patrole_sort_") as tmp_dir:
+        runs = [_write_run(tmp_dir, 0, chunk)]
+
+        while True:
+            chunk = dict(islice(records, chunk_records))
+            if not chunk:
+                break
+
+            runs.append(_write_run(tmp_dir, len(runs), chunk))
+
+        merged = heapq.merge(*(_read_run(run, index) for index, run in enumerate(runs)))
+
+        previous = None
+        for file_path, _, record in merged:
+            # The first entry of a path comes from its latest run
+            if file_path != previous:
+                previous = file_path
+                if record.file_hash != TOMBSTONE:
+                    yield file_path, record
+
+
+def sorted_records(baseline_file, encoding=None, chunk_records=DEFAULT_CHUNK_RECORDS):
+    """ Yields the (path, record) pairs of any baseline sorted by path """
+
+    if baseline_file.endswith(".db"):
+        yield from SQLiteBaseline.open(baseline_file).sorted_items()
+    else:
+        yield from sort_text_baseline(baseline_file, encoding, chunk_records)
+
+
+def diff_sorted(old_records, new_records):
+    """ Merge-joins two sorted record streams
+
+    Yields (status, path, old_record, new_record) where status is
+    "added", "removed" or "changed". Unchanged paths are skipped.
+    """
+
+    old_records, new_records = iter(old_records), iter(new_records)
+    old = next(old_records, None)
+    new = next(new_records, None)
+
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0]):
+            yield "removed", old[0], old[1], None
+            old = next(old_records, None)
+
+        elif old is None or new[0] < old[0]:
+            yield "added", new[0], None, new[1]
+            new = next(new_records, None)
+
+        else:
+            if old[1].file_hash != new[1].file_hash:
+                yield "changed", old[0], old[1], new[1]
+
+            old = next(old_records, None)
+            new = next(new_records, None)
+
+
+def compact_text_baseline(baseline_file, encoding=None, chunk_records=DEFAULT_CHUNK_RECORDS):
+    """ Rewrites a text baseline with only the latest entry per path
+
+    The compacted baseline is written next to the original and
+    atomically renamed over it. Appends from a running monitor
+    wait until it is in place. Returns the number of entries kept.
+    """
+
+    # Appends made meanwhile would be lost with the replaced file
+    with lock_baseline(baseline_file):
+        directory = os.path.dirname(os.path.abspath(baseline_file))
+        algorithm = read_baseline_header(baseline_file).get("algorithm", DEFAULT_ALGORITHM)
+        fd, tmp_path = tempfile.mkstemp(prefix=".compact_", suffix=".txt", dir=directory)
+
+        entries = 0
+
+        try:
+            with os.fdopen(fd, "w", encoding=encoding or "utf-8") as compacted:
+                compacted.write(format_baseline_header(encoding or "utf-8", algorithm))
+
+                for file_path, record in sort_text_baseline(baseline_file, encoding, chunk_records):
+                    compacted.write(format_baseline_line(file_path, record))
+                    entries += 1
+
+                compacted.flush()
+                os.fsync(compacted.fileno())
+
+            os.chmod(tmp_path, os.stat(baseline_file).st_mode & 0o7777)
+            os.replace(tmp_path, baseline_file)
+
+            # Persist the rename itself
+            directory_fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(directory_fd)
+            finally:
+                os.close(directory_fd)
+
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    return entries
@@ -0,0 +1,98 @@
+import time
+import queue
+
+# Events of a path folded into a single event
+_ADDED = ("file_added", "file_copied")
+
+
+def drain_batch(_queue, window: float, max_size: int) -> list:
+    """ Blocks for an event, then collects more for up to `window` seconds
+
+    Returns at most `max_size` events in the order they were queued.
+    """
+
+    batch = [_queue.get()]
+    deadline = time.monotonic() + window
+
+    while len(batch) < max_size:
+        remaining = deadline - time.monotonic()
+
+        try:
+            batch.append(_queue.get(timeout=remaining) if remaining > 0 else _queue.get_nowait())
+        except queue.Empty:
+            break
+
+    return batch
+
+
+def coalesce_events(events) -> list:
+    """ Folds the events of each path into the net change
+
+    An add then a modify is an add, an add then a delete is
+    nothing and a delete then an add is a modify. Moves are kept
+    in place and no event is folded across them.
+    """
+
+    coalesced = []
+    # Path to the position of its event
+    positions = {}
+
+    for event in events:
+        event_type, data = event
+
+        if event_type.lower() == "file_moved":
+            coalesced.append(event)
+            positions.clear()
+            continue
+
+        position = positions.get(data["file_path"])
+
+        if position is None or coalesced[position] is None:
+            if position is None:
+                positions[data["file_path"]] = len(coalesced)
+                coalesced.append(event)
+            else:
+                coalesced[position] = event
+            continue
+
+        coalesced[position] = _merge(coalesced[position], event)
+
+    return [event for event in coalesced if event is not None]
+
+
+def _merge(first, second):
+    """ Returns the single event equivalent to two events of a path, if any """
+
+    (first_type, first_data), (second_type, second_data) = first, second
+    first_kind, second_kind = first_type.lower(), second_type.lower()
+
+    if first_kind in _ADDED:
+        if second_kind == "file_deleted":
+            return None
+
+        if second_kind == "file_modified":
+            # Still new, but no longer a copy of anything
+            return "File_added", {
+                **second_data,
+                "control_hash": second_data["file_hash"],
+                "file_permission": first_data.get("file_permission"),
+            }
+
+    elif first_kind == "file_modified":
+        if second_kind in ("file_modified", "file_deleted"):
+            merged = {**second_data, "control_hash": first_data["control_hash"]}
+
+            # Modified back to its baseline content
+            if second_kind == "file_modified" and merged["file_hash"] == merged["control_hash"]:
+                return None
+
+            return second_type, merged
+
+    elif first_kind == "file_deleted":
+        if second_kind in _ADDED:
+            if second_data["file_hash"] == first_data["control_hash"]:
+                return None
+
+            return "File_modified", {**second_data, "control_hash": first_data["control_hash"]}
+
+    return second
@@ -0,0 +1,162 @@
+import os
+from typing import NamedTuple
+
+
+class Changes(NamedTuple):
+    """ Differences between a scan and the baseline
+
+    added and copied map new paths to their records, copied
+    ones having the hash of another file. modified maps paths
+    to their (old, new) records and deleted to their old record.
+    unchanged maps rehashed paths whose hash is the same and
+    moved maps new paths to their (old path, record).
+    """
+
+    added: dict
+    copied: dict
+    modified: dict
+    deleted: dict
+    unchanged: dict
+    moved: dict
+
+
+class Move(NamedTuple):
+    """ A file or a whole directory that was moved
+
+    files lists the (old path, new path, record) of every
+    file that moved with it.
+    """
+
+    old_path: str
+    new_path: str
+    is_directory: bool
+    files: list
+
+
+def find_moved_from(baseline, file_path, file_stat, claimed=()):
+    """ Returns the baseline path a new file was moved from, if any
+
+    A candidate shares the file's inode, size and mtime and no
+    longer holds that inode, so hard links are not moves.
+    """
+
+    for old_path in baseline.paths_for_inode(file_stat.st_ino):
+        if old_path == file_path or old_path in claimed:
+            continue
+
+        record = baseline.get(old_path)
+        if record.size != file_stat.st_size or record.mtime_ns != file_stat.st_mtime_ns:
+            continue
+
+        try:
+            old_stat = os.lstat(old_path)
+        except FileNotFoundError:
+            return old_path
+
+        if (old_stat.st_dev, old_stat.st_ino) != (file_stat.st_dev, file_stat.st_ino):
+            return old_path
+
+    return None
+
+
+def diff_scan(baseline, records, seen_paths, expected_paths, moved=None) -> Changes:
+    """ Diffs a scan against the baseline with set operations
+
+    `records` maps the paths that were hashed to their fresh
+    records, `seen_paths` holds every path the scan found,
+    hashed or not, and `expected_paths` the baseline paths the
+    scan covered. `moved` maps new paths that were recognized as
+    moves to their (old path, record). Copies are found through
+    the baseline's hash index, or among the new files themselves.
+    """
+
+    expected_paths = set(expected_paths)
+    moved = moved or {}
+
+    deleted_paths = expected_paths - set(seen_paths) - {old for old, _ in moved.values()}
+    new_paths = records.keys() - expected_paths
+    existing_paths = records.keys() & expected_paths
+
+    modified, unchanged = {}, {}
+
+    for file_path in existing_paths:
+        old = baseline.get(file_path)
+
+        if old.file_hash != records[file_path].file_hash:
+            modified[file_path] = (old, records[file_path])
+        else:
+            unchanged[file_path] = records[file_path]
+
+    added, copied = {}, {}
+    new_hashes = set()
+
+    # Sorted so the same file of a group of copies is the original
+    for file_path in sorted(new_paths):
+        record = records[file_path]
+
+        if record.file_hash in new_hashes or baseline.has_hash(record.file_hash):
+            copied[file_path] = record
+        else:
+            added[file_path] = record
+            new_hashes.add(record.file_hash)
+
+    deleted = {file_path: baseline.get(file_path) for file_path in deleted_paths}
+
+    return Changes(added, copied, modified, deleted, unchanged, moved)
+
+
+def group_moves(baseline, moved) -> list:
+    """ Collapses the files of directories that moved as a whole
+
+    Returns a Move per moved directory, covering every baseline
+    file below it, and one per remaining file.
+    """
+
+    # Candidate (old, new) directory pairs and how many moves they hold
+    candidates: dict = {}
+    moves = []
+
+    for new_path, (old_path, record) in sorted(moved.items()):
+        pairs = []
+        old_dir, new_dir = old_path, new_path
+
+        # Climb while the names match, up to the directory
+        # that was renamed or whose parent changed
+        while os.path.basename(old_dir) == os.path.basename(new_dir):
+            old_dir, new_dir = os.path.dirname(old_dir), os.path.dirname(new_dir)
+            if old_dir == new_dir or not os.path.basename(old_dir):
+                break
+
+            pairs.append((old_dir, new_dir))
+
+        for pair in pairs:
+            candidates[pair] = candidates.get(pair, 0) + 1
+
+        moves.append((old_path, new_path, record, pairs))
+
+    whole: dict = {}
+
+    def is_whole(pair) -> bool:
+        if pair not in whole:
+            old_dir, _ = pair
+
+            whole[pair] = (
+                candidates[pair] > 1
+                and not os.path.lexists(old_dir)
+                and len(baseline.paths_under(old_dir)) == candidates[pair]
+            )
+
+        return whole[pair]
+
+    groups: dict = {}
+
+    for old_path, new_path, record, pairs in moves:
+        # The highest directory that moved whole
+        pair = next((p for p in reversed(pairs) if is_whole(p)), None)
+
+        if pair is None:
+            groups[(old_path, new_path)] = Move(old_path, new_path, False, [(old_path, new_path, record)])
+        else:
+            groups.setdefault(pair, Move(*pair, True, [])).files.append((old_path, new_path, record))
+
+    return list(groups.values())
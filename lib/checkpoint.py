@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import threading
+from collections import Counter
+from lib.utils import format_size
+
+# Saved next to the baseline being created
+CHECKPOINT_SUFFIX = ".checkpoint"
+
+# Files hashed between chances to checkpoint
+CHUNK_FILES = 4096
+
+DEFAULT_PROGRESS_INTERVAL = 10.0
+
+
+def get_checkpoint_file(baseline_file) -> str:
+    return baseline_file + CHECKPOINT_SUFFIX
+
+
+def find_checkpoints(baseline_path) -> list:
+    """ Returns the checkpoint files in a directory, latest first """
+
+    try:
+        names = [name for name in os.listdir(baseline_path) if name.endswith(CHECKPOINT_SUFFIX)]
+    except FileNotFoundError:
+        return []
+
+    paths = [os.path.join(baseline_path, name) for name in names]
+
+    return sorted(paths, key=os.path.getmtime, reverse=True)
+
+
+def save_checkpoint(checkpoint_file, checkpoint):
+    """ Replaces the checkpoint atomically, so a crash keeps the previous one """
+
+    temp_path = f"{checkpoint_file}.{os.getpid()}.tmp"
+
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(checkpoint, file)
+        file.flush()
+        os.fsync(file.fileno())
+
+    os.replace(temp_path, checkpoint_file)
+
+
+def load_checkpoint(checkpoint_file) -> dict:
+    with open(checkpoint_file, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def format_duration(seconds) -> str:
+    """ Formats seconds as H:MM:SS """
+
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+
+    return f"{hours}:{minutes:02}:{seconds:02}"
+
+
+class Progress:
+    """ Reports how far a baseline got and when it should be done
+
+    Throughput is measured over this run only, so a resumed
+    baseline isn't credited with the work done before it
+    stopped. Totals are estimated from `walk`, the state of the
+    walk being hashed: each directory left in it is taken to
+    hold as many files and subdirectories as those read so far
+    at its depth, so the estimate firms up as the walk goes.
+    `count_remaining` counts them exactly instead, with a second
+    walk in a daemon thread from the first report on.
+    """
+
+    def __init__(self, files=0, bytes=0, interval=DEFAULT_PROGRESS_INTERVAL, walk=None):
+        self.files = files
+        self.bytes = bytes
+        self.interval = interval
+
+        self.total_files = None
+        self.total_bytes = None
+        self.estimated = True
+
+        # Gathers the directory statistics of the walk from now on
+        self._walk = walk
+        if walk is not None:
+            walk.setdefault("walked", [])
+        self._remaining = None
+        self._counted = None
+        self._start_files = files
+        self._start_bytes = bytes
+        self._started = time.monotonic()
+        self._reported = self._started
+
+    def count_remaining(self, remaining):
+        """ Counts the files left exactly, `remaining` returning a walk of them as lists of (path, stat) """
+
+        self._remaining = remaining
+
+    def _count_totals(self):
+        done_files, done_bytes = self.files, self.bytes
+        walk = self._remaining()
+
+        def count():
+            files = 0
+            size = 0
+
+            for entries in walk:
+                files += len(entries)
+                size += sum(file_stat.st_size for _, file_stat in entries)
+
+            # Taken up by the next report
+            self._counted = (done_files + files, done_bytes + size)
+
+        threading.Thread(target=count, name="baseline-count", daemon=True).start()
+        self._remaining = None
+
+    def _estimate_totals(self):
+        walked = self._walk["walked"]
+
+        # Directories left at each depth, each the root of a subtree yet to walk
+        left = Counter(directory.rstrip(os.sep).count(os.sep) for directory in self._walk["pending"] + self._walk["roots"])
+
+        # Files and bytes expected below a directory at each depth, from the deepest up
+        below = [(0, 0)] * (len(walked) + 1)
+
+        for depth in range(len(walked) - 1, -1, -1):
+            directories, files, size = walked[depth]
+            if not directories:
+                continue
+
+            # Subdirectories per directory, all of those found at the next depth having a parent here
+            children = (walked[depth + 1][0] if depth + 1 < len(walked) else 0) + left[depth + 1]
+            branching = children / directories
+
+            below[depth] = (
+                files / directories + branching * below[depth + 1][0],
+                size / directories + branching * below[depth + 1][1],
+            )
+
+        self.total_files = self.files + round(sum(count * below[min(depth, len(walked))][0] for depth, count in left.items()))
+        self.total_bytes = self.bytes + round(sum(count * below[min(depth, len(walked))][1] for depth, count in left.items()))
+
+    def add(self, files, bytes):
+        """ Records handled files, reporting when a report is due
+
+        Call it once the files are handled, as the walk counted
+        or estimated from then on starts where they ended.
+        """
+
+        self.files += files
+        self.bytes += bytes
+
+        if self.interval and time.monotonic() - self._reported >= self.interval:
+            if self._remaining is not None:
+                self._count_totals()
+
+            if self._counted is not None:
+                self.total_files, self.total_bytes = self._counted
+                self.estimated = False
+
+            elif self._walk is not None:
+                self._estimate_totals()
+
+            self.report()
+
+    def finish(self):
+        """ Reports the final totals once the walk is done """
+
+        self.total_files, self.total_bytes = self.files, self.bytes
+        self.estimated = False
+
+        self.report()
+
+    def eta(self):
+        """ Returns the seconds left at the current throughput, or None before it is known """
+
+        elapsed = time.monotonic() - self._started
+        files_done = self.files - self._start_files
+        bytes_done = self.bytes - self._start_bytes
+
+        if self.total_files is None or not files_done or not elapsed:
+            return None
+
+        # Whichever of files or bytes is further behind
+        seconds = max(0, self.total_files - self.files) * elapsed / files_done
+
+        if bytes_done:
+            seconds = max(seconds, max(0, self.total_bytes - self.bytes) * elapsed / bytes_done)
+
+        return seconds
+
+    def report(self):
+        self._reported = now = time.monotonic()
+        elapsed = max(now - self._started, 1e-9)
+
+        files_rate = (self.files - self._start_files) / elapsed
+        bytes_rate = (self.bytes - self._start_bytes) / elapsed
+
+        if self.total_files:
+            about = "~" if self.estimated else ""
+            done = f"{self.files:,}/{about}{self.total_files:,} files ({self.files / self.total_files:.1%})"
+        else:
+            done = f"{self.files:,} files (counting...)"
+
+        eta = self.eta()
+        eta = f", ETA {format_duration(eta)}" if eta is not None else ""
+
+        print(f"Hashed {done}, {format_size(self.bytes)} at {files_rate:,.0f} files/s, {format_size(bytes_rate)}/s{eta}")
@@ -0,0 +1,173 @@
+import os
+import signal
+import socket
+import threading
+import socketserver
+from collections import Counter
+from lib import metrics
+from lib.daemon import EXIT_OK, EXIT_USAGE
+from lib.dedup import DEFAULT_MAX_ENTRIES, DEFAULT_TTL, DedupCache
+from lib.logger import get_log_writer, close_log_writer
+from lib.transport import decode_frame, encode_frame, parse_address, read_frame
+from config import Config
+
+config = Config()
+
+
+class Collector:
+    """ Aggregates, deduplicates and stores the events of agents
+
+    Frames already seen by id are acknowledged and dropped, as
+    are events already stored by (host, event, path, control
+    hash, hash) within the dedup TTL. Stored events go to
+    `store`, e.g. the shared log writer.
+    """
+
+    def __init__(self, store, dedup):
+        self.store = store
+        self.dedup = dedup
+
+        # Events stored per host
+        self.hosts = Counter()
+        self._lock = threading.Lock()
+
+    def handle(self, message) -> int:
+        """ Stores the new events of a frame, returns how many there were """
+
+        if not self.dedup.check_and_add(("frame", message["id"]), "frame"):
+            metrics.COLLECTED_DUPLICATES.inc()
+            return 0
+
+        host = message["host"]
+        stored = 0
+
+        for record in message["events"]:
+            key = (host, record["event"], record["file_path"], record["control_hash"], record["file_hash"])
+
+            if not self.dedup.check_and_add(key, record["event"]):
+                metrics.COLLECTED_DUPLICATES.inc()
+                continue
+
+            self.store(record)
+            metrics.COLLECTED_EVENTS.inc(1, host, record["event"])
+            stored += 1
+
+        with self._lock:
+            self.hosts[host] += stored
+
+        return stored
+
+    def stats(self) -> dict:
+        """ Returns the number of events stored per host """
+
+        with self._lock:
+            return dict(self.hosts)
+
+
+class _FrameHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                frame = read_frame(self.rfile)
+                if frame is None:
+                    return
+
+                message = decode_frame(frame)
+                self.server.collector.handle(message)
+
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"Dropped an agent connection after a bad frame: {e}")
+                return
+
+            try:
+                self.wfile.write(encode_frame({"ack": message["id"]}))
+            except OSError:
+                # The agent resends the frame, which is then dropped as a duplicate
+                return
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _TCPv6Server(_TCPServer):
+    address_family = socket.AF_INET6
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def serve(address, collector) -> socketserver.BaseServer:
+    """ Accepts agents on a TCP or Unix socket address from a daemon thread """
+
+    family, target = parse_address(address)
+
+    if family == socket.AF_UNIX:
+        # Left behind by a collector that didn't shut down
+        if os.path.exists(target):
+            os.remove(target)
+
+        server = _UnixServer(target, _FrameHandler)
+    elif family == socket.AF_INET6:
+        server = _TCPv6Server(target, _FrameHandler)
+    else:
+        server = _TCPServer(target, _FrameHandler)
+
+    server.collector = collector
+
+    threading.Thread(target=server.serve_forever, name="collector", daemon=True).start()
+
+    return server
+
+
+def run_collector(address) -> int:
+    """ Collects the events of agents until SIGTERM or SIGINT
+
+    Events are stored by the log writer configured for this
+    process. Returns the exit status.
+    """
+
+    collector = Collector(
+        get_log_writer().write,
+        DedupCache(
+            max_entries=int(config.get("PT_DEDUP_MAX_ENTRIES") or DEFAULT_MAX_ENTRIES),
+            ttl=float(config.get("PT_DEDUP_TTL") or DEFAULT_TTL),
+        ),
+    )
+
+    try:
+        server = serve(address, collector)
+    except (OSError, ValueError) as e:
+        print(f"Failed listening on {address}: {e}")
+        return EXIT_USAGE
+
+    metrics.start_exporters(config)
+
+    stop_requested = threading.Event()
+
+    def request_stop(signum, frame):
+        print(f"Received {signal.Signals(signum).name}, shutting down...")
+        stop_requested.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    print(f"Collecting events on {address} into {config.get('PT_LOG_LOCATION')}.")
+
+    while not stop_requested.wait(1.0):
+        pass
+
+    server.shutdown()
+    server.server_close()
+
+    if server.address_family == socket.AF_UNIX:
+        os.remove(server.server_address)
+
+    close_log_writer()
+
+    for host, count in sorted(collector.stats().items()):
+        print(f"{host}: {count} event(s)")
+
+    return EXIT_OK
@@ -0,0 +1,138 @@
+import os
+import time
+import signal
+import threading
+from lib import workers, file_handlers as fh
+from lib.agent import close_agent
+from lib.event import stop_dispatcher
+from lib.logger import close_log_writer
+from lib.sqlite_baseline import SQLiteBaseline
+from config import Config
+
+config = Config()
+
+# Seconds each step of a shutdown may take
+DEFAULT_SHUTDOWN_TIMEOUT = 30.0
+
+# Exit statuses, following sysexits(3) for bad usage
+EXIT_OK = 0
+EXIT_FAILURE = 1
+EXIT_USAGE = 64
+
+
+def resolve_baseline(baseline_file=None) -> str:
+    """ Returns the baseline to monitor without prompting
+
+    Defaults to the only baseline in PT_BASELINE_PATH.
+    """
+
+    if baseline_file is None:
+        baseline_files = fh.get_baseline_files()
+
+        if len(baseline_files) != 1:
+            raise ValueError(
+                f"Found {len(baseline_files)} baselines in '{config.get('PT_BASELINE_PATH')}', "
+                "select one with --baseline."
+            )
+
+        baseline_file = baseline_files[0]
+
+    if not os.path.isfile(baseline_file):
+        raise FileNotFoundError(f"Baseline '{baseline_file}' not found.")
+
+    return os.path.abspath(baseline_file)
+
+
+def ignore_baseline(baseline_file):
+    """ Keeps the baseline and its side files out of the scans
+
+    Baselines outside PT_BASELINE_PATH aren't covered by the
+    default ignore patterns.
+    """
+
+    stem = os.path.splitext(baseline_file)[0]
+
+    config.set("PT_IGNORED_DIRS", ",".join([config.get("PT_IGNORED_DIRS"), f"{baseline_file}*", f"{stem}.merkle"]))
+
+
+def run_daemon(baseline_file, curFile, message_queue, started=None) -> int:
+    """ Monitors without any prompt until SIGTERM or SIGINT
+
+    `started` is the perf_counter reading at process start, used
+    to report the time to the first scan against
+    PT_STARTUP_TARGET. Returns the exit status.
+    """
+
+    try:
+        baseline_file = resolve_baseline(baseline_file)
+    except (ValueError, FileNotFoundError) as e:
+        print(e)
+        return EXIT_USAGE
+
+    ignore_baseline(baseline_file)
+
+    stop_requested = threading.Event()
+
+    def request_stop(signum, frame):
+        print(f"Received {signal.Signals(signum).name}, shutting down...")
+        stop_requested.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    print(f"Monitoring {config.get('PT_MONITOR_DIRS')} against '{baseline_file}'.")
+
+    monitoring_thread = fh.start_monitoring(baseline_file, curFile, message_queue)
+    status = EXIT_OK
+    reported = False
+
+    # Short waits until the start is reported, so it is timed closely
+    while not stop_requested.wait(1.0 if reported else 0.01):
+        if not reported and workers.first_pass_started.is_set():
+            report_startup(started)
+            reported = True
+
+        if not monitoring_thread.is_alive():
+            print("Monitoring stopped unexpectedly.")
+            status = EXIT_FAILURE
+            break
+
+    shutdown(monitoring_thread, message_queue)
+
+    return status
+
+
+def report_startup(started):
+    if started is None:
+        return
+
+    elapsed = time.perf_counter() - started
+    target = float(config.get("PT_STARTUP_TARGET") or 0)
+
+    print(f"First scan started {elapsed:.3f}s after launch.")
+
+    if target and elapsed > target:
+        print(f"Startup took longer than the {target:g}s target.")
+
+
+def shutdown(monitoring_thread, message_queue, timeout=DEFAULT_SHUTDOWN_TIMEOUT):
+    """ Stops the workers and flushes queued events, logs and baselines """
+
+    workers.shutdown.set()
+
+    monitoring_thread.join(timeout)
+    if monitoring_thread.is_alive():
+        print(f"Monitoring did not stop within {timeout:g}s.")
+
+    # Let the message daemon handle the events already queued
+    deadline = time.monotonic() + timeout
+    while message_queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    if message_queue.unfinished_tasks:
+        print(f"Dropped {message_queue.unfinished_tasks} queued event(s).")
+
+    stop_dispatcher(timeout)
+    close_agent(timeout)
+    close_log_writer()
+    SQLiteBaseline.close_all()
@@ -0,0 +1,76 @@
+import time
+import threading
+from collections import Counter, OrderedDict
+
+DEFAULT_MAX_ENTRIES = 100_000
+DEFAULT_TTL = 86400.0
+
+
+class DedupCache:
+    """ Remembers recently seen keys to suppress repeated events
+
+    Keys expire `ttl` seconds after they were first seen and the
+    least recently seen ones are evicted past `max_entries`, so
+    memory stays bounded for the life of the process. Suppressed
+    events are counted per kind.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = float(ttl)
+
+        # Key to the time it expires, least recently seen first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.suppressed = Counter()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def check_and_add(self, key, kind=None) -> bool:
+        """ Records a key, returns False if it was already seen and unexpired """
+
+        now = time.monotonic()
+
+        with self._lock:
+            expires = self._entries.get(key)
+
+            if expires is not None and expires > now:
+                self._entries.move_to_end(key)
+                self.suppressed[kind] += 1
+                return False
+
+            self._entries[key] = now + self.ttl
+            self._entries.move_to_end(key)
+
+            self._evict(now)
+
+            return True
+
+    def _evict(self, now):
+        # Entries are in order of last sighting while expiry counts
+        # from the first, so an expired key behind a fresher one
+        # waits for its turn at the front, bounded by max_entries.
+        # Over the limit, the least recently seen go first.
+        while self._entries:
+            key, expires = next(iter(self._entries.items()))
+
+            if expires > now and len(self._entries) <= self.max_entries:
+                break
+
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """ Returns the number of keys held and of events suppressed """
+
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "suppressed": sum(self.suppressed.values()),
+                "suppressed_by_kind": dict(self.suppressed),
+            }
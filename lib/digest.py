@@ -0,0 +1,89 @@
+import os
+import asyncio
+
+
+def _event_paths(event_type: str, data) -> list:
+    if event_type == "file_moved":
+        return [new_path for _, new_path, _ in data["moved_files"]]
+
+    return [data["file_path"]]
+
+
+def _common_directory(paths) -> str:
+    try:
+        return os.path.commonpath([os.path.dirname(p) for p in paths])
+    except ValueError:
+        # Relative and absolute paths mixed
+        return ""
+
+
+def summarize_events(events) -> list:
+    """ Summarizes (event type, data) pairs, one line per kind of change
+
+    e.g. "143 files modified under /etc"
+    """
+
+    # Verb to the paths it applies to, in order of first appearance
+    changes: dict = {}
+
+    for event_type, data in events:
+        event_type = event_type.lower()
+        verb = event_type.removeprefix("file_")
+
+        changes.setdefault(verb, []).extend(_event_paths(event_type, data))
+
+    lines = []
+
+    for verb, paths in changes.items():
+        if len(paths) == 1:
+            lines.append(f"1 file {verb}: {paths[0]}")
+            continue
+
+        directory = _common_directory(paths)
+        where = f" under {directory}" if directory else ""
+
+        lines.append(f"{len(paths)} files {verb}{where}")
+
+    return lines
+
+
+class Digest:
+    """ Groups the events of a window into a single notification
+
+    The first events of a window schedule a send `window`
+    seconds later, so observers never wait for it. A window of
+    0 sends each batch of events as soon as the loop is free.
+    """
+
+    def __init__(self, send, window: float, title):
+        self.send = send
+        self.window = window
+        self.title = title
+
+        self._events = []
+        self._task = None
+
+    def add(self, events):
+        """ Adds events to the current window, from the running loop """
+
+        self._events.extend(events)
+
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._send_later())
+
+    async def _send_later(self):
+        await asyncio.sleep(self.window)
+
+        # Events from now on go to the next window
+        events, self._events = self._events, []
+        self._task = None
+
+        if not events:
+            return
+
+        lines = summarize_events(events)
+
+        try:
+            await self.send("\n".join([self.title(len(events)), *lines]))
+        except Exception as e:
+            print(f"NotifyDigestError {e}")
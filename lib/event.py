@@ -1,27 +1,161 @@
 import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # Observer registry
 registry = dict()
 
+# Observers of whole batches of (event type, data) pairs
+batch_registry = []
+
+# Observers running at once and seconds each may take, 0 waits forever
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_OBSERVER_TIMEOUT = 30.0
+
+# Dispatcher shared by every event source
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
 def subscribe(event_type: str, fn):
     event_type = event_type.lower()
     if event_type not in registry:
         registry[event_type] = []
     registry[event_type].append(fn)
 
-# Dispatcher to handle async and async observers
-async def dispatch_observer(event_type: str, data):
-    event_type = event_type.lower()
-    event = registry.get(event_type)
+def subscribe_batch(fn):
+    """ Subscribes an observer to every batch of events, for bulk work """
+    batch_registry.append(fn)
+
+
+class Dispatcher:
+    """ Runs observers on a long-lived event loop in its own thread
+
+    The observers of an event run concurrently, at most
+    `max_concurrency` at a time, and each is given
+    `observer_timeout` seconds. Sync observers run on a thread
+    pool of the same size; one that times out is abandoned but
+    keeps its thread until it returns. A failing observer is
+    reported without affecting the others.
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY, observer_timeout=DEFAULT_OBSERVER_TIMEOUT):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.observer_timeout = float(observer_timeout or 0) or None
+
+        self._loop = asyncio.new_event_loop()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="observer")
+        self._loop.set_default_executor(self._executor)
+
+        self._semaphore = None
+        self._ready = threading.Event()
+
+        self._thread = threading.Thread(target=self._run, name="event-dispatcher", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._ready.set()
+
+        self._loop.run_forever()
+
+    def submit(self, event_type: str, data):
+        """ Schedules the observers of an event from any thread
+
+        Returns a concurrent.futures.Future of the observers'
+        errors, None for each one that succeeded.
+        """
+
+        return asyncio.run_coroutine_threadsafe(self.dispatch(event_type, data), self._loop)
+
+    def submit_batch(self, events):
+        """ Schedules a batch of (event type, data) pairs from any thread
+
+        Batch observers get the whole batch while the events are
+        dispatched one after another to their own observers.
+        """
+
+        return asyncio.run_coroutine_threadsafe(self.dispatch_batch(events), self._loop)
+
+    async def dispatch_batch(self, events) -> list:
+        async def dispatch_each():
+            errors = []
+
+            for event_type, data in events:
+                try:
+                    errors.extend(await self.dispatch(event_type, data))
+                except ValueError as e:
+                    print(e)
+                    errors.append(e)
+
+            return errors
+
+        results = await asyncio.gather(
+            dispatch_each(),
+            *(self._call(fn, "batch", events) for fn in batch_registry),
+        )
+
+        return [*results[0], *results[1:]]
+
+    async def dispatch(self, event_type: str, data) -> list:
+        event_type = event_type.lower()
+        event = registry.get(event_type)
+
+        if event is None:
+            raise ValueError(f"Observer {event_type} not found!")
+
+        return await asyncio.gather(*(self._call(fn, event_type, data) for fn in event))
+
+    async def _call(self, fn, event_type, data):
+        async with self._semaphore:
+            try:
+                if asyncio.iscoroutinefunction(fn):
+                    observer = fn(data)
+                else:
+                    observer = self._loop.run_in_executor(None, fn, data)
+
+                await asyncio.wait_for(observer, self.observer_timeout)
+
+            except asyncio.TimeoutError as e:
+                print(f"Observer {fn.__name__} of {event_type} timed out after {self.observer_timeout:g}s")
+                return e
+
+            except Exception as e:
+                print(f"Observer {fn.__name__} of {event_type} failed: {e}")
+                return e
+
+    def stop(self, timeout=None):
+        """ Stops the loop once pending callbacks have run """
+
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def start_dispatcher(**kwargs) -> Dispatcher:
+    """ Starts the shared dispatcher, or returns the running one """
+
+    global _dispatcher
+
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = Dispatcher(**kwargs)
+
+        return _dispatcher
+
+
+def stop_dispatcher(timeout=None):
+    """ Stops the shared dispatcher, if it was started """
+
+    global _dispatcher
 
-    if event is None:
-        raise ValueError(f"Observer {event_type} not found!")
+    with _dispatcher_lock:
+        if _dispatcher is not None:
+            _dispatcher.stop(timeout)
+            _dispatcher = None
 
-    for fn in event:
-        if asyncio.iscoroutinefunction(fn):
-            await fn(data)
-        else:
-            await asyncio.to_thread(fn, data)
 
 def post_event(event_type: str, data):
-    asyncio.run(dispatch_observer(event_type, data))
+    """ Runs the observers of an event and waits for them """
+    return start_dispatcher().submit(event_type, data).result()
@@ -1,13 +1,32 @@
 import os
-import hashlib
 import platform
-from lib import utils, workers, log_listener
+from lib import inotify, metrics, utils, workers, log_listener
+from lib.hashing import DEFAULT_ALGORITHM, HashPool
+from lib.baseline import (
+    LOCK_SUFFIX,
+    TOMBSTONE,
+    BaselineRecord,
+    format_baseline_header,
+    format_baseline_line,
+    load_text_baseline,
+    read_baseline_header,
+    read_baseline_lines,
+)
+from lib.checkpoint import CHECKPOINT_SUFFIX, CHUNK_FILES, Progress, find_checkpoints, get_checkpoint_file, load_checkpoint, save_checkpoint
+from lib.baseline_merge import compact_text_baseline, diff_sorted, sorted_records
+from lib.ignore import parse_ignore_rules
+from lib.merkle import DigestTree, compute_digests, diff_trees, format_digest_lines, read_digest_lines
+from lib.sqlite_baseline import (
+    SQLiteBaseline,
+    export_text_baseline,
+    import_text_baseline,
+)
 from config import Config
-import enquiries
 import threading
-import time
+import copy
 import json
 import stat
+import time
 import argparse
 
 config = Config()
@@ -38,45 +57,199 @@ def get_file_permission(file_path: str) -> str:
         return windows_permissions
 
 
-#  Calculate and return the hash of a file
-def calc_file_hash(file_path, hash_algorithm="sha256"):
+def create_hash_pool(hash_algorithm=None) -> HashPool:
+    """ Creates a hash pool from the config
+
+    Uses the configured algorithm unless one is given, such as
+    the algorithm of a loaded baseline.
+    """
+
+    return HashPool(
+        workers=config.get("PT_HASH_WORKERS"),
+        executor=config.get("PT_HASH_EXECUTOR"),
+        hash_algorithm=hash_algorithm or config.get("PT_HASH_ALGORITHM"),
+        buffer_size=config.get("PT_HASH_BUFFER_SIZE"),
+        mmap_threshold=config.get("PT_HASH_MMAP_THRESHOLD"),
+        fingerprint_threshold=config.get("PT_FINGERPRINT_THRESHOLD"),
+        fingerprint_blocks=config.get("PT_FINGERPRINT_BLOCKS"),
+        fingerprint_block_size=config.get("PT_FINGERPRINT_BLOCK_SIZE"),
+        observe_durations=metrics.HASH_SECONDS.observe_many,
+    )
+
+
+def hash_records(files, baseline, hash_pool, audit=False, throttle=None):
+    """ Yields a fresh (path, stat, record) for each (path, stat) entry
+
+    Large files are fingerprinted first and keep their recorded
+    hash while the fingerprint matches, so the full hash only runs
+    when it changed or when `audit` is set. The throttle is charged
+    for those full hashes, the caller charges everything else.
+    """
+
+    large_files = []
+
+    # Counted locally and added to the metrics once
+    hashed_files = 0
+    hashed_bytes = 0
+
+    def small_files():
+        for file_path, file_stat in files:
+            if hash_pool.is_large(file_stat.st_size):
+                large_files.append((file_path, file_stat))
+            else:
+                yield file_path, file_stat
+
     try:
-        hash_object = hashlib.new(hash_algorithm)
+        for (file_path, file_stat), file_hash in hash_pool.hash_files(small_files()):
+            hashed_files += 1
+            hashed_bytes += file_stat.st_size
 
-        with open(file_path, "rb") as file:
-            while True:
-                data = file.read(65536)  # Read data in 64KB chunks
-                if not data:
-                    break
-                hash_object.update(data)
-        return hash_object.hexdigest().strip()
+            # File vanished or is unreadable
+            if file_hash is not None:
+                yield file_path, file_stat, BaselineRecord.from_stat(file_hash, file_stat)
 
-    except ValueError as e:
-        print(f"Failed calculating hash for {file_path}. Error: {e}")
+        fingerprinted = []
+
+        for (file_path, file_stat), fingerprint in hash_pool.fingerprint_files(large_files):
+            hashed_files += 1
+            hashed_bytes += hash_pool.read_size(file_stat.st_size)
+
+            if fingerprint is None:
+                continue
+
+            record = baseline.get(file_path) if baseline is not None else None
+
+            # Compare like with like, records without a
+            # fingerprint were never checked by one
+            if not audit and record is not None and record.fingerprint == fingerprint:
+                yield file_path, file_stat, BaselineRecord.from_stat(record.file_hash, file_stat, fingerprint)
+                continue
+
+            if throttle is not None:
+                throttle.consume(file_stat.st_size, files=0)
+
+            fingerprinted.append((file_path, file_stat, fingerprint))
+
+        for (file_path, file_stat, fingerprint), file_hash in hash_pool.hash_files(fingerprinted):
+            hashed_bytes += file_stat.st_size
+
+            if file_hash is not None:
+                yield file_path, file_stat, BaselineRecord.from_stat(file_hash, file_stat, fingerprint)
+
+    finally:
+        metrics.FILES_HASHED.inc(hashed_files)
+        metrics.BYTES_HASHED.inc(hashed_bytes)
+
+
+def is_ignored_dir(directory, ignored_dirs) -> bool:
+    """ Checks whether a directory or one of its parents is ignored """
+    return parse_ignore_rules(ignored_dirs).is_ignored_path(os.path.abspath(directory), is_dir=True)
+
+
+def is_ignored_file(file_path, skip_file_name, ignored_dirs) -> bool:
+    """ Checks whether the specified file is ignored """
+
+    if os.path.basename(file_path) == skip_file_name:
+        return True
+
+    return parse_ignore_rules(ignored_dirs).is_ignored_path(os.path.abspath(file_path))
 
 
-#  recursively obtain a list of all file paths and
-#  their hashes in the given or cwd
-def list_files_recursively(skip_file_name, directories, ignored_dirs):
-    file_list = []
+def get_monitor_roots(directories) -> list:
+    """ Returns the absolute paths of comma separated directories """
 
-    for directory in directories.split(","):
-        for root, _, files in os.walk(directory):
-            for file in files:
-                # Check if the root directory is the "baseline" directory.
-                if (
-                    os.path.dirname(os.path.abspath(root)) in ignored_dirs
-                ) or file == skip_file_name:
-                    continue  # Skip the file in the "baseline" directory.
+    # Absolute paths keep baseline keys and event paths the same
+    return [os.path.abspath(directory.strip()) for directory in directories.split(",")]
 
-                file_path = os.path.join(root, file).strip()
 
-                #  Ensure file exists
-                if os.path.exists(file_path):
-                    file_hash = calc_file_hash(file_path)
-                    file_list.append((f"{file_path} | {file_hash}"))
+def new_walk_state(directories) -> dict:
+    """ Returns the state of a walk that has yet to start """
+    return {"roots": get_monitor_roots(directories), "pending": []}
 
-    return file_list
+
+def walk_directories(skip_file_name, ignored_dirs, state):
+    """ Yields the regular files of each directory as a list of (path, stat)
+
+    `state` holds the roots and directories left to walk and is
+    updated before each list is yielded, so a copy saved once
+    those files are handled resumes the walk right after them.
+    Subdirectories listed in its optional "excluded" are skipped,
+    as when another process walks them. An optional "walked"
+    list gathers the [directories, files, bytes] read at each
+    depth, e.g. to estimate how much is left.
+    """
+
+    rules = parse_ignore_rules(ignored_dirs)
+
+    roots = state["roots"]
+    pending = state["pending"]
+    excluded = set(state.get("excluded", ()))
+    walked = state.get("walked")
+
+    while pending or roots:
+        if not pending:
+            pending.append(roots.pop(0))
+
+        directory = pending.pop()
+
+        try:
+            entries = os.scandir(directory)
+        except OSError:
+            # Removed or unreadable since it was listed
+            continue
+
+        files = []
+        subdirectories = []
+
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.path not in excluded and not rules.is_ignored(entry.path, is_dir=True):
+                            subdirectories.append(entry.path)
+                        continue
+
+                    if entry.name == skip_file_name or rules.is_ignored(entry.path):
+                        continue
+
+                    # Follows symlinks like os.stat, cached on the entry
+                    file_stat = entry.stat()
+
+                #  Ensure file still exists
+                except OSError:
+                    continue
+
+                # Skip FIFOs, sockets and devices, reading them could block
+                if stat.S_ISREG(file_stat.st_mode):
+                    files.append((entry.path, file_stat))
+
+        # Depth first, in directory order
+        pending.extend(reversed(subdirectories))
+
+        if walked is not None:
+            depth = directory.rstrip(os.sep).count(os.sep)
+            walked.extend([0, 0, 0] for _ in range(depth + 1 - len(walked)))
+
+            walked[depth][0] += 1
+            walked[depth][1] += len(files)
+            walked[depth][2] += sum(file_stat.st_size for _, file_stat in files)
+
+        if files:
+            yield files
+
+
+#  recursively yield every regular file path and
+#  its stat result in the given directories
+def walk_files(skip_file_name, directories, ignored_dirs):
+    """ Walks the directories with os.scandir
+
+    Ignored directories are pruned before they are entered and
+    file types come from the directory entries, so only regular
+    files cost a stat call.
+    """
+
+    for files in walk_directories(skip_file_name, ignored_dirs, new_walk_state(directories)):
+        yield from files
 
 
 def create_new_baseline(baseline_path, curFile):
@@ -85,7 +258,8 @@ def create_new_baseline(baseline_path, curFile):
     timestamp = utils.get_timestamp(True)
 
     print("Creating new baseline in CWD...")
-    file_name = "baseline_" + timestamp + ".txt"
+    extension = "db" if config.get("PT_BASELINE_FORMAT") == "sqlite" else "txt"
+    file_name = f"baseline_{timestamp}.{extension}"
     file_path = os.path.join(baseline_path, file_name)
 
     #  Ensure the baseline path exists
@@ -97,14 +271,42 @@ def create_new_baseline(baseline_path, curFile):
     #  if so throw an error
     try:
         if os.path.isdir(baseline_path):
-            with open(file_path, "a") as f:
-                contents = list_files_recursively(
-                    directories=config.get("PT_MONITOR_DIRS"),
-                    ignored_dirs=config.get("PT_IGNORED_DIRS"),
-                    skip_file_name=curFile,
+            algorithm = config.get("PT_HASH_ALGORITHM")
+
+            # A baseline from earlier today is appended to
+            if os.path.exists(file_path) and get_baseline_algorithm(file_path) != algorithm:
+                raise ValueError(
+                    f"Baseline '{file_path}' uses {get_baseline_algorithm(file_path)}, not {algorithm}."
                 )
-                for value in contents:
-                    f.write(str(value) + "\n")
+
+            if os.path.exists(get_checkpoint_file(file_path)):
+                raise ValueError(f"Baseline '{file_path}' was interrupted, finish it with --resume.")
+
+            if extension == "db":
+                store = SQLiteBaseline.open(file_path)
+                store.algorithm = algorithm
+                offset = None
+            else:
+                is_new_file = not os.path.exists(file_path)
+
+                with open(file_path, "a", encoding="utf-8") as f:
+                    if is_new_file:
+                        f.write(format_baseline_header("utf-8", algorithm))
+
+                    offset = f.tell()
+
+            directories = config.get("PT_MONITOR_DIRS")
+
+            build_baseline(file_path, {
+                "baseline": os.path.abspath(file_path),
+                "directories": directories,
+                "ignored_dirs": config.get("PT_IGNORED_DIRS"),
+                "skip_file_name": curFile,
+                "walk": new_walk_state(directories),
+                "offset": offset,
+                "files": 0,
+                "bytes": 0,
+            })
 
             print("baseline file created!")
 
@@ -114,6 +316,364 @@ def create_new_baseline(baseline_path, curFile):
         print("error: ", e)
 
 
+def resume_baseline(checkpoint_file=None):
+    """ Finishes the baseline of a checkpoint, the latest one by default """
+
+    if checkpoint_file is None:
+        checkpoint_files = find_checkpoints(config.get("PT_BASELINE_PATH"))
+
+        if not checkpoint_files:
+            raise ValueError(f"No interrupted baseline found in '{config.get('PT_BASELINE_PATH')}'.")
+
+        checkpoint_file = checkpoint_files[0]
+
+    checkpoint = load_checkpoint(checkpoint_file)
+    file_path = checkpoint["baseline"]
+
+    print(f"Resuming '{file_path}' after {checkpoint['files']:,} files ({utils.format_size(checkpoint['bytes'])}).")
+
+    # Drop the records written after the checkpoint, their
+    # directories are still left to walk
+    if checkpoint["offset"] is not None:
+        with open(file_path, "r+b") as f:
+            f.truncate(checkpoint["offset"])
+
+    build_baseline(file_path, checkpoint)
+
+    print("baseline file created!")
+
+    return file_path
+
+
+def build_baseline(file_path, checkpoint):
+    """ Hashes the files left in a checkpoint's walk into a baseline
+
+    Records are written a chunk of directories at a time and the
+    checkpoint is saved every PT_CHECKPOINT_INTERVAL seconds once
+    they are on disk, so an interrupted baseline only loses the
+    files hashed since. SQLite baselines replace records that are
+    hashed again, text baselines are truncated to the offset of
+    the checkpoint when resumed.
+    """
+
+    checkpoint_file = get_checkpoint_file(file_path)
+    interval = float(config.get("PT_CHECKPOINT_INTERVAL") or 0)
+
+    skip_file_name = checkpoint["skip_file_name"]
+    ignored_dirs = checkpoint["ignored_dirs"]
+    walk = checkpoint["walk"]
+
+    progress = Progress(
+        checkpoint["files"],
+        checkpoint["bytes"],
+        float(config.get("PT_PROGRESS_INTERVAL") or 0),
+        walk=walk,
+    )
+
+    if int(config.get("PT_PROGRESS_COUNT") or 0):
+        progress.count_remaining(lambda: walk_directories(skip_file_name, ignored_dirs, copy.deepcopy(walk)))
+
+    def chunks():
+        chunk = []
+
+        for files in walk_directories(skip_file_name, ignored_dirs, walk):
+            chunk.extend(files)
+
+            if len(chunk) >= CHUNK_FILES:
+                yield chunk
+                chunk = []
+
+        yield chunk
+
+    is_sqlite = file_path.endswith(".db")
+    algorithm = get_baseline_algorithm(file_path)
+
+    store = SQLiteBaseline.open(file_path) if is_sqlite else None
+    text_file = None if is_sqlite else open(file_path, "a", encoding="utf-8")
+
+    # Saved right away so even the first chunk can be resumed
+    save_checkpoint(checkpoint_file, checkpoint)
+    checkpointed = time.monotonic()
+
+    try:
+        with create_hash_pool(algorithm) as hash_pool:
+            # The walk state is that of the end of each chunk while it is handled
+            for chunk in chunks():
+                records = ((path, record) for path, _, record in hash_records(chunk, None, hash_pool))
+
+                if is_sqlite:
+                    store.set_many(records)
+                else:
+                    text_file.writelines(format_baseline_line(path, record) for path, record in records)
+
+                progress.add(len(chunk), sum(file_stat.st_size for _, file_stat in chunk))
+
+                if interval and time.monotonic() - checkpointed >= interval and (walk["pending"] or walk["roots"]):
+                    if text_file is not None:
+                        text_file.flush()
+                        os.fsync(text_file.fileno())
+                        checkpoint["offset"] = text_file.tell()
+
+                    checkpoint.update(files=progress.files, bytes=progress.bytes)
+                    save_checkpoint(checkpoint_file, checkpoint)
+
+                    checkpointed = time.monotonic()
+
+    finally:
+        if text_file is not None:
+            text_file.close()
+
+    progress.finish()
+
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+
+    record_directory_digests(file_path)
+
+
+def get_digests_file(baseline_file) -> str:
+    """ Returns the directory digests file of a text baseline """
+    return os.path.splitext(baseline_file)[0] + ".merkle"
+
+
+def record_directory_digests(baseline_file):
+    """ Records the Merkle digest of every directory in a baseline
+
+    Digests are computed from the records streamed in path order,
+    so memory stays bounded whatever the size of the baseline.
+    """
+
+    if baseline_file.endswith(".db"):
+        digests = compute_digests(sorted_records(baseline_file))
+        SQLiteBaseline.open(baseline_file).set_directory_digests(digests)
+    else:
+        baseline_size = os.path.getsize(baseline_file)
+        digests = compute_digests(sorted_records(baseline_file, get_baseline_encoding(baseline_file)))
+
+        with open(get_digests_file(baseline_file), "w", encoding="utf-8", errors="surrogateescape") as f:
+            f.writelines(format_digest_lines(digests, baseline_size))
+
+    return digests
+
+
+def get_directory_digests(baseline_file) -> dict:
+    """ Returns the recorded directory digests of a baseline
+
+    They are computed again when the baseline changed since, which
+    for text baselines shows as a different size as they only grow
+    until compacted.
+    """
+
+    digests = None
+
+    if baseline_file.endswith(".db"):
+        digests = SQLiteBaseline.open(baseline_file).get_directory_digests()
+    elif os.path.exists(get_digests_file(baseline_file)):
+        recorded, baseline_size = read_digest_lines(get_digests_file(baseline_file))
+        if baseline_size == os.path.getsize(baseline_file):
+            digests = recorded
+
+    if digests is None:
+        digests = compute_digests(sorted_records(baseline_file, get_baseline_encoding(baseline_file)))
+
+    return digests
+
+
+def select_files(records, directories, subtrees) -> dict:
+    """ Returns the {path: hash} of the records directly in `directories` or below `subtrees`
+
+    Later records of a path supersede earlier ones, as in a text baseline.
+    """
+
+    directories = set(directories)
+    prefixes = tuple(os.path.join(directory, "") for directory in subtrees)
+
+    files = {}
+
+    for file_path, record in records:
+        if os.path.dirname(file_path) in directories or (prefixes and file_path.startswith(prefixes)):
+            if record.file_hash == TOMBSTONE:
+                files.pop(file_path, None)
+            else:
+                files[file_path] = record.file_hash
+
+    return files
+
+
+def load_digest_tree(baseline_file) -> DigestTree:
+    """ Returns the digest tree of a baseline, reading its files on demand
+
+    SQLite baselines seek to the files of each directory asked
+    for. Text baselines are read in one pass that keeps only them.
+    """
+
+    digests = get_directory_digests(baseline_file)
+
+    if not baseline_file.endswith(".db"):
+        encoding = get_baseline_encoding(baseline_file)
+
+        return DigestTree(
+            digests,
+            lambda directories, subtrees: select_files(
+                read_baseline_lines(baseline_file, encoding), directories, subtrees
+            ),
+        )
+
+    store = SQLiteBaseline.open(baseline_file)
+
+    def load_files(directories, subtrees):
+        files = {}
+
+        for directory in directories:
+            files.update((file_path, record.file_hash) for file_path, record in store.items_in(directory))
+
+        for directory in subtrees:
+            files.update((file_path, record.file_hash) for file_path, record in store.items_under(directory))
+
+        return files
+
+    return DigestTree(digests, load_files)
+
+
+def scan_records(baseline, skip_file_name, directories, ignored_dirs):
+    """ Yields the live (path, record) pairs of the given directories
+
+    Files whose stat data matches the baseline reuse its hash.
+    """
+
+    changed_files = []
+
+    for file_path, file_stat in walk_files(skip_file_name, directories, ignored_dirs):
+        record = baseline.get(file_path)
+
+        if record is not None and record.matches_stat(file_stat):
+            yield file_path, record
+        else:
+            changed_files.append((file_path, file_stat))
+
+    with create_hash_pool(baseline.algorithm) as hash_pool:
+        for file_path, _, record in hash_records(changed_files, baseline, hash_pool):
+            yield file_path, record
+
+
+def compare_baselines(baseline_file, other_file=None, curFile=None):
+    """ Prints the files that differ between two baselines
+
+    Without a second baseline the first is compared with a live
+    scan of the monitored directories. Directories are compared by
+    their recorded digests top-down, and only the files of those
+    that differ are read from the baselines.
+    """
+
+    if other_file:
+        check_same_algorithm(baseline_file, other_file)
+
+    tree = load_digest_tree(baseline_file)
+
+    if other_file:
+        other = load_digest_tree(other_file)
+    else:
+        # The live side is stat'ed in full, only the baseline side is skipped
+        files = dict(scan_records(
+            open_baseline(baseline_file),
+            skip_file_name=curFile,
+            directories=config.get("PT_MONITOR_DIRS"),
+            ignored_dirs=config.get("PT_IGNORED_DIRS"),
+        ))
+        other = DigestTree(
+            compute_digests(sorted(files.items())),
+            lambda directories, subtrees: select_files(files.items(), directories, subtrees),
+        )
+
+    differences = 0
+
+    for status, file_path in diff_trees(tree, other):
+        differences += 1
+        print(f"{status}: {file_path}")
+
+    print(f"{differences} difference(s) found.")
+
+    return differences
+
+
+def diff_baselines(old_file, new_file):
+    """ Prints the added, removed and changed files between two baselines
+
+    Streams both baselines sorted by path with bounded memory.
+    """
+
+    check_same_algorithm(old_file, new_file)
+
+    chunk_records = int(config.get("PT_SORT_CHUNK_RECORDS"))
+    counts = {"added": 0, "removed": 0, "changed": 0}
+
+    old_records = sorted_records(old_file, get_baseline_encoding(old_file), chunk_records)
+    new_records = sorted_records(new_file, get_baseline_encoding(new_file), chunk_records)
+
+    for status, file_path, old_record, new_record in diff_sorted(old_records, new_records):
+        counts[status] += 1
+
+        if status == "changed":
+            print(f"changed: {file_path} ({old_record.file_hash} -> {new_record.file_hash})")
+        else:
+            print(f"{status}: {file_path}")
+
+    print(", ".join(f"{count} {status}" for status, count in counts.items()))
+
+    return counts
+
+
+def compact_baseline(baseline_file):
+    """ Collapses a baseline to the latest entry of every path """
+
+    if baseline_file.endswith(".db"):
+        SQLiteBaseline.open(baseline_file).compact()
+        print(f"Compacted '{baseline_file}'.")
+        return
+
+    entries = compact_text_baseline(
+        baseline_file,
+        get_baseline_encoding(baseline_file),
+        int(config.get("PT_SORT_CHUNK_RECORDS")),
+    )
+
+    print(f"Compacted '{baseline_file}' to {entries} entries.")
+
+
+def get_baseline_algorithm(baseline_file) -> str:
+    """ Returns the hash algorithm a baseline was created with """
+
+    if baseline_file.endswith(".db"):
+        return SQLiteBaseline.open(baseline_file).algorithm
+
+    return read_baseline_header(baseline_file).get("algorithm", DEFAULT_ALGORITHM)
+
+
+def check_same_algorithm(baseline_file, other_file):
+    """ Ensures two baselines hold comparable hashes """
+
+    algorithm = get_baseline_algorithm(baseline_file)
+    other_algorithm = get_baseline_algorithm(other_file)
+
+    if algorithm != other_algorithm:
+        raise ValueError(
+            f"Cannot compare a {algorithm} baseline with a {other_algorithm} baseline."
+        )
+
+
+def get_baseline_encoding(baseline_file):
+    """ Returns the encoding of a text baseline
+
+    Uses the encoding declared in the header, falling back to
+    detecting it from the start of legacy baselines.
+    """
+
+    if baseline_file.endswith(".db"):
+        return None
+
+    return read_baseline_header(baseline_file).get("encoding") or utils.get_file_encoding(baseline_file)
+
+
 # Returns existing baselines
 def get_baseline_files():
     try:
@@ -123,6 +683,8 @@ def get_baseline_files():
             for f in files:
                 if utils.is_valid_baseline_file(f):
                     existing_baseline_files.append(os.path.join(root, f))
+                elif f.endswith(("-wal", "-shm", ".merkle", CHECKPOINT_SUFFIX, LOCK_SUFFIX)):
+                    continue  # SQLite journal, directory digest, checkpoint and lock files
                 else:
                     utils.verbose_print(f"Invalid baseline file, '{f}', detected!")
 
@@ -142,6 +704,8 @@ def selected_baseline_file() -> str:
         return existing_baseline_files[0]
 
     else:
+        import enquiries  # Only the interactive mode needs it
+
         selected_baseline = enquiries.choose(
             "Select a baseline: ", existing_baseline_files
         )
@@ -149,28 +713,29 @@ def selected_baseline_file() -> str:
         return selected_baseline
 
 
-#  Use the existing baseline or display a menu
-#  to choose from existing ones before monitoring begins
-def load_baseline(curFile, message_queue):
-    try:
-        selected_baseline = selected_baseline_file()
-        config.set("SELECTED_BASELINE_FILE", selected_baseline)
+def open_baseline(baseline_file):
+    """ Opens a baseline file as the store owned by the monitor """
 
-        encoding = utils.get_file_encoding(selected_baseline)
+    # SQLite baselines are queried lazily
+    if baseline_file.endswith(".db"):
+        return SQLiteBaseline.open(baseline_file)
 
-        with open(selected_baseline, "r", encoding=encoding) as file:
-            for file_line in file:
-                fields = file_line.split("|")
+    started = time.perf_counter()
 
-                key = fields[0].strip()
-                value = fields[1].strip()
+    # In-memory baseline owned by the monitor
+    baseline = load_text_baseline(baseline_file, get_baseline_encoding(baseline_file))
 
-                l_baseline = json.loads(config.get("PT_LOADED_BASELINE"))
-                l_baseline[key] = value
-                config.set("PT_LOADED_BASELINE", json.dumps(l_baseline))
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    print(f"Loaded {len(baseline)} baseline entries in {elapsed:.2f}s ({len(baseline) / elapsed:,.0f} entries/sec).")
 
-        file.close()
-        time.sleep(3)
+    return baseline
+
+
+#  Use the existing baseline or display a menu
+#  to choose from existing ones before monitoring begins
+def load_baseline(curFile, message_queue):
+    try:
+        selected_baseline = selected_baseline_file()
 
         # Display the absolute path of the directories being monitored
         directories = json.dumps(config.get("PT_MONITOR_DIRS")).split(",")
@@ -190,27 +755,79 @@ def load_baseline(curFile, message_queue):
             f"{utils.divider}\r\nNow monitoring integrity of file(s) on host {hostname} in directories: \r\n\r\n{directories}\r\n{utils.divider}\r\n"
         )
 
-        threading.Thread(
-            target=log_listener.message_daemon, args=(message_queue,), daemon=True
-        ).start()
-
-        """ MONITORING """
-        threading.Thread(
-            target=workers.start_monitoring_worker(
-                message_queue=message_queue, curFile=curFile
-            ),
-            daemon=False,
-        ).start()
+        start_monitoring(selected_baseline, curFile, message_queue)
 
     except Exception as e:
         print("Failed loading baseline: ", e)
         raise
 
 
+def start_monitoring(baseline_file, curFile, message_queue) -> threading.Thread:
+    """ Starts the message daemon and the monitoring worker
+
+    Returns the monitoring thread, which runs until the
+    workers are shut down.
+    """
+
+    config.set("SELECTED_BASELINE_FILE", baseline_file)
+
+    baseline = open_baseline(baseline_file)
+
+    metrics.start_exporters(config)
+
+    threading.Thread(
+        target=log_listener.message_daemon, args=(message_queue,), daemon=True
+    ).start()
+
+    """ MONITORING """
+    monitoring_worker = workers.start_monitoring_worker
+
+    if config.get_option("watch"):
+        if inotify.is_supported():
+            monitoring_worker = workers.start_watching_worker
+        else:
+            print("inotify is not available on this platform, polling instead.")
+
+    monitoring_thread = threading.Thread(
+        target=monitoring_worker,
+        kwargs={
+            "message_queue": message_queue,
+            "curFile": curFile,
+            "baseline": baseline,
+        },
+        daemon=False,
+    )
+    monitoring_thread.start()
+
+    return monitoring_thread
+
+
+def import_baseline(text_path) -> str:
+    """ Converts a text baseline into an SQLite baseline next to it """
+
+    db_path = os.path.splitext(text_path)[0] + ".db"
+    import_text_baseline(text_path, db_path, get_baseline_encoding(text_path)).close()
+    print(f"Imported '{text_path}' into '{db_path}'.")
+
+    return db_path
+
+
+def export_baseline(db_path) -> str:
+    """ Converts an SQLite baseline into a text baseline next to it """
+
+    text_path = os.path.splitext(db_path)[0] + ".txt"
+
+    export_text_baseline(db_path, text_path)
+    SQLiteBaseline.open(db_path).close()
+    print(f"Exported '{db_path}' to '{text_path}'.")
+
+    return text_path
+
+
 def is_valid_directory(path):
     """Check whether the specified path is a valid directory"""
     path = os.path.expanduser(path)
-    if os.path.isdir(path) and path not in config.get("PT_IGNORED_DIRS"):
+    if os.path.isdir(path) and not is_ignored_dir(path, config.get("PT_IGNORED_DIRS")):
         return path
     else:
         raise argparse.ArgumentTypeError(f"'{path}' is not a valid directory")
@@ -0,0 +1,344 @@
+import os
+import mmap
+import time
+import hashlib
+import threading
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+
+# Kept free of project imports so process pool
+# workers can import it cheaply
+
+DEFAULT_ALGORITHM = "sha256"
+
+# Per-thread read buffers
+_buffers = threading.local()
+
+# Size of the reused read buffer
+DEFAULT_BUFFER_SIZE = 1 << 20
+
+# Blocks sampled between the head and tail of a
+# fingerprinted file and the size of each block
+DEFAULT_FINGERPRINT_BLOCKS = 8
+DEFAULT_FINGERPRINT_BLOCK_SIZE = 1 << 16
+
+# Files timed for the duration histogram, one in every N
+DEFAULT_SAMPLE_EVERY = 16
+
+# Algorithms provided by hashlib
+_HASHLIB_ALGORITHMS = ("sha256", "sha512", "blake2b", "blake2s", "sha3_256")
+
+# Optional algorithms and the package providing them
+_OPTIONAL_ALGORITHMS = {
+    "blake3": "blake3",
+    "xxh64": "xxhash",
+    "xxh3_64": "xxhash",
+    "xxh3_128": "xxhash",
+}
+
+
+def new_hash(hash_algorithm):
+    """ Returns a new hash object of the specified algorithm
+
+    Raises ValueError for unknown algorithms or ones whose
+    optional package is not installed.
+    """
+
+    if hash_algorithm in _HASHLIB_ALGORITHMS:
+        return hashlib.new(hash_algorithm)
+
+    package = _OPTIONAL_ALGORITHMS.get(hash_algorithm)
+    if package is None:
+        raise ValueError(f"Unsupported hash algorithm '{hash_algorithm}'.")
+
+    try:
+        module = __import__(package)
+    except ImportError:
+        raise ValueError(
+            f"Hash algorithm '{hash_algorithm}' requires the '{package}' package."
+        ) from None
+
+    return getattr(module, hash_algorithm)()
+
+
+def available_algorithms() -> list:
+    """ Returns the algorithms usable on this host """
+
+    algorithms = list(_HASHLIB_ALGORITHMS)
+
+    for algorithm in _OPTIONAL_ALGORITHMS:
+        try:
+            new_hash(algorithm)
+        except ValueError:
+            continue
+        algorithms.append(algorithm)
+
+    return algorithms
+
+
+def supported_algorithms() -> list:
+    """ Returns every algorithm, including optional ones """
+    return [*_HASHLIB_ALGORITHMS, *_OPTIONAL_ALGORITHMS]
+
+
+def _get_buffer(buffer_size) -> memoryview:
+    """ Returns this thread's read buffer, reused across files """
+
+    view = getattr(_buffers, "view", None)
+
+    if view is None or len(view) < buffer_size:
+        view = _buffers.view = memoryview(bytearray(buffer_size))
+
+    return view[:buffer_size]
+
+
+#  Calculate and return the hash of a file
+def calc_file_hash(
+    file_path,
+    hash_algorithm=DEFAULT_ALGORITHM,
+    buffer_size=DEFAULT_BUFFER_SIZE,
+    mmap_threshold=0,
+):
+    """ Hashes a file through a reused per-thread buffer
+
+    Files of at least mmap_threshold bytes are mapped instead,
+    0 disables mapping. A file truncated while it is mapped
+    raises SIGBUS, so only map files that are not rewritten in place.
+    """
+
+    try:
+        hash_object = new_hash(hash_algorithm)
+
+        # Unbuffered so reads land straight in our buffer
+        with open(file_path, "rb", buffering=0) as file:
+            size = os.fstat(file.fileno()).st_size
+
+            if mmap_threshold and size >= mmap_threshold:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    hash_object.update(mapped)
+
+            else:
+                view = _get_buffer(buffer_size)
+
+                while True:
+                    read = file.readinto(view)
+                    if not read:
+                        break
+                    hash_object.update(view[:read])
+
+        return hash_object.hexdigest().strip()
+
+    except (ValueError, OSError) as e:
+        print(f"Failed calculating hash for {file_path}. Error: {e}")
+
+
+def fingerprint_offsets(size, blocks=DEFAULT_FINGERPRINT_BLOCKS, block_size=DEFAULT_FINGERPRINT_BLOCK_SIZE):
+    """ Returns the offsets of the blocks a fingerprint reads
+
+    The head, the tail and `blocks` evenly spaced blocks in
+    between. Small files are read whole.
+    """
+
+    if size <= (blocks + 2) * block_size:
+        return list(range(0, size, block_size))
+
+    last = size - block_size
+
+    return [0, *(last * i // (blocks + 1) for i in range(1, blocks + 1)), last]
+
+
+def calc_file_fingerprint(
+    file_path,
+    hash_algorithm=DEFAULT_ALGORITHM,
+    blocks=DEFAULT_FINGERPRINT_BLOCKS,
+    block_size=DEFAULT_FINGERPRINT_BLOCK_SIZE,
+):
+    """ Hashes the size and sampled blocks of a file
+
+    Far cheaper than a full hash on large files but blind to
+    changes outside the sampled blocks that keep the size.
+    """
+
+    try:
+        hash_object = new_hash(hash_algorithm)
+
+        with open(file_path, "rb", buffering=0) as file:
+            size = os.fstat(file.fileno()).st_size
+            hash_object.update(size.to_bytes(8, "little"))
+
+            view = _get_buffer(block_size)
+
+            for offset in fingerprint_offsets(size, blocks, block_size):
+                file.seek(offset)
+                read = file.readinto(view)
+                hash_object.update(view[:read])
+
+        return hash_object.hexdigest().strip()
+
+    except (ValueError, OSError) as e:
+        print(f"Failed calculating fingerprint for {file_path}. Error: {e}")
+
+
+def _timed_call(function, file_path, *options):
+    """ Returns what function returns and the seconds it took """
+
+    started = time.perf_counter()
+    result = function(file_path, *options)
+
+    return result, time.perf_counter() - started
+
+
+def default_workers() -> int:
+    """ Returns the default number of hashing workers """
+    return os.cpu_count() or 1
+
+
+class HashPool:
+    """ Hashes files concurrently on a pool of workers
+
+    Threads are used by default since hashlib releases the GIL
+    while hashing. A process pool is available for algorithms
+    that hold the GIL. Files of at least `fingerprint_threshold`
+    bytes are fingerprinted first, 0 always hashes files fully.
+    `observe_durations`, when given, is called with the seconds
+    taken by one file in every `sample_every` once a batch of
+    entries is done. Timing every file would cost more than
+    hashing small ones is worth on hosts with slow clocks.
+    """
+
+    executors = {"thread": ThreadPoolExecutor, "process": ProcessPoolExecutor}
+
+    def __init__(
+        self,
+        workers=None,
+        executor="thread",
+        hash_algorithm=DEFAULT_ALGORITHM,
+        buffer_size=DEFAULT_BUFFER_SIZE,
+        mmap_threshold=0,
+        fingerprint_threshold=0,
+        fingerprint_blocks=DEFAULT_FINGERPRINT_BLOCKS,
+        fingerprint_block_size=DEFAULT_FINGERPRINT_BLOCK_SIZE,
+        observe_durations=None,
+        sample_every=DEFAULT_SAMPLE_EVERY,
+    ):
+        if executor not in self.executors:
+            raise ValueError(f"Unknown hash executor '{executor}'.")
+
+        # Fail early on unavailable algorithms
+        new_hash(hash_algorithm)
+
+        self.workers = max(1, int(workers or default_workers()))
+        self.hash_algorithm = hash_algorithm
+        self.hash_options = (hash_algorithm, int(buffer_size), int(mmap_threshold))
+
+        self.fingerprint_threshold = int(fingerprint_threshold or 0)
+        self.fingerprint_options = (hash_algorithm, int(fingerprint_blocks), int(fingerprint_block_size))
+
+        # Hash inline when there is only one worker
+        self._executor = None
+        if self.workers > 1:
+            self._executor = self.executors[executor](max_workers=self.workers)
+
+        # Maximum number of hashes in flight
+        self._window = self.workers * 4
+
+        self.observe_durations = observe_durations
+        self.sample_every = max(1, int(sample_every))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def is_large(self, size) -> bool:
+        """ Checks whether a file of the specified size is fingerprinted """
+        return 0 < self.fingerprint_threshold <= size
+
+    def read_size(self, size) -> int:
+        """ Returns how many bytes checking a file of the specified size reads """
+
+        if not self.is_large(size):
+            return size
+
+        _, blocks, block_size = self.fingerprint_options
+
+        return min(size, (blocks + 2) * block_size)
+
+    def hash_files(self, entries):
+        """ Hashes the path of each (path, ...) entry
+
+        Yields (entry, hash) pairs in completion order while
+        keeping a bounded number of hashes in flight.
+        """
+
+        return self._map(calc_file_hash, self.hash_options, entries)
+
+    def fingerprint_files(self, entries):
+        """ Fingerprints the path of each (path, ...) entry
+
+        Yields (entry, fingerprint) pairs in completion order.
+        """
+
+        return self._map(calc_file_fingerprint, self.fingerprint_options, entries)
+
+    def _map(self, function, options, entries):
+        # Indexes of the entries timed, none without an observer
+        sample_every = self.sample_every if self.observe_durations is not None else 0
+        durations = []
+
+        try:
+            if self._executor is None:
+                for index, entry in enumerate(entries):
+                    if sample_every and not index % sample_every:
+                        result, seconds = _timed_call(function, entry[0], *options)
+                        durations.append(seconds)
+                    else:
+                        result = function(entry[0], *options)
+
+                    yield entry, result
+                return
+
+            pending = {}
+
+            for index, entry in enumerate(entries):
+                timed = sample_every and not index % sample_every
+
+                if timed:
+                    future = self._executor.submit(_timed_call, function, entry[0], *options)
+                else:
+                    future = self._executor.submit(function, entry[0], *options)
+
+                pending[future] = entry, timed
+
+                if len(pending) >= self._window:
+                    yield from self._drain(pending, durations)
+
+            while pending:
+                yield from self._drain(pending, durations)
+
+        finally:
+            if durations:
+                self.observe_durations(durations)
+
+    def _drain(self, pending, durations):
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            entry, timed = pending.pop(future)
+            result = future.result()
+
+            if timed:
+                result, seconds = result
+                durations.append(seconds)
+
+            yield entry, result
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
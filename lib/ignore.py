@@ -0,0 +1,161 @@
+import os
+import re
+from functools import lru_cache
+
+
+def _translate(pattern) -> str:
+    """ Translates a gitignore-style glob into a regular expression
+
+    '*' and '?' stop at '/', '**' spans directories and
+    '[...]' classes may be negated with '!'.
+    """
+
+    i, n = 0, len(pattern)
+    parts = []
+
+    while i < n:
+        c = pattern[i]
+
+        if c == "*":
+            if pattern.startswith("**/", i):
+                # Zero or more directories
+                parts.append("(?:.*/)?")
+                i += 3
+                continue
+
+            if pattern.startswith("**", i):
+                parts.append(".*")
+                i += 2
+                continue
+
+            parts.append("[^/]*")
+
+        elif c == "?":
+            parts.append("[^/]")
+
+        elif c == "[":
+            # A ']' right after the bracket is literal
+            end = pattern.find("]", i + 2)
+            if end == -1:
+                parts.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end].replace("\\", "\\\\")
+                if body[0] in "!^":
+                    body = "^" + body[1:]
+
+                parts.append(f"[{body}]")
+                i = end + 1
+                continue
+
+        else:
+            parts.append(re.escape(c))
+
+        i += 1
+
+    return "".join(parts)
+
+
+class IgnoreRules:
+    """ Ignore patterns compiled into a few regular expressions
+
+    Patterns follow gitignore globbing and are matched against
+    absolute paths:
+
+    - a trailing '/' only matches directories
+    - a leading '!' re-includes what an earlier pattern ignored
+    - absolute patterns and ones starting with '.', '..' or '~'
+      are resolved to a path, anything else matches at any depth
+    """
+
+    def __init__(self, patterns=()):
+        self.patterns = [p.strip() for p in patterns if p.strip() and not p.strip().startswith("#")]
+
+        rules = {"any": [], "dirs": [], "negated": []}
+
+        for pattern in self.patterns:
+            negated = pattern.startswith("!")
+            if negated:
+                pattern = pattern[1:]
+
+            dir_only = len(pattern) > 1 and pattern.endswith("/")
+            pattern = pattern.rstrip("/") or "/"
+
+            if pattern in (".", "..") or pattern.startswith(("./", "../", "~")):
+                pattern = os.path.abspath(os.path.expanduser(pattern))
+
+            if os.sep != "/":
+                pattern = pattern.replace(os.sep, "/")
+
+            # Relative patterns match any trailing components
+            regex = _translate(pattern) if pattern.startswith("/") else "(?:.*/)?" + _translate(pattern)
+
+            if negated:
+                rules["negated"].append(regex)
+            else:
+                rules["dirs" if dir_only else "any"].append(regex)
+
+        self._any = self._compile(rules["any"])
+        self._dirs = self._compile(rules["dirs"])
+        self._negated = self._compile(rules["negated"])
+
+        # Whatever lies below an ignored directory
+        self._any_below = self._compile(rules["any"], "(?:/.*)?")
+        self._dirs_below = self._compile(rules["dirs"], "/.*")
+
+    @staticmethod
+    def _compile(regexes, suffix=""):
+        if not regexes:
+            return None
+
+        return re.compile("|".join(f"(?:{regex}){suffix}" for regex in regexes), re.DOTALL)
+
+    def __bool__(self):
+        return bool(self.patterns)
+
+    def is_ignored(self, path, is_dir=False) -> bool:
+        """ Checks whether the path itself matches the patterns
+
+        Used by walkers that never descend into ignored directories.
+        """
+
+        if os.sep != "/":
+            path = path.replace(os.sep, "/")
+
+        matched = (
+            (self._any is not None and self._any.fullmatch(path))
+            or (is_dir and self._dirs is not None and self._dirs.fullmatch(path))
+        )
+
+        return bool(matched) and not (self._negated is not None and self._negated.fullmatch(path))
+
+    def is_ignored_path(self, path, is_dir=False) -> bool:
+        """ Checks whether the path or any of its parents is ignored """
+
+        if self.is_ignored(path, is_dir):
+            return True
+
+        if os.sep != "/":
+            path = path.replace(os.sep, "/")
+
+        matched = (
+            (self._any_below is not None and self._any_below.fullmatch(path))
+            or (self._dirs_below is not None and self._dirs_below.fullmatch(path))
+        )
+
+        return bool(matched) and not (self._negated is not None and self._negated.fullmatch(path))
+
+
+@lru_cache(maxsize=16)
+def parse_ignore_rules(spec) -> IgnoreRules:
+    """ Compiles a comma separated list of patterns once """
+    return IgnoreRules(spec.split(","))
+
+
+def read_ignore_file(file_path) -> list:
+    """ Returns the patterns of a gitignore-style file """
+
+    with open(file_path, "r", encoding="utf-8") as file:
+        return [
+            line.strip() for line in file
+            if line.strip() and not line.lstrip().startswith("#")
+        ]
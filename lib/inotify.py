@@ -0,0 +1,223 @@
+import os
+import sys
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+# Event masks, see inotify(7)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+# Events a watched directory is registered for
+WATCH_MASK = (
+    IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_CREATE
+    | IN_DELETE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+_libc = None
+
+
+def _get_libc():
+    global _libc
+
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        _libc.inotify_init1.argtypes = [ctypes.c_int]
+        _libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        _libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+
+    return _libc
+
+
+def is_supported() -> bool:
+    """ Checks whether inotify is available on this platform """
+
+    if not sys.platform.startswith("linux"):
+        return False
+
+    try:
+        return hasattr(_get_libc(), "inotify_init1")
+    except OSError:
+        return False
+
+
+def _raise_errno(path=None):
+    err = ctypes.get_errno()
+    raise OSError(err, os.strerror(err), path)
+
+
+class Inotify:
+    """ Thin wrapper around an inotify file descriptor """
+
+    def __init__(self):
+        self._libc = _get_libc()
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+
+        if self.fd < 0:
+            _raise_errno()
+
+    def add_watch(self, path: str, mask: int = WATCH_MASK) -> int:
+        """ Watches the specified path and returns its watch descriptor
+
+        Raises OSError with ENOSPC once the watch limit is exhausted.
+        """
+
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+
+        if wd < 0:
+            _raise_errno(path)
+
+        return wd
+
+    def rm_watch(self, wd: int):
+        # The kernel may already have dropped it
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self, timeout=None) -> list:
+        """ Returns the pending (wd, mask, cookie, name) events
+
+        Waits up to timeout seconds for the first event.
+        """
+
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+
+        events = []
+
+        while True:
+            try:
+                buffer = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, cookie, length = _EVENT_HEADER.unpack_from(buffer, offset)
+                offset += _EVENT_HEADER.size
+
+                name = buffer[offset:offset + length].rstrip(b"\0")
+                offset += length
+
+                events.append((wd, mask, cookie, os.fsdecode(name)))
+
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class TreeWatcher:
+    """ Watches every directory of one or more trees
+
+    Directories that can't be watched because the watch limit
+    is exhausted are tracked as unwatched so the caller can
+    rescan them instead.
+    """
+
+    def __init__(self, is_ignored_dir=None):
+        self.inotify = Inotify()
+
+        # Watch descriptor to directory and back
+        self.directories: dict = {}
+        self.descriptors: dict = {}
+
+        # Subtrees that must be rescanned by polling
+        self.unwatched: set = set()
+
+        self._is_ignored_dir = is_ignored_dir or (lambda directory: False)
+
+    def watch_tree(self, root: str):
+        """ Recursively watches a directory and its subdirectories """
+
+        for directory, subdirectories, _ in os.walk(root):
+            if self._is_ignored_dir(directory):
+                subdirectories[:] = []
+                continue
+
+            if not self._watch(directory):
+                # Stop descending, the whole subtree is polled
+                subdirectories[:] = []
+
+    def unwatch_tree(self, root: str):
+        """ Stops watching a directory and its subdirectories """
+
+        prefix = os.path.join(root, "")
+
+        for directory in list(self.descriptors):
+            if directory == root or directory.startswith(prefix):
+                wd = self.descriptors.pop(directory)
+                self.directories.pop(wd, None)
+                self.inotify.rm_watch(wd)
+
+        self.unwatched = {
+            d for d in self.unwatched if not (d == root or d.startswith(prefix))
+        }
+
+    def _watch(self, directory) -> bool:
+        try:
+            wd = self.inotify.add_watch(directory)
+
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                self.unwatched.add(directory)
+                return False
+
+            # Directory vanished or is unreadable
+            if e.errno in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                return True
+
+            raise
+
+        self.directories[wd] = directory
+        self.descriptors[directory] = wd
+        return True
+
+    def read_events(self, timeout=None):
+        """ Yields (path, mask) pairs, path is None on queue overflow """
+
+        for wd, mask, _, name in self.inotify.read_events(timeout):
+            if mask & IN_Q_OVERFLOW:
+                yield None, mask
+                continue
+
+            directory = self.directories.get(wd)
+            if directory is None:
+                continue
+
+            if mask & IN_IGNORED:
+                self.directories.pop(wd, None)
+                self.descriptors.pop(directory, None)
+                continue
+
+            yield (os.path.join(directory, name) if name else directory), mask
+
+    def close(self):
+        self.inotify.close()
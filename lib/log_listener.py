@@ -1,66 +1,78 @@
-from os import path, getlogin, environ
-import json
+from os import path
 from .logger import log
-from .event import subscribe, post_event
+from . import metrics
+from .event import DEFAULT_MAX_CONCURRENCY, subscribe, subscribe_batch, start_dispatcher
+from .batching import coalesce_events, drain_batch
+from .digest import Digest
+from .dedup import DEFAULT_MAX_ENTRIES, DEFAULT_TTL, DedupCache
 from .utils import (
-    normalize_path,
     get_timestamp,
-    update_baseline_file,
-    get_absolute_dirname,
+    update_baseline_entries,
     verbose_print,
 )
 from config import Config
 from typing import Literal
 from termcolor import colored
-from lib.vendor import twilio as tw
+import getpass
 import platform
+import time
 
 # Get hostname
 hostname = platform.node()
 
-current_date = get_timestamp()
-log_directory = environ.get("PT_LOG_LOCATION", "./")
-log_file_name = "log_" + current_date + ".txt"
-log_path = normalize_path(log_directory + "/" + log_file_name)
-
-# Current user's name
-current_user = getlogin()
 config = Config()
 
-# Notify on Whatsapp
-def _notify(observer):
-    async def wrapper_observer(*args, **kwargs):
-        try:
-            await observer(*args)  # Normal behavior
+# Current user's name, looked up on first use
+_current_user = None
 
-            is_notify_enabled = config.get_option("notify")
-            if is_notify_enabled:
-                await tw.send_whatsapp(f"File Patrole : event on host {hostname} at {current_date}")
+# Notifications of the current window, created on first use
+_digest = None
 
-        except Exception as e:
-            print(f"NotifyWhatsappError {e}")
-            raise
+# Events already handled, created on first use
+_seen_events = None
 
-    return wrapper_observer
 
-def create_file_observer(update_function, verb=None, color=None):
+def get_current_user() -> str:
+    """ Returns the name of the user running the monitor
 
-    def observer(subject, verb=verb, color=color):
-        file_hash = subject["file_hash"]
-        file_path = get_absolute_dirname(subject["file_path"])
-        unique_key = f"{verb}_{current_date}_{file_hash}_{file_path}"
+    Unlike os.getlogin it doesn't need a controlling terminal,
+    which a daemon started by a service manager lacks.
+    """
+
+    global _current_user
+
+    if _current_user is None:
+        _current_user = getpass.getuser()
+
+    return _current_user
+
+
+def get_seen_events() -> DedupCache:
+    """ Returns the cache of events already handled """
+
+    global _seen_events
+
+    if _seen_events is None:
+        _seen_events = DedupCache(
+            max_entries=int(config.get("PT_DEDUP_MAX_ENTRIES") or DEFAULT_MAX_ENTRIES),
+            ttl=float(config.get("PT_DEDUP_TTL") or DEFAULT_TTL),
+        )
+
+    return _seen_events
 
-        last_seen = json.loads(config.get("LAST_SEEN"))
-        verbose_print(f"last_seen: {last_seen}")
 
-        # Invoke function only if the specific
-        # actions has not already been recordted today
-        if unique_key not in last_seen:
-            new_last_seen = last_seen
-            new_last_seen[file_path] = unique_key
-            config.set("LAST_SEEN", json.dumps(new_last_seen))
+def create_file_observer(update_function, verb=None, color=None):
+
+    def observer(subject, verb=verb, color=color):
+        unique_key = (verb, subject["file_path"], subject["control_hash"], subject["file_hash"])
 
+        # Invoke function only if the specific action
+        # has not already been recorded within the TTL
+        if get_seen_events().check_and_add(unique_key, verb):
             update_function(subject, verb, color)
+        else:
+            metrics.SUPPRESSED_EVENTS.inc(1, f"file_{verb}")
+            verbose_print(f"Suppressed repeated {verb} event of {subject['file_path']}")
 
     return observer
 
@@ -76,23 +88,70 @@ def base_file_observer(data, verb="added", color: Literal["green", "magenta", "y
         file_permission = data["file_permission"]
 
     control_hash = data["control_hash"]
+    current_user = get_current_user()
 
     description = f"The file, {file_name}, with permission {file_permission} found at {file_path} has been {verb} by {current_user}"
 
-    log(log_path, file_path, current_user, control_hash, file_hash, description, hostname,)
-    print(colored(f"[{current_date}] The file {file_name} has been {verb}! file hash: {file_hash}, control hash: {control_hash}\r\n", color,))
-    update_baseline_file(file_path, file_hash)
+    log(file_path, current_user, control_hash, file_hash, description, hostname, event=f"file_{verb}")
+    print(colored(f"[{get_timestamp()}] The file {file_name} has been {verb}! file hash: {file_hash}, control hash: {control_hash}\r\n", color,))
+
+
+def move_file_observer(data, verb="moved", color: Literal["cyan"] = "cyan"):
+    file_path = data["file_path"]
+    old_path = data["old_path"]
+    file_hash = data["file_hash"]
+    file_name = path.basename(file_path)
+    moved_files = data["moved_files"]
+    current_user = get_current_user()
+
+    if data["is_directory"]:
+        description = f"The directory, {file_name}, found at {old_path} has been {verb} to {file_path} with {len(moved_files)} files by {current_user}"
+        summary = f"The directory {file_name} has been {verb} from {old_path} with {len(moved_files)} files!"
+    else:
+        description = f"The file, {file_name}, found at {old_path} has been {verb} to {file_path} by {current_user}"
+        summary = f"The file {file_name} has been {verb} from {old_path}! file hash: {file_hash}"
+
+    log(file_path, current_user, data["control_hash"], file_hash, description, hostname, event=f"file_{verb}")
+    print(colored(f"[{get_timestamp()}] {summary}\r\n", color,))
+
+
+def persist_baseline_changes(events):
+    """ Writes the changes of a batch of events to the baseline at once """
+
+    entries = []
+
+    for event_type, data in events:
+        event_type = event_type.lower()
+
+        if event_type == "file_moved":
+            for old_path, new_path, file_hash in data["moved_files"]:
+                entries.append((old_path, None))
+                entries.append((new_path, file_hash))
+
+        elif event_type == "file_deleted":
+            entries.append((data["file_path"], None))
+
+        else:
+            entries.append((data["file_path"], data["file_hash"]))
+
+    if entries:
+        update_baseline_entries(entries)
 
 
 handle_file_added = create_file_observer(base_file_observer, verb="added", color="green")
 handle_file_copied = create_file_observer(base_file_observer, verb="copied", color="magenta")
 handle_file_modified = create_file_observer(base_file_observer, verb="modified", color="yellow")
 handle_file_deleted = create_file_observer(base_file_observer, verb="deleted", color="red")
+handle_file_moved = create_file_observer(move_file_observer, verb="moved", color="cyan")
 
 
-# Decorator to subscribe handlers to events
+# Decorator to subscribe handlers to events,
+# skipped unless notifications are enabled
 def _notify(observer):
     async def wrapper_observer(*args, **kwargs):
+        if not config.get_option("notify"):
+            return
+
         verbose_print(f"Processing {observer.__name__}...")
         await observer(*args)  # Normal behavior
         verbose_print(f"Done processing {observer.__name__}")
@@ -101,9 +160,11 @@ def _notify(observer):
 
 @_notify
 async def notify_whatsapp(*args):
+    from lib.vendor import twilio as tw  # Loads the client and .env on first use
+
     try:
         await tw.send_whatsapp(
-            f"File Patrole : event on host {hostname} at {current_date}"
+            f"File Patrole : event on host {hostname} at {get_timestamp()}"
         )
 
     except Exception as e:
@@ -113,8 +174,10 @@ async def notify_whatsapp(*args):
 
 @_notify
 async def notify_sms(*args):
+    from lib.vendor import twilio as tw  # Loads the client and .env on first use
+
     try:
-        await tw.send_sms(f"File Patrole : event on host {hostname} at {current_date}")
+        await tw.send_sms(f"File Patrole : event on host {hostname} at {get_timestamp()}")
         print("Message sent!")
 
     except Exception as e:
@@ -122,29 +185,98 @@ async def notify_sms(*args):
         raise
 
 
+def get_digest() -> Digest:
+    """ Returns the digest of WhatsApp notifications """
+
+    global _digest
+
+    if _digest is None:
+        from lib.vendor import twilio as tw  # Loads the client and .env on first use
+
+        _digest = Digest(
+            tw.send_whatsapp,
+            float(config.get("PT_NOTIFY_DIGEST_WINDOW") or 0),
+            lambda count: f"File Patrole : {count} event(s) on host {hostname} at {get_timestamp()}",
+        )
+
+    return _digest
+
+
+@_notify
+async def notify_digest(events):
+    get_digest().add(events)
+
+
+def forward_events(events):
+    """ Streams a batch of events to the collector in agent mode """
+
+    if not config.get("PT_AGENT_COLLECTOR"):
+        return
+
+    from lib.agent import event_record, get_agent  # Only agents need it
+
+    get_agent().send([event_record(event_type, data, hostname, get_current_user()) for event_type, data in events])
+
+
 # Subscribe all handlers to their respective event types
 def setup_log_event_handlers() -> None:
     subscribe("file_added", handle_file_added)
     subscribe("file_copied", handle_file_copied)
     subscribe("file_modified", handle_file_modified)
     subscribe("file_deleted", handle_file_deleted)
-    subscribe("file_added", notify_whatsapp)
+    subscribe("file_moved", handle_file_moved)
+    subscribe_batch(persist_baseline_changes)
+    subscribe_batch(notify_digest)
+    subscribe_batch(forward_events)
+
+
+def record_dispatch(events):
+    """ Counts dispatched events and how long ago they were detected """
+
+    now = time.monotonic()
+    latencies = []
+
+    for event_type, data in events:
+        metrics.EVENTS.inc(1, event_type.lower())
+        latencies.append(now - data.get("detected_at", now))
+
+    metrics.DISPATCH_LATENCY.observe_many(latencies)
 
 
 def message_daemon(_queue) -> None:
-    """Dequeues messages and invokes the appropriate handler"""
-    try:
-        while True:
-            items = _queue.get()
+    """Dequeues messages in batches and hands them to the dispatcher loop
 
-            verbose_print(f"items: {items}", pretty=True)
+    Events queued within the debounce window are coalesced per
+    path, so bursts of changes to a file become one event. Each
+    batch goes to the batch observers whole and its events are
+    handled in the order they were queued.
+    """
 
-            event_type, event_data = items
-            basename = path.basename(event_data["file_path"])
-            verbose_print(f"Processing {event_type} file {basename}...")
-            post_event(event_type, event_data)
-            verbose_print(f'Done processing {event_type} file "{basename}"')
-            _queue.task_done()
+    dispatcher = start_dispatcher(
+        max_concurrency=int(config.get("PT_OBSERVER_CONCURRENCY") or DEFAULT_MAX_CONCURRENCY),
+        observer_timeout=float(config.get("PT_OBSERVER_TIMEOUT") or 0),
+    )
 
-    except Exception as e:
-        print(f"Error {e}")
+    window = float(config.get("PT_EVENT_DEBOUNCE") or 0)
+    max_size = int(config.get("PT_EVENT_BATCH_SIZE") or 1)
+
+    metrics.QUEUE_DEPTH.set_function(_queue.qsize)
+
+    while True:
+        batch = drain_batch(_queue, window, max_size)
+
+        try:
+            events = coalesce_events(batch)
+            verbose_print(f"Dispatching {len(events)} event(s) coalesced from {len(batch)}...")
+
+            if events:
+                record_dispatch(events)
+                dispatcher.submit_batch(events).result()
+
+        # Keep the daemon alive whatever an event does
+        except Exception as e:
+            print(f"Error {e}")
+
+        finally:
+            for _ in batch:
+                _queue.task_done()
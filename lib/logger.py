@@ -1,28 +1,307 @@
-from .utils import get_timestamp
+import os
+import json
+import time
+import atexit
+import threading
+from config import Config
+from .utils import get_timestamp, normalize_path
 
-def append_2_file(file_location: str, content: str):
-    """
-    Create given file if it does not exist
-    and appends content to it
-    """
-    with open(file_location, "a") as f:
-        f.write(content)
-
-def log(log_location: str, file_location: str, user: str, control_hash: str, file_hash: str, description: str, hostname: str):
-    #  Obtain current date
-    timestamp = get_timestamp()
-
-    content = f"""
-    Date and Time: {timestamp}
-    File Path: {file_location}
-    hostname: {hostname}
-    User: {user}
-    Control Hash: {control_hash}
-    File Hash: {file_hash}
-
-    Description: {description}
+# Log formats and the extension of their files
+LOG_FORMATS = {"text": "txt", "jsonl": "jsonl"}
+
+# Either a new file each day, or one file rolled over by size only
+ROTATE_DAILY = "daily"
+ROTATE_SIZE = "size"
+
+# fsync after no write, after every flush, or else every N seconds
+FSYNC_NEVER = "never"
+FSYNC_FLUSH = "flush"
+
+DEFAULT_FLUSH_BYTES = 1 << 20
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+# Writer shared by every observer
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def parse_fsync_policy(policy) -> str:
+    """ Validates an fsync policy: never, flush or a number of seconds """
+
+    if policy in (FSYNC_NEVER, FSYNC_FLUSH):
+        return policy
+
+    if float(policy) < 0:
+        raise ValueError(f"Invalid fsync interval {policy}")
+
+    return policy
+
+
+def format_text_record(record: dict) -> str:
+    return f"""
+    Date and Time: {record["timestamp"]}
+    File Path: {record["file_path"]}
+    hostname: {record["hostname"]}
+    User: {record["user"]}
+    Control Hash: {record["control_hash"]}
+    File Hash: {record["file_hash"]}
+
+    Description: {record["description"]}
     {"="*50}
     """
 
-    #  Write log to file
-    append_2_file(log_location, content)
+
+def format_json_record(record: dict) -> str:
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+class LogWriter:
+    """ Appends log records to rotating files from a background thread
+
+    Records are formatted and buffered in memory by the caller.
+    The thread writes the buffer out in one go once it holds
+    `flush_bytes` or its oldest record is `flush_interval`
+    seconds old, keeping the file open between flushes.
+
+    Files are named after the day with ROTATE_DAILY, e.g.
+    log_18-10-2026.txt, or just log.txt with ROTATE_SIZE. When
+    `max_bytes` is set a file that would grow past it rolls over
+    to the next numbered part, e.g. log_18-10-2026.1.txt.
+    """
+
+    def __init__(
+        self,
+        directory,
+        format="text",
+        flush_bytes=DEFAULT_FLUSH_BYTES,
+        flush_interval=DEFAULT_FLUSH_INTERVAL,
+        fsync=FSYNC_NEVER,
+        rotate=ROTATE_DAILY,
+        max_bytes=0,
+    ):
+        if format not in LOG_FORMATS:
+            raise ValueError(f"Unknown log format {format}, expected one of {', '.join(LOG_FORMATS)}")
+
+        if rotate not in (ROTATE_DAILY, ROTATE_SIZE):
+            raise ValueError(f"Unknown log rotation {rotate}, expected {ROTATE_DAILY} or {ROTATE_SIZE}")
+
+        self.directory = directory
+        self.format = format
+        self.flush_bytes = max(1, int(flush_bytes))
+        self.flush_interval = float(flush_interval)
+        self.rotate = rotate
+        self.max_bytes = int(max_bytes or 0)
+
+        # Seconds between fsyncs, 0 after every flush and None never
+        fsync = parse_fsync_policy(fsync)
+        if fsync == FSYNC_NEVER:
+            self.fsync_interval = None
+        elif fsync == FSYNC_FLUSH:
+            self.fsync_interval = 0.0
+        else:
+            self.fsync_interval = float(fsync)
+
+        self._formatter = format_json_record if format == "jsonl" else format_text_record
+
+        self._buffer = []
+        self._buffered = 0
+        self._buffered_since = 0.0
+        self._closing = False
+        self._changed = threading.Condition()
+
+        # Held while the buffer is written so flushes stay in order
+        self._io_lock = threading.Lock()
+        self._file = None
+        self._file_name = None
+        self._file_size = 0
+        self._part = 0
+        self._last_fsync = time.monotonic()
+
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, record: dict):
+        """ Buffers a record, written out by the next flush """
+
+        data = self._formatter(record).encode("utf-8")
+
+        with self._changed:
+            if not self._buffer:
+                self._buffered_since = time.monotonic()
+
+            self._buffer.append(data)
+            self._buffered += len(data)
+
+            # Wakes the writer to start the interval or flush a full buffer
+            if len(self._buffer) == 1 or self._buffered >= self.flush_bytes:
+                self._changed.notify()
+
+    def flush(self):
+        """ Writes out the buffer now, from the calling thread """
+
+        with self._io_lock:
+            with self._changed:
+                lines, self._buffer, self._buffered = self._buffer, [], 0
+
+            if lines:
+                self._write(lines)
+
+    def close(self):
+        """ Flushes what is buffered, then stops the writer """
+
+        with self._changed:
+            self._closing = True
+            self._changed.notify()
+
+        self._thread.join()
+
+        with self._io_lock:
+            if self._file is not None:
+                if self.fsync_interval is not None:
+                    os.fsync(self._file.fileno())
+
+                self._file.close()
+                self._file = None
+
+    def _run(self):
+        while True:
+            with self._changed:
+                while not self._buffer and not self._closing:
+                    self._changed.wait()
+
+                while not self._closing and self._buffered < self.flush_bytes:
+                    remaining = self._buffered_since + self.flush_interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+
+                    self._changed.wait(remaining)
+
+                closing = self._closing
+
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Failed writing log to {self._file_name}: {e}")
+
+            if closing:
+                return
+
+    def _base_name(self) -> str:
+        if self.rotate == ROTATE_DAILY:
+            return f"log_{get_timestamp(short=True)}"
+
+        return "log"
+
+    def _path(self, base_name, part) -> str:
+        suffix = f".{part}" if part else ""
+        return normalize_path(os.path.join(self.directory, f"{base_name}{suffix}.{LOG_FORMATS[self.format]}"))
+
+    def _open(self, base_name):
+        """ Opens the latest part of a log file for appending """
+
+        if self._file is not None:
+            self._file.close()
+
+        self._part = 0
+        while os.path.exists(self._path(base_name, self._part + 1)):
+            self._part += 1
+
+        self._file_name = base_name
+        self._file = open(self._path(base_name, self._part), "ab")
+        self._file_size = self._file.tell()
+
+    def _roll_over(self):
+        self._file.close()
+
+        self._part += 1
+        self._file = open(self._path(self._file_name, self._part), "ab")
+        self._file_size = self._file.tell()
+
+    def _write(self, lines):
+        base_name = self._base_name()
+
+        if self._file is None or base_name != self._file_name:
+            self._open(base_name)
+
+        if self.max_bytes <= 0:
+            chunks = [lines]
+        else:
+            # Split at the records that would outgrow the file
+            chunks, chunk, size = [], [], self._file_size
+            for line in lines:
+                if size + len(line) > self.max_bytes and size > 0:
+                    chunks.append(chunk)
+                    chunk, size = [], 0
+
+                chunk.append(line)
+                size += len(line)
+
+            chunks.append(chunk)
+
+        for i, chunk in enumerate(chunks):
+            if i > 0:
+                self._roll_over()
+
+            data = b"".join(chunk)
+            self._file.write(data)
+            self._file_size += len(data)
+
+        self._file.flush()
+
+        if (
+            self.fsync_interval is not None
+            and time.monotonic() - self._last_fsync >= self.fsync_interval
+        ):
+            os.fsync(self._file.fileno())
+            self._last_fsync = time.monotonic()
+
+
+def get_log_writer() -> LogWriter:
+    """ Returns the shared writer, started from the config on first use """
+
+    global _writer
+
+    with _writer_lock:
+        if _writer is None:
+            config = Config()
+
+            _writer = LogWriter(
+                config.get("PT_LOG_LOCATION"),
+                format=config.get("PT_LOG_FORMAT"),
+                flush_bytes=int(config.get("PT_LOG_FLUSH_BYTES") or DEFAULT_FLUSH_BYTES),
+                flush_interval=float(config.get("PT_LOG_FLUSH_INTERVAL") or 0),
+                fsync=config.get("PT_LOG_FSYNC") or FSYNC_NEVER,
+                rotate=config.get("PT_LOG_ROTATE") or ROTATE_DAILY,
+                max_bytes=int(config.get("PT_LOG_MAX_BYTES") or 0),
+            )
+
+            atexit.register(_writer.close)
+
+        return _writer
+
+
+def close_log_writer():
+    """ Flushes and closes the shared writer, if it was started """
+
+    global _writer
+
+    with _writer_lock:
+        if _writer is not None:
+            atexit.unregister(_writer.close)
+            _writer.close()
+            _writer = None
+
+
+def log(file_location: str, user: str, control_hash: str, file_hash: str, description: str, hostname: str, event: str = None):
+    """ Queues a log record for the shared writer """
+
+    get_log_writer().write({
+        "timestamp": get_timestamp(),
+        "event": event,
+        "file_path": file_location,
+        "hostname": hostname,
+        "user": user,
+        "control_hash": control_hash,
+        "file_hash": file_hash,
+        "description": description,
+    })
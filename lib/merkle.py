@@ -0,0 +1,181 @@
+import os
+import hashlib
+
+
+def _digest(entries) -> str:
+    """ Digest of a directory from its {name: (kind, hash)} entries """
+
+    hash_object = hashlib.sha256()
+
+    for name, (kind, value) in sorted(entries.items()):
+        hash_object.update(f"{kind}\0{name}\0{value}\n".encode("utf-8", "surrogateescape"))
+
+    return hash_object.hexdigest()
+
+
+def compute_digests(sorted_records) -> dict:
+    """ Computes the Merkle digest of every directory of a baseline
+
+    Each directory's digest is derived from the name and hash of
+    its files and the name and digest of its subdirectories, so
+    two baselines with the same digest for a directory have
+    identical subtrees below it. Sizes are left out as entries
+    written by the observers record none, and the hash alone
+    decides content.
+
+    Takes (path, record) pairs sorted by path, in which every
+    subtree is contiguous, and only holds the entries of the
+    directories along the current path.
+    """
+
+    digests = {}
+
+    # (directory, prefix, entries) from the root down
+    stack = []
+
+    def close_directory():
+        directory, _, entries = stack.pop()
+        digests[directory] = _digest(entries)
+
+        if stack:
+            stack[-1][2][os.path.basename(directory)] = ("d", digests[directory])
+
+    for file_path, record in sorted_records:
+        directory, name = os.path.split(file_path)
+
+        while stack and directory != stack[-1][0] and not directory.startswith(stack[-1][1]):
+            close_directory()
+
+        # Open the directories between the deepest open one and the file
+        opening = []
+        while not stack or directory != stack[-1][0]:
+            opening.append(directory)
+            parent = os.path.dirname(directory)
+            if parent == directory or (stack and parent == stack[-1][0]):
+                break
+            directory = parent
+
+        for directory in reversed(opening):
+            stack.append((directory, os.path.join(directory, ""), {}))
+
+        stack[-1][2][name] = ("f", record.file_hash)
+
+    while stack:
+        close_directory()
+
+    return digests
+
+
+class DigestTree:
+    """ Directory digests of a baseline, with its files loaded on demand
+
+    `load_files(directories, subtrees)` returns the {path: hash}
+    of the files directly in `directories` and of every file
+    below `subtrees`, so a diff only reads the files of the
+    directories whose digests differ.
+    """
+
+    def __init__(self, digests, load_files):
+        self.digests = digests
+        self.load_files = load_files
+
+        # Directory to the paths of its subdirectories
+        self._subdirectories = None
+
+    def subdirectories(self, directory) -> set:
+        if self._subdirectories is None:
+            self._subdirectories = {}
+
+            for path in self.digests:
+                parent = os.path.dirname(path)
+                if parent != path:
+                    self._subdirectories.setdefault(parent, set()).add(path)
+
+        return self._subdirectories.get(directory, set())
+
+
+def diff_trees(old, new, root=os.sep):
+    """ Yields (status, path) for every file that differs, sorted by path
+
+    Status is "added", "removed" or "changed" from old to new.
+    Directories are compared top-down and every subtree whose
+    digest matches is skipped without reading its files.
+    """
+
+    changed_dirs = []
+    removed_dirs = []
+    added_dirs = []
+
+    pending = [root]
+
+    while pending:
+        directory = pending.pop()
+        old_digest = old.digests.get(directory)
+        new_digest = new.digests.get(directory)
+
+        if old_digest == new_digest:
+            continue
+
+        if new_digest is None:
+            removed_dirs.append(directory)
+        elif old_digest is None:
+            added_dirs.append(directory)
+        else:
+            changed_dirs.append(directory)
+            pending.extend(old.subdirectories(directory) | new.subdirectories(directory))
+
+    old_files = old.load_files(changed_dirs, removed_dirs)
+    new_files = new.load_files(changed_dirs, added_dirs)
+
+    differences = []
+
+    for file_path in old_files.keys() | new_files.keys():
+        old_hash = old_files.get(file_path)
+        new_hash = new_files.get(file_path)
+
+        if new_hash is None:
+            differences.append((file_path, "removed"))
+        elif old_hash is None:
+            differences.append((file_path, "added"))
+        elif old_hash != new_hash:
+            differences.append((file_path, "changed"))
+
+    for file_path, status in sorted(differences):
+        yield status, file_path
+
+
+def format_digest_lines(digests, baseline_size=None):
+    """ Formats directory digests as 'directory | digest' lines
+
+    The size of the text baseline they were computed from goes
+    in a leading comment, as appends to the baseline change it.
+    """
+
+    if baseline_size is not None:
+        yield f"# baseline_size={baseline_size}\n"
+
+    for directory, digest in sorted(digests.items()):
+        yield f"{directory} | {digest}\n"
+
+
+def read_digest_lines(file_path) -> tuple:
+    """ Reads 'directory | digest' lines
+
+    Returns the digests and the recorded baseline size, None
+    when the file predates it.
+    """
+
+    digests = {}
+    baseline_size = None
+
+    with open(file_path, "r", encoding="utf-8", errors="surrogateescape") as file:
+        for line in file:
+            if line.startswith("# baseline_size="):
+                baseline_size = int(line.rstrip("\n").partition("=")[2])
+                continue
+
+            directory, _, digest = line.rstrip("\n").rpartition(" | ")
+            if directory:
+                digests[directory] = digest
+
+    return digests, baseline_size
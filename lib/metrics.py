@@ -0,0 +1,268 @@
+import os
+import time
+import bisect
+import threading
+
+# Default histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0, 300.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in pairs
+    )
+
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """ Monotonic total, optionally split by label values """
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+
+        for label_values, value in values:
+            yield self.name, _format_labels(self.labels, label_values), value
+
+
+class Gauge:
+    """ Current value, either set or read from a function when collected """
+
+    kind = "gauge"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+
+        self._value = 0
+        self._function = None
+
+    def set(self, value):
+        self._value = value
+
+    def set_function(self, function):
+        """ Reads the value from `function` whenever it is collected """
+        self._function = function
+
+    def value(self):
+        return self._function() if self._function is not None else self._value
+
+    def samples(self):
+        yield self.name, "", self.value()
+
+
+class Histogram:
+    """ Distribution of observed values over cumulative buckets """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+
+        # Observations per bucket, the last one above every bound
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def observe_many(self, values):
+        """ Records a batch of observations under one lock """
+
+        indexes = [bisect.bisect_left(self.buckets, value) for value in values]
+
+        with self._lock:
+            for index in indexes:
+                self._counts[index] += 1
+            self._sum += sum(values)
+
+    @property
+    def count(self) -> int:
+        return sum(self._counts)
+
+    def samples(self):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+
+        cumulative = 0
+        for bound, count in zip((*self.buckets, float("inf")), counts):
+            cumulative += count
+            yield f"{self.name}_bucket", _format_labels((), (), [("le", _format_value(bound))]), cumulative
+
+        yield f"{self.name}_sum", "", total
+        yield f"{self.name}_count", "", cumulative
+
+
+class Registry:
+    """ Metrics rendered together in the Prometheus text format """
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help) -> Gauge:
+        return self.register(Gauge(name, help))
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, buckets))
+
+    def render(self) -> str:
+        lines = []
+
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+# Metrics of the whole process
+registry = Registry()
+
+FILES_WALKED = registry.counter("file_patrole_files_walked_total", "Files seen by scan passes.")
+FILES_HASHED = registry.counter("file_patrole_files_hashed_total", "Files hashed or fingerprinted.")
+BYTES_HASHED = registry.counter("file_patrole_bytes_hashed_total", "Bytes read while hashing.")
+HASH_SECONDS = registry.histogram("file_patrole_hash_seconds", "Time to hash or fingerprint a file, sampled one file in 16.")
+SCAN_SECONDS = registry.histogram("file_patrole_scan_seconds", "Duration of scan passes.")
+QUEUE_DEPTH = registry.gauge("file_patrole_queue_depth", "Events waiting in the message queue.")
+EVENTS = registry.counter("file_patrole_events_total", "Events dispatched to observers.", labels=("type",))
+SUPPRESSED_EVENTS = registry.counter(
+    "file_patrole_events_suppressed_total", "Events dropped as repeats within the dedup TTL.", labels=("type",)
+)
+DISPATCH_LATENCY = registry.histogram(
+    "file_patrole_dispatch_latency_seconds", "Time from detecting a change to dispatching its event."
+)
+
+# Agent and collector modes
+FORWARDED_EVENTS = registry.counter("file_patrole_agent_forwarded_events_total", "Events acknowledged by the collector.")
+AGENT_SPOOL_BYTES = registry.gauge("file_patrole_agent_spool_bytes", "Bytes spooled while the collector is unreachable.")
+COLLECTED_EVENTS = registry.counter(
+    "file_patrole_collector_events_total", "Events stored by the collector.", labels=("host", "type")
+)
+COLLECTED_DUPLICATES = registry.counter(
+    "file_patrole_collector_duplicates_total", "Events and batches the collector dropped as already seen."
+)
+
+
+def write_textfile(file_path):
+    """ Writes the metrics for node_exporter's textfile collector
+
+    Written to a temporary file first so the collector never
+    reads a partial file.
+    """
+
+    temp_path = f"{file_path}.{os.getpid()}.tmp"
+
+    with open(temp_path, "w", encoding="utf-8") as file:
+        file.write(registry.render())
+
+    os.replace(temp_path, file_path)
+
+
+def start_textfile_exporter(file_path, interval=15.0) -> threading.Thread:
+    """ Rewrites the textfile every `interval` seconds from a daemon thread """
+
+    def export():
+        while True:
+            try:
+                write_textfile(file_path)
+            except OSError as e:
+                print(f"Failed writing metrics to {file_path}: {e}")
+
+            time.sleep(interval)
+
+    thread = threading.Thread(target=export, name="metrics-textfile", daemon=True)
+    thread.start()
+
+    return thread
+
+
+def start_http_server(port, host="127.0.0.1"):
+    """ Serves the metrics on /metrics from a daemon thread, on localhost by default """
+
+    # Imported here, most runs never serve metrics
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+
+            body = registry.render().encode("utf-8")
+
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Scrapes would flood the output
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+
+    return server
+
+
+def start_exporters(config):
+    """ Starts the exporters enabled in the config """
+
+    textfile = config.get("PT_METRICS_TEXTFILE")
+    if textfile:
+        start_textfile_exporter(textfile, float(config.get("PT_METRICS_INTERVAL") or 15))
+
+    port = int(config.get("PT_METRICS_PORT") or 0)
+    if port:
+        start_http_server(port, config.get("PT_METRICS_HOST") or "127.0.0.1")
@@ -0,0 +1,177 @@
+import os
+import sys
+import time
+import ctypes
+import ctypes.util
+import platform
+from lib.utils import format_size
+
+# ioprio_set(2) syscall numbers per architecture
+_IOPRIO_SET_SYSCALLS = {
+    "x86_64": 251,
+    "i386": 289,
+    "i686": 289,
+    "aarch64": 30,
+    "armv7l": 314,
+    "ppc64le": 273,
+    "s390x": 282,
+}
+
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_CLASS_SHIFT = 13
+
+# I/O scheduling classes accepted by ionice
+IONICE_CLASSES = {"realtime": 1, "best-effort": 2, "idle": 3}
+
+
+class _TokenBucket:
+    """ Allows `rate` units per second with up to one second of idle credit """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+
+    def take(self, amount: float) -> float:
+        """ Takes tokens and returns how long to wait to stay in budget """
+
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        self.tokens -= amount
+
+        return -self.tokens / self.rate if self.tokens < 0 else 0
+
+
+class Throttle:
+    """ Paces hashing to a bytes and files per second budget
+
+    Also meters each scan pass so the actual throughput can be
+    reported against the budget. A budget of 0 is unlimited.
+    """
+
+    def __init__(self, bytes_per_sec=0, files_per_sec=0):
+        self.bytes_per_sec = float(bytes_per_sec or 0)
+        self.files_per_sec = float(files_per_sec or 0)
+
+        self._buckets = []
+        if self.bytes_per_sec > 0:
+            self._buckets.append(("bytes", _TokenBucket(self.bytes_per_sec)))
+        if self.files_per_sec > 0:
+            self._buckets.append(("files", _TokenBucket(self.files_per_sec)))
+
+        self.start_pass()
+
+    @property
+    def is_limited(self) -> bool:
+        return bool(self._buckets)
+
+    def start_pass(self):
+        """ Resets the per-pass counters """
+
+        self.started = time.monotonic()
+        self.files_walked = 0
+        self.files_hashed = 0
+        self.bytes_hashed = 0
+        self.throttled_seconds = 0.0
+
+    def walked(self):
+        """ Counts a file seen by the walker """
+        self.files_walked += 1
+
+    def consume(self, size: int, files: int = 1):
+        """ Counts bytes about to be hashed, waiting if over budget
+
+        Extra reads of a file already counted pass files=0.
+        """
+
+        self.files_hashed += files
+        self.bytes_hashed += size
+
+        delay = 0
+        for unit, bucket in self._buckets:
+            delay = max(delay, bucket.take(size if unit == "bytes" else files))
+
+        if delay > 0:
+            self.throttled_seconds += delay
+            time.sleep(delay)
+
+    def report(self) -> str:
+        """ Summarizes the current pass against the budget """
+
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+
+        bytes_rate = self.bytes_hashed / elapsed
+        files_rate = self.files_hashed / elapsed
+
+        bytes_budget = f"{format_size(self.bytes_per_sec)}/s" if self.bytes_per_sec else "unlimited"
+        files_budget = f"{self.files_per_sec:g}/s" if self.files_per_sec else "unlimited"
+
+        return (
+            f"Scan pass: {self.files_walked} files walked, {self.files_hashed} hashed "
+            f"({format_size(self.bytes_hashed)}) in {elapsed:.1f}s, throttled {self.throttled_seconds:.1f}s\r\n"
+            f"  bytes: {format_size(bytes_rate)}/s actual, {bytes_budget} budget\r\n"
+            f"  files: {files_rate:.1f}/s actual, {files_budget} budget"
+        )
+
+
+class ScanScheduler:
+    """ Spaces the start of consecutive scan passes by an interval """
+
+    def __init__(self, interval=0):
+        self.interval = float(interval or 0)
+        self._last_start = None
+
+    def wait_for_next_pass(self, stop_event=None):
+        """ Sleeps until the next pass is due, or until `stop_event` is set """
+
+        if self._last_start is not None and self.interval > 0:
+            remaining = self.interval - (time.monotonic() - self._last_start)
+            if remaining > 0:
+                if stop_event is not None:
+                    stop_event.wait(remaining)
+                else:
+                    time.sleep(remaining)
+
+        self._last_start = time.monotonic()
+
+
+def lower_priority(nice=0, ionice_class=None, ionice_level=7):
+    """ Lowers the CPU and I/O priority of the process
+
+    Must run before worker threads start so they inherit it.
+    """
+
+    if nice:
+        try:
+            os.nice(int(nice))
+        except OSError as e:
+            print(f"Failed setting nice value {nice}: {e}")
+
+    if ionice_class:
+        set_io_priority(ionice_class, ionice_level)
+
+
+def set_io_priority(ionice_class, level=7):
+    """ Sets the I/O scheduling class of the calling thread (Linux only) """
+
+    if ionice_class not in IONICE_CLASSES:
+        raise ValueError(f"Unknown ionice class '{ionice_class}'.")
+
+    syscall_number = _IOPRIO_SET_SYSCALLS.get(platform.machine())
+
+    if not sys.platform.startswith("linux") or syscall_number is None:
+        print("I/O priority is only supported on Linux, ignoring ionice.")
+        return
+
+    io_class = IONICE_CLASSES[ionice_class]
+    # The idle class has no levels
+    data = 0 if ionice_class == "idle" else int(level)
+    ioprio = (io_class << _IOPRIO_CLASS_SHIFT) | data
+
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+
+    if libc.syscall(syscall_number, _IOPRIO_WHO_PROCESS, 0, ioprio) != 0:
+        err = ctypes.get_errno()
+        print(f"Failed setting I/O priority '{ionice_class}': {os.strerror(err)}")
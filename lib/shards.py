@@ -0,0 +1,175 @@
+import os
+import multiprocessing
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import NamedTuple
+from lib import file_handlers as fh
+
+# Directory levels below a root that can become shards of their own
+MAX_SPLIT_DEPTH = 3
+
+# Subdirectories smaller than this share of a shard's target stay in their parent
+MIN_SPLIT_SHARE = 1 / 16
+
+# Change in the number of expected files that triggers a new plan
+REPLAN_DRIFT = 0.25
+
+
+class ShardStat(NamedTuple):
+    """ The stat fields a scan uses, as sent back by a shard """
+
+    st_size: int
+    st_mtime_ns: int
+    st_ctime_ns: int
+    st_ino: int
+    st_dev: int
+
+
+class Shard(NamedTuple):
+    """ A directory walked by one pool task, less the subdirectories of other shards
+
+    `size` is the number of baseline files expected in it, used
+    to hand out the largest shards first.
+    """
+
+    directory: str
+    excluded: tuple
+    size: int
+
+
+def scan_shard(directory, excluded, skip_file_name, ignored_dirs) -> list:
+    """ Walks a shard in a pool process
+
+    Returns (path, size, mtime_ns, ctime_ns, inode, device)
+    tuples, which pickle far smaller than stat results.
+    """
+
+    state = {"roots": [directory], "pending": [], "excluded": list(excluded)}
+
+    return [
+        (file_path, s.st_size, s.st_mtime_ns, s.st_ctime_ns, s.st_ino, s.st_dev)
+        for files in fh.walk_directories(skip_file_name, ignored_dirs, state)
+        for file_path, s in files
+    ]
+
+
+def count_files(roots, file_paths, depth=MAX_SPLIT_DEPTH) -> Counter:
+    """ Counts the files below each root and each directory up to `depth` levels under it """
+
+    counts = Counter()
+
+    for root in roots:
+        prefix = os.path.join(root, "")
+
+        for file_path in file_paths:
+            if not file_path.startswith(prefix):
+                continue
+
+            counts[root] += 1
+
+            # Directories between the root and the file
+            parts = file_path[len(prefix):].split(os.sep, depth)[:-1]
+            for level in range(1, len(parts) + 1):
+                counts[prefix + os.sep.join(parts[:level])] += 1
+
+    return counts
+
+
+def plan_shards(roots, file_paths, workers, ignored_dirs="") -> list:
+    """ Splits the roots into shards of about 1/workers of the expected files each
+
+    Every root is a shard. A shard expecting more than its share
+    hands its larger subdirectories to shards of their own, down
+    to MAX_SPLIT_DEPTH levels, and keeps its own files and any
+    subdirectory created since. Shards are returned largest first.
+    """
+
+    counts = count_files(roots, file_paths)
+    target = max(1, sum(counts[root] for root in roots) // max(1, workers))
+    minimum = max(1, int(target * MIN_SPLIT_SHARE))
+
+    children = defaultdict(list)
+    for directory in counts:
+        if directory not in roots:
+            children[os.path.dirname(directory)].append(directory)
+
+    excluded = {root: [] for root in roots}
+    sizes = {root: counts[root] for root in roots}
+    pending = list(roots)
+
+    while pending:
+        directory = pending.pop()
+        if sizes[directory] <= target:
+            continue
+
+        for child in children.get(directory, ()):
+            if counts[child] < minimum or fh.is_ignored_dir(child, ignored_dirs):
+                continue
+
+            excluded[directory].append(child)
+            excluded[child] = []
+            sizes[child] = counts[child]
+            sizes[directory] -= counts[child]
+            pending.append(child)
+
+    shards = [Shard(directory, tuple(sorted(excluded[directory])), sizes[directory]) for directory in excluded]
+
+    return sorted(shards, key=lambda shard: shard.size, reverse=True)
+
+
+class ShardPool:
+    """ Walks the monitored roots as shards on a process pool
+
+    The plan is kept between passes and made again once the
+    number of expected files drifts by REPLAN_DRIFT, so a new
+    large subtree is scanned, just not split, until then. Pool
+    processes are started by a fork server as the monitor is
+    threaded by the time they start.
+    """
+
+    def __init__(self, workers):
+        self.workers = max(1, int(workers))
+
+        self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("forkserver"))
+        self._shards = None
+        self._planned_roots = None
+        self._planned_files = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def shards(self, roots, expected_paths, ignored_dirs) -> list:
+        drift = abs(len(expected_paths) - self._planned_files)
+
+        if self._shards is None or roots != self._planned_roots or drift > self._planned_files * REPLAN_DRIFT:
+            self._shards = plan_shards(roots, expected_paths, self.workers, ignored_dirs)
+            self._planned_roots = roots
+            self._planned_files = len(expected_paths)
+
+        return self._shards
+
+    def walk_files(self, skip_file_name, directories, ignored_dirs, expected_paths):
+        """ Yields the (path, stat) entries of every shard as each shard completes """
+
+        roots = fh.new_walk_state(directories)["roots"]
+
+        futures = [
+            self._executor.submit(scan_shard, shard.directory, shard.excluded, skip_file_name, ignored_dirs)
+            for shard in self.shards(roots, expected_paths, ignored_dirs)
+        ]
+
+        try:
+            for future in as_completed(futures):
+                for file_path, *fields in future.result():
+                    yield file_path, ShardStat(*fields)
+
+        finally:
+            # Stopped early, e.g. by a shutdown
+            for future in futures:
+                future.cancel()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
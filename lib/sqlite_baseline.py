@@ -0,0 +1,402 @@
+import os
+import time
+import sqlite3
+import threading
+from lib.baseline import (
+    TOMBSTONE,
+    BaselineRecord,
+    format_baseline_header,
+    format_baseline_line,
+    read_baseline_header,
+    read_baseline_lines,
+)
+from lib.hashing import DEFAULT_ALGORITHM
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    path TEXT PRIMARY KEY,
+    file_hash TEXT NOT NULL,
+    size INTEGER,
+    mtime_ns INTEGER,
+    ctime_ns INTEGER,
+    inode INTEGER,
+    fingerprint TEXT
+);
+CREATE INDEX IF NOT EXISTS records_file_hash ON records (file_hash);
+CREATE INDEX IF NOT EXISTS records_inode ON records (inode);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    digest TEXT NOT NULL
+);
+"""
+
+_COLUMNS = "file_hash, size, mtime_ns, ctime_ns, inode, fingerprint"
+
+_UPSERT = f"""
+INSERT INTO records (path, {_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (path) DO UPDATE SET
+    file_hash = excluded.file_hash,
+    size = excluded.size,
+    mtime_ns = excluded.mtime_ns,
+    ctime_ns = excluded.ctime_ns,
+    inode = excluded.inode,
+    fingerprint = excluded.fingerprint
+"""
+
+# Keeps the stat data of a path whose hash is unchanged
+_UPSERT_HASH = """
+INSERT INTO records (path, file_hash) VALUES (?, ?)
+ON CONFLICT (path) DO UPDATE SET
+    file_hash = excluded.file_hash,
+    size = CASE WHEN file_hash = excluded.file_hash THEN size END,
+    mtime_ns = CASE WHEN file_hash = excluded.file_hash THEN mtime_ns END,
+    ctime_ns = CASE WHEN file_hash = excluded.file_hash THEN ctime_ns END,
+    inode = CASE WHEN file_hash = excluded.file_hash THEN inode END,
+    fingerprint = CASE WHEN file_hash = excluded.file_hash THEN fingerprint END
+"""
+
+
+class SQLiteBaseline:
+    """ Baseline stored in an SQLite database
+
+    Has the same interface as Baseline but reads records on
+    demand, so opening a large baseline costs nothing. Writes
+    are batched into transactions that commit every
+    `batch_size` changes or `batch_seconds` seconds.
+    """
+
+    # Open stores shared by the monitor and the observers
+    _instances: dict = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, db_path, batch_size=1000, batch_seconds=1.0):
+        self.source = db_path
+        self.batch_size = batch_size
+        self.batch_seconds = batch_seconds
+
+        self._lock = threading.RLock()
+        self._pending = 0
+        self._last_commit = time.monotonic()
+
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SCHEMA)
+        self._migrate()
+
+        # Whether the recorded directory digests match the records
+        self._digests_fresh = self.get_meta("digests_fresh") == "1"
+
+    @classmethod
+    def open(cls, db_path):
+        """ Returns the shared store of the specified database """
+
+        key = os.path.abspath(db_path)
+
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(db_path)
+
+            return cls._instances[key]
+
+    @classmethod
+    def close_all(cls):
+        """ Commits and closes every shared store """
+
+        with cls._instances_lock:
+            stores = list(cls._instances.values())
+
+        for store in stores:
+            store.close()
+
+    def _migrate(self):
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(records)")}
+
+        # Added with fingerprinting of large files
+        if "fingerprint" not in columns:
+            self._connection.execute("ALTER TABLE records ADD COLUMN fingerprint TEXT")
+            self._connection.commit()
+
+    @property
+    def algorithm(self):
+        """ Algorithm every hash of the baseline was computed with """
+        return self.get_meta("algorithm", DEFAULT_ALGORITHM)
+
+    @algorithm.setter
+    def algorithm(self, algorithm):
+        self.set_meta("algorithm", algorithm)
+        self.flush()
+
+    def __len__(self):
+        return self._query_one("SELECT COUNT(*) FROM records")[0]
+
+    def __contains__(self, file_path):
+        return self._query_one("SELECT 1 FROM records WHERE path = ?", (file_path,)) is not None
+
+    def __iter__(self):
+        return (row[0] for row in self._query_all("SELECT path FROM records"))
+
+    def get(self, file_path, default=None):
+        """ Returns the record of the specified path """
+
+        row = self._query_one(f"SELECT {_COLUMNS} FROM records WHERE path = ?", (file_path,))
+
+        return BaselineRecord(*row) if row else default
+
+    def get_hash(self, file_path):
+        """ Returns the hash recorded for the specified path """
+
+        row = self._query_one("SELECT file_hash FROM records WHERE path = ?", (file_path,))
+
+        return row[0] if row else None
+
+    def items(self):
+        rows = self._query_all(f"SELECT path, {_COLUMNS} FROM records")
+
+        return ((row[0], BaselineRecord(*row[1:])) for row in rows)
+
+    def sorted_items(self):
+        """ Streams every (path, record) pair sorted by path
+
+        Uses its own read connection so the stream doesn't hold
+        the lock shared with writers.
+        """
+
+        self.flush()
+
+        connection = sqlite3.connect(self.source)
+        try:
+            rows = connection.execute(f"SELECT path, {_COLUMNS} FROM records ORDER BY path")
+            for row in rows:
+                yield row[0], BaselineRecord(*row[1:])
+        finally:
+            connection.close()
+
+    def set(self, file_path, record):
+        """ Adds or replaces the record of the specified path """
+
+        if isinstance(record, str):
+            record = BaselineRecord(record)
+
+        self._write_record(_UPSERT, (file_path, *record))
+
+        return record
+
+    def set_many(self, records):
+        """ Adds or replaces (path, record) pairs in one transaction
+
+        Pairs with a TOMBSTONE hash remove their path.
+        """
+
+        with self._lock:
+            self._invalidate_digests()
+
+            for file_path, record in records:
+                if record.file_hash == TOMBSTONE:
+                    self._connection.execute("DELETE FROM records WHERE path = ?", (file_path,))
+                else:
+                    self._connection.execute(_UPSERT, (file_path, *record))
+
+            self.flush()
+
+    def update_hash(self, file_path, file_hash):
+        """ Records a new hash, dropping stat data that no longer applies """
+
+        self._write_record(_UPSERT_HASH, (file_path, file_hash))
+
+    def remove(self, file_path):
+        """ Removes the specified path and returns its record """
+
+        with self._lock:
+            record = self.get(file_path)
+            if record is not None:
+                self._write_record("DELETE FROM records WHERE path = ?", (file_path,))
+
+            return record
+
+    def has_hash(self, file_hash) -> bool:
+        """ Checks whether any path has the specified hash """
+
+        return self._query_one("SELECT 1 FROM records WHERE file_hash = ? LIMIT 1", (file_hash,)) is not None
+
+    def paths_for_hash(self, file_hash) -> frozenset:
+        """ Returns every path that has the specified hash """
+
+        rows = self._query_all("SELECT path FROM records WHERE file_hash = ?", (file_hash,))
+
+        return frozenset(row[0] for row in rows)
+
+    def paths_for_inode(self, inode) -> frozenset:
+        """ Returns every path recorded with the specified inode """
+
+        rows = self._query_all("SELECT path FROM records WHERE inode = ?", (inode,))
+
+        return frozenset(row[0] for row in rows)
+
+    def paths_under(self, directory):
+        """ Returns every path below the specified directory """
+
+        # Range scan on the primary key instead of LIKE
+        rows = self._query_all("SELECT path FROM records WHERE path >= ? AND path < ?", _subtree_range(directory))
+
+        return [row[0] for row in rows]
+
+    def items_under(self, directory):
+        """ Returns the (path, record) pairs below the specified directory """
+
+        rows = self._query_all(
+            f"SELECT path, {_COLUMNS} FROM records WHERE path >= ? AND path < ?", _subtree_range(directory)
+        )
+
+        return [(row[0], BaselineRecord(*row[1:])) for row in rows]
+
+    def items_in(self, directory, batch_size=256):
+        """ Returns the (path, record) pairs of the files directly in a directory
+
+        Seeks past the range of each subdirectory, so only the
+        directory's own entries are read whatever lies below it.
+        """
+
+        prefix, end = _subtree_range(directory)
+        lower = prefix
+        items = []
+
+        while True:
+            rows = self._query_all(
+                f"SELECT path, {_COLUMNS} FROM records WHERE path >= ? AND path < ? ORDER BY path LIMIT ?",
+                (lower, end, batch_size),
+            )
+
+            for row in rows:
+                name, separator, _ = row[0][len(prefix):].partition(os.sep)
+
+                if separator:
+                    # Paths below the subdirectory sort before its name
+                    # followed by the character after the separator
+                    lower = prefix + name + chr(ord(os.sep) + 1)
+                    break
+
+                items.append((row[0], BaselineRecord(*row[1:])))
+
+            else:
+                if len(rows) < batch_size:
+                    return items
+
+                lower = rows[-1][0] + "\0"
+
+    def get_meta(self, key, default=None):
+        row = self._query_one("SELECT value FROM meta WHERE key = ?", (key,))
+
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        self._write("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def get_directory_digests(self):
+        """ Returns the recorded directory digests, None if outdated """
+
+        if not self._digests_fresh:
+            return None
+
+        return dict(self._query_all("SELECT path, digest FROM directories"))
+
+    def set_directory_digests(self, digests):
+        """ Records the directory digests of the current records """
+
+        with self._lock:
+            self._connection.execute("DELETE FROM directories")
+            self._connection.executemany(
+                "INSERT INTO directories (path, digest) VALUES (?, ?)", digests.items()
+            )
+            self.set_meta("digests_fresh", "1")
+            self._digests_fresh = True
+            self.flush()
+
+    def _invalidate_digests(self):
+        if self._digests_fresh:
+            self._digests_fresh = False
+            self._connection.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('digests_fresh', '0')"
+            )
+
+    def flush(self):
+        """ Commits pending writes """
+
+        with self._lock:
+            self._connection.commit()
+            self._pending = 0
+            self._last_commit = time.monotonic()
+
+    def compact(self):
+        """ Reclaims free pages and truncates the write-ahead log """
+
+        with self._lock:
+            self.flush()
+            self._connection.execute("VACUUM")
+            self._connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self._connection.close()
+
+        with self._instances_lock:
+            self._instances.pop(os.path.abspath(self.source), None)
+
+    def _write_record(self, sql, params):
+        with self._lock:
+            self._invalidate_digests()
+            self._write(sql, params)
+
+    def _write(self, sql, params):
+        with self._lock:
+            self._connection.execute(sql, params)
+            self._pending += 1
+
+            if (
+                self._pending >= self.batch_size
+                or time.monotonic() - self._last_commit >= self.batch_seconds
+            ):
+                self.flush()
+
+    def _query_one(self, sql, params=()):
+        with self._lock:
+            return self._connection.execute(sql, params).fetchone()
+
+    def _query_all(self, sql, params=()):
+        with self._lock:
+            return self._connection.execute(sql, params).fetchall()
+
+
+def _subtree_range(directory) -> tuple:
+    """ Returns the bounds of the paths below a directory, lower inclusive """
+
+    prefix = os.path.join(directory, "")
+
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def import_text_baseline(text_path, db_path, encoding=None):
+    """ Converts a text baseline into an SQLite baseline """
+
+    store = SQLiteBaseline.open(db_path)
+    store.algorithm = read_baseline_header(text_path).get("algorithm", DEFAULT_ALGORITHM)
+    store.set_many(read_baseline_lines(text_path, encoding))
+
+    return store
+
+
+def export_text_baseline(db_path, text_path):
+    """ Writes an SQLite baseline out in the text format """
+
+    store = SQLiteBaseline.open(db_path)
+
+    with open(text_path, "w", encoding="utf-8") as file:
+        file.write(format_baseline_header("utf-8", store.algorithm))
+
+        for file_path, record in store.items():
+            file.write(format_baseline_line(file_path, record))
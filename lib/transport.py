@@ -0,0 +1,94 @@
+import json
+import zlib
+import socket
+import struct
+
+# Frames are a 4 byte big-endian length then zlib compressed JSON
+_HEADER = struct.Struct("!I")
+
+# Largest frame accepted, compressed or not
+MAX_FRAME_BYTES = 16 << 20
+
+DEFAULT_PORT = 7468
+
+
+def parse_address(address) -> tuple:
+    """ Returns the socket family and address of a collector
+
+    Accepts 'unix:PATH' or an absolute path for Unix sockets, and
+    'tcp://HOST:PORT', 'HOST:PORT' or 'HOST' for TCP, with the
+    port defaulting to DEFAULT_PORT.
+    """
+
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address.removeprefix("unix:").removeprefix("//")
+
+    if address.startswith("/"):
+        return socket.AF_UNIX, address
+
+    target = address.removeprefix("tcp://")
+
+    # IPv6 addresses are bracketed, e.g. [::1]:7468
+    if target.startswith("["):
+        host, _, port = target[1:].partition("]")
+        return socket.AF_INET6, (host, int(port.removeprefix(":") or DEFAULT_PORT))
+
+    host, _, port = target.partition(":")
+
+    return socket.AF_INET, (host, int(port or DEFAULT_PORT))
+
+
+def connect(address, timeout=None) -> socket.socket:
+    family, target = parse_address(address)
+
+    if family == socket.AF_UNIX:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+
+        try:
+            sock.connect(target)
+        except OSError:
+            sock.close()
+            raise
+
+        return sock
+
+    return socket.create_connection(target, timeout)
+
+
+def encode_frame(message) -> bytes:
+    payload = zlib.compress(json.dumps(message, separators=(",", ":")).encode("utf-8"))
+
+    return _HEADER.pack(len(payload)) + payload
+
+
+def read_frame(file):
+    """ Reads a whole encoded frame, or returns None at the end of the stream
+
+    A frame cut short by the end of the stream, such as the
+    last frame of a spool written during a crash, counts as the end.
+    """
+
+    header = file.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        return None
+
+    (length,) = _HEADER.unpack(header)
+    if length > MAX_FRAME_BYTES:
+        raise ValueError(f"Frame of {length} bytes is larger than {MAX_FRAME_BYTES}.")
+
+    payload = file.read(length)
+    if len(payload) < length:
+        return None
+
+    return header + payload
+
+
+def decode_frame(frame):
+    decompressor = zlib.decompressobj()
+    data = decompressor.decompress(frame[_HEADER.size:], MAX_FRAME_BYTES)
+
+    if decompressor.unconsumed_tail:
+        raise ValueError(f"Frame expands past {MAX_FRAME_BYTES} bytes.")
+
+    return json.loads(data)
@@ -1,10 +1,11 @@
 import os
 import sys
 import re
-import chardet
 from datetime import datetime, date
 from dateutil.tz import tzlocal
 from config import Config
+from lib.baseline import format_tombstone_line, lock_baseline, read_baseline_header
+from lib.sqlite_baseline import SQLiteBaseline
 from pprint import pprint
 import logging
 import traceback
@@ -68,10 +69,13 @@ def banner():
     \r\n{"=" * 80}
     """)
 
-def get_file_encoding(file_path):
-    #  Get file encoding
+def get_file_encoding(file_path, sample_size=65536):
+    #  Get file encoding from a sample
+    #  of the start of the file
+    import chardet  # Slow to import, only legacy baselines need it
+
     with open(file_path, "rb") as file:
-        content = file.read()
+        content = file.read(sample_size)
         result = chardet.detect(content)
         encoding = result["encoding"]
     return encoding
@@ -81,7 +85,7 @@ def is_valid_baseline_file(file_path):
     #  valid baseline file
     #  if not throw an error
     try:
-        regex = r"^baseline_\d{2}-\d{2}-\d{4}\.txt$"
+        regex = r"^baseline_\d{2}-\d{2}-\d{4}\.(txt|db)$"
         if re.match(regex, os.path.basename(file_path)):
             return True
         else:
@@ -91,21 +95,41 @@ def is_valid_baseline_file(file_path):
         print("error: ", e)
         sys.exit(1)
 
-def update_baseline_file(file_path, file_hash):
-    # Verify if the baseline file is valid
+def update_baseline_entries(entries):
+    """ Applies (path, hash) entries to the selected baseline in one go
+
+    A None hash removes the path.
+    """
     config = Config()
     selected_baseline_file = config.get("SELECTED_BASELINE_FILE")
+
+    # Verify if the baseline file is valid
     if not is_valid_baseline_file(selected_baseline_file):
-        print(f"failed updating invalid baseline file '{file_path}'")
+        print(f"failed updating invalid baseline file '{selected_baseline_file}'")
         return
 
-    else:
-        with open(selected_baseline_file, "a") as file:
-            if os.path.exists(selected_baseline_file):
-                content = f"{file_path} | {file_hash}\n"
-                file.write(content)
+    elif selected_baseline_file.endswith(".db"):
+        # Batched upserts into the store shared with the monitor
+        store = SQLiteBaseline.open(selected_baseline_file)
+        for file_path, file_hash in entries:
+            if file_hash is None:
+                store.remove(file_path)
             else:
-                raise UpdateBaselineException(f"Error updating missing baseline with file '{selected_baseline_file}'.")
+                store.update_hash(file_path, file_hash)
+
+    elif not os.path.exists(selected_baseline_file):
+        raise UpdateBaselineException(f"Error updating missing baseline with file '{selected_baseline_file}'.")
+
+    else:
+        encoding = read_baseline_header(selected_baseline_file).get("encoding")
+
+        # The text baseline is append-only, and compaction must not replace it meanwhile
+        with lock_baseline(selected_baseline_file), open(selected_baseline_file, "a", encoding=encoding) as file:
+            for file_path, file_hash in entries:
+                if file_hash is None:
+                    file.write(format_tombstone_line(file_path))
+                else:
+                    file.write(f"{file_path} | {file_hash}\n")
 
 def get_timestamp(short=False):
     if short:
@@ -119,6 +143,23 @@ def get_absolute_dirname(path):
 # Divider
 divider = "*" * 50
 
+_SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+def parse_size(size) -> int:
+    """ Parses a byte count such as '512', '64K' or '1.5G' """
+    match = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*$", str(size), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid size '{size}'.")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).upper()])
+
+def format_size(size) -> str:
+    """ Formats a byte count with a binary unit """
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(size) < 1024:
+            return f"{size:.1f}{unit}" if unit != "B" else f"{int(size)}B"
+        size /= 1024
+    return f"{size:.1f}TiB"
+
 def verbose_print(msg, pretty=False):
     """ Prints if verbose mode is enabled """
     config = Config()
@@ -1,146 +1,536 @@
 import os
-import json
-from lib import utils, file_handlers as fh
+import stat
+import time
+import threading
+from lib import inotify, metrics, shards, utils, file_handlers as fh
+from lib.baseline import BaselineRecord
+from lib.changes import diff_scan, find_moved_from, group_moves
+from lib.scheduler import ScanScheduler, Throttle
 from config import Config
 
 #  Initialize config
 config = Config()
 
+# Seconds to wait for related inotify events
+WATCH_SETTLE_SECONDS = 0.1
+
+# Longest a worker waits before noticing a shutdown
+SHUTDOWN_POLL_SECONDS = 1.0
+
+# Set to stop the workers, interrupting the current pass
+shutdown = threading.Event()
+
+# Set once a worker begins its first scan, and after each full pass
+first_pass_started = threading.Event()
+pass_completed = threading.Event()
+
+
+class ScanInterrupted(Exception):
+    """ Raised to abandon a pass on shutdown, before anything is reported """
+
 
 #  Worker to begin monitoring files
-def start_monitoring_worker(message_queue, curFile):
-    """Begin monitoring files"""
+def start_monitoring_worker(message_queue, curFile, baseline):
+    """Begin monitoring files against the loaded baseline"""
+
+    # Time of the last full rehash and of the last
+    # full hash of files that are only fingerprinted
+    last_paranoid_pass = last_audit_pass = time.monotonic()
 
-    #  Ensure LAST_SEEN exists
-    if not config.exists("LAST_SEEN"):
-        config.set("LAST_SEEN", json.dumps({}))
+    # Pool hashing the files that changed
+    hash_pool = fh.create_hash_pool(baseline.algorithm)
+    shard_pool = create_shard_pool()
+
+    # Pacing of passes and of hashing within a pass
+    scheduler = ScanScheduler(config.get("PT_SCAN_INTERVAL"))
+    throttle = create_throttle()
 
     # monitoring
-    while True:
-        """ begin monitoring files """
-        files = fh.list_files_recursively(
-            directories=config.get("PT_MONITOR_DIRS"),
-            ignored_dirs=config.get("PT_IGNORED_DIRS"),
-            skip_file_name=curFile,
+    try:
+        while not shutdown.is_set():
+            """ begin monitoring files """
+            scheduler.wait_for_next_pass(shutdown)
+            if shutdown.is_set():
+                break
+
+            first_pass_started.set()
+            throttle.start_pass()
+
+            # Periodically rehash every file regardless
+            # of whether its stat data changed
+            audit = is_audit_pass_due(last_audit_pass)
+            paranoid = audit or is_paranoid_pass_due(last_paranoid_pass)
+            if audit:
+                utils.verbose_print("Audit pass: fully hashing every file...")
+                last_paranoid_pass = last_audit_pass = time.monotonic()
+            elif paranoid:
+                utils.verbose_print("Paranoid pass: rehashing every file...")
+                last_paranoid_pass = time.monotonic()
+
+            scan_directories(
+                config.get("PT_MONITOR_DIRS"),
+                message_queue=message_queue,
+                curFile=curFile,
+                baseline=baseline,
+                hash_pool=hash_pool,
+                paranoid=paranoid,
+                throttle=throttle,
+                audit=audit,
+                shard_pool=shard_pool,
+            )
+
+            baseline.flush()
+            report_pass(throttle)
+            pass_completed.set()
+
+    except ScanInterrupted:
+        utils.verbose_print("Scan pass interrupted by shutdown.")
+
+    finally:
+        baseline.flush()
+        hash_pool.shutdown()
+        if shard_pool:
+            shard_pool.shutdown()
+
+
+#  Worker to monitor files as the kernel reports changes
+def start_watching_worker(message_queue, curFile, baseline):
+    """Begin monitoring files using inotify events"""
+
+    ignored_dirs = config.get("PT_IGNORED_DIRS")
+    monitor_dirs = ",".join(fh.get_monitor_roots(config.get("PT_MONITOR_DIRS")))
+
+    watcher = inotify.TreeWatcher(
+        is_ignored_dir=lambda directory: fh.is_ignored_dir(directory, ignored_dirs)
+    )
+
+    hash_pool = fh.create_hash_pool(baseline.algorithm)
+    shard_pool = create_shard_pool()
+    throttle = create_throttle()
+
+    # Register watches before the initial scan
+    # so no change falls in between
+    for directory in monitor_dirs.split(","):
+        watcher.watch_tree(directory)
+
+    if watcher.unwatched:
+        print(
+            f"Watch limit reached, polling {len(watcher.unwatched)} subtree(s) instead. "
+            "Raise fs.inotify.max_user_watches to watch them."
+        )
+
+    try:
+        # Catch up with changes made since the baseline
+        first_pass_started.set()
+        scan_directories(
+            monitor_dirs, message_queue, curFile, baseline, hash_pool, throttle=throttle, shard_pool=shard_pool
         )
+        report_pass(throttle)
+        pass_completed.set()
+
+        watch_changes(watcher, message_queue, curFile, baseline, hash_pool, throttle, shard_pool)
+
+    except ScanInterrupted:
+        utils.verbose_print("Scan pass interrupted by shutdown.")
+
+    finally:
+        baseline.flush()
+        hash_pool.shutdown()
+        if shard_pool:
+            shard_pool.shutdown()
+        watcher.close()
+
+
+def watch_changes(watcher, message_queue, curFile, baseline, hash_pool, throttle, shard_pool=None):
+    """Handles the changes the watcher reports until shutdown"""
+
+    ignored_dirs = config.get("PT_IGNORED_DIRS")
+    monitor_dirs = ",".join(fh.get_monitor_roots(config.get("PT_MONITOR_DIRS")))
+
+    rescan_interval = float(config.get("PT_WATCH_RESCAN_INTERVAL") or 60)
+    last_rescan = last_paranoid_pass = last_audit_pass = time.monotonic()
+
+    while not shutdown.is_set():
+        changed_paths = set()
+        rescan_dirs = set()
+        removed_dirs = set()
 
-        last_seen = json.loads(config.get("LAST_SEEN"))
+        events = list(watcher.read_events(timeout=min(rescan_interval, SHUTDOWN_POLL_SECONDS)))
 
-        # Loaded baseline
-        loaded_baseline = json.loads(config.get("PT_LOADED_BASELINE"))
+        # Let bursts such as a create followed by
+        # a write settle before hashing anything
+        if events:
+            time.sleep(WATCH_SETTLE_SECONDS)
+            events.extend(watcher.read_events(timeout=0))
 
-        for file in files:
-            file_path, file_hash = [f.strip() for f in file.rsplit("|", 1)]
+        for event_path, mask in events:
+            # Events were dropped, rescan everything
+            if event_path is None:
+                utils.verbose_print("inotify queue overflow, rescanning...")
+                rescan_dirs.update(monitor_dirs.split(","))
+                continue
 
-            file_permission = None
+            if mask & inotify.IN_ISDIR:
+                if mask & (inotify.IN_CREATE | inotify.IN_MOVED_TO):
+                    # Files may land before the new watches exist
+                    watcher.watch_tree(event_path)
+                    rescan_dirs.add(event_path)
 
-            file_abs_path = os.path.join(
-                utils.get_absolute_dirname(file_path), os.path.basename(file_path)
+                elif mask & (inotify.IN_DELETE | inotify.IN_MOVED_FROM):
+                    watcher.unwatch_tree(event_path)
+                    removed_dirs.add(event_path)
+
+                continue
+
+            if mask & (inotify.IN_DELETE_SELF | inotify.IN_MOVE_SELF):
+                continue
+
+            if not fh.is_ignored_file(event_path, curFile, ignored_dirs):
+                changed_paths.add(event_path)
+
+        now = time.monotonic()
+
+        # Poll the subtrees the watch limit left unwatched
+        if watcher.unwatched and now - last_rescan >= rescan_interval:
+            rescan_dirs.update(watcher.unwatched)
+            last_rescan = now
+
+        audit = is_audit_pass_due(last_audit_pass)
+        paranoid = audit or is_paranoid_pass_due(last_paranoid_pass)
+        if paranoid:
+            utils.verbose_print(
+                "Audit pass: fully hashing every file..." if audit else "Paranoid pass: rehashing every file..."
+            )
+            rescan_dirs.update(monitor_dirs.split(","))
+            last_paranoid_pass = now
+            if audit:
+                last_audit_pass = now
+
+        if rescan_dirs:
+            throttle.start_pass()
+            # Only full rescans are worth sharding
+            scan_directories(
+                ",".join(rescan_dirs), message_queue, curFile, baseline, hash_pool, paranoid, throttle, audit,
+                shard_pool if rescan_dirs >= set(monitor_dirs.split(",")) else None,
             )
+            report_pass(throttle)
+
+        if changed_paths:
+            check_paths(changed_paths, message_queue, baseline, hash_pool, throttle)
+
+        # After the rescans so directories that were
+        # moved are reported as moves, not deletions
+        for directory in removed_dirs:
+            check_deleted_subtree(directory, message_queue, baseline)
+
+        baseline.flush()
+
+
+def scan_directories(
+    directories, message_queue, curFile, baseline, hash_pool, paranoid=False, throttle=None, audit=False,
+    shard_pool=None,
+):
+    """Walks the specified directories and reports what changed
+
+    Files that no longer exist are found by diffing every
+    path the walk saw against the baseline paths below the
+    directories, so deletions are reported in polling mode too.
+    With a shard pool the walk is split across its processes.
+    """
+
+    ignored_dirs = config.get("PT_IGNORED_DIRS")
+
+    # Baseline paths the walk is expected to find
+    expected_paths = set()
+    for directory in directories.split(","):
+        expected_paths.update(
+            file_path
+            for file_path in baseline.paths_under(os.path.abspath(directory.strip()))
+            if not fh.is_ignored_file(file_path, curFile, ignored_dirs)
+        )
+
+    seen_paths = set()
+    started = time.perf_counter()
+
+    def walked_files():
+        if shard_pool:
+            files = shard_pool.walk_files(curFile, directories, ignored_dirs, expected_paths)
+        else:
+            files = fh.walk_files(directories=directories, ignored_dirs=ignored_dirs, skip_file_name=curFile)
+
+        for file_path, file_stat in files:
+            if shutdown.is_set():
+                raise ScanInterrupted()
+
+            seen_paths.add(file_path)
+            yield file_path, file_stat
+
+    moved = {}
+    records = hash_changed_files(walked_files(), baseline, hash_pool, paranoid, throttle, audit, moved)
+
+    changes = diff_scan(baseline, records, seen_paths, expected_paths, moved)
+    report_changes(changes, message_queue, baseline)
+
+    metrics.FILES_WALKED.inc(len(seen_paths))
+    metrics.SCAN_SECONDS.observe(time.perf_counter() - started)
 
-            if file_path not in loaded_baseline and file_abs_path not in last_seen:
-                # Get file permission
-                file_permission = fh.get_file_permission(file_abs_path)
-
-                if file_permission == "None":
-                    raise Exception(
-                        f"Unable to get file permission for {file_abs_path}"
-                    )
-
-                if file_hash not in loaded_baseline.values():
-                    # The hash and control hash are
-                    # the same for new files
-                    control_hash = file_hash
-
-                    message_queue.put(
-                        (
-                            "File_added",
-                            {
-                                "file_path": file_abs_path,
-                                "file_hash": file_hash,
-                                "control_hash": control_hash,
-                                "file_permission": file_permission,
-                            },
-                        )
-                    )
-                else:
-                    # A copied file has the same hash
-                    # as the original therefore the
-                    # control hash is the same
-                    control_hash = file_hash
-                    message_queue.put(
-                        (
-                            "File_copied",
-                            {
-                                "file_path": file_abs_path,
-                                "file_hash": file_hash,
-                                "control_hash": control_hash,
-                                "file_permission": file_permission,
-                            },
-                        )
-                    )
-            else:
-                # The control hash of a modified
-                # file is equal to the original file's hash
-                control_hash = loaded_baseline[file_path]
-
-                if os.path.exists(file_path):
-                    if fh.calc_file_hash(file_path) != loaded_baseline[file_path]:
-                        message_queue.put(
-                            (
-                                "File_modified",
-                                {
-                                    "file_path": file_abs_path,
-                                    "file_hash": file_hash,
-                                    "control_hash": control_hash,
-                                    "file_permission": file_permission,
-                                },
-                            )
-                        )
-                else:
-                    control_hash = loaded_baseline[file_path]
-                    print(f"File deleted: {file_path}")
-                    message_queue.put(
-                        (
-                            "File_deleted",
-                            {
-                                "file_path": file_abs_path,
-                                "file_hash": file_hash,
-                                "control_hash": control_hash,
-                            },
-                        )
-                    )
-
-            loaded_baseline[file_path] = file_hash
-            config.set("PT_LOADED_BASELINE", json.dumps(loaded_baseline))
-
-
-# Worker to calcculate hash
-def hash_worker(message_queue):
-    """Worker function to process hash calculations"""
-    while True:
+
+def check_paths(file_paths, message_queue, baseline, hash_pool, throttle=None):
+    """Checks specific paths, including ones that no longer exist"""
+
+    files = []
+
+    for file_path in file_paths:
         try:
-            # Get a file path from the queue
-            params = fh.hash_calc_queue.get()
+            file_stat = os.stat(file_path)
+        except FileNotFoundError:
+            continue
 
-            (file_path, control_hash) = params
+        if stat.S_ISREG(file_stat.st_mode):
+            files.append((file_path, file_stat))
 
-            if file_path is None:
-                break
-            # Calculate the hash of the file
-            file_hash = fh.calc_file_hash(file_path)
-
-            # Put the file hash to the message queue
-            message_queue.put(
-                (
-                    "File_added",
-                    {
-                        "file_path": file_path,
-                        "file_hash": file_hash,
-                        "control_hash": control_hash,
-                    },
-                )
+    moved = {}
+    records = hash_changed_files(files, baseline, hash_pool, throttle=throttle, moved=moved)
+
+    changes = diff_scan(
+        baseline,
+        records,
+        seen_paths=(file_path for file_path, _ in files),
+        expected_paths=(file_path for file_path in file_paths if file_path in baseline),
+        moved=moved,
+    )
+    report_changes(changes, message_queue, baseline)
+
+
+def hash_changed_files(files, baseline, hash_pool, paranoid=False, throttle=None, audit=False, moved=None) -> dict:
+    """Hashes the (path, stat) entries that changed since the baseline
+
+    Returns their fresh records by path. An audit fully hashes
+    large files that are otherwise only fingerprinted. New files
+    that were moved from a baseline path are not hashed but added
+    to `moved`, when given, with the record carried over.
+    """
+
+    throttle = throttle or Throttle()
+
+    changed_files = select_changed_files(files, baseline, paranoid, throttle, hash_pool, moved)
+
+    return {
+        file_path: record
+        for file_path, _, record in fh.hash_records(changed_files, baseline, hash_pool, audit, throttle)
+    }
+
+
+def report_changes(changes, message_queue, baseline):
+    """Queues an event for each change and applies them to the baseline"""
+
+    for file_path, record in changes.added.items():
+        report_new_file("File_added", file_path, record, message_queue)
+
+    for file_path, record in changes.copied.items():
+        report_new_file("File_copied", file_path, record, message_queue)
+
+    for file_path, (old, new) in changes.modified.items():
+        # The control hash of a modified
+        # file is equal to the original file's hash
+        message_queue.put(
+            (
+                "File_modified",
+                {
+                    "file_path": file_path,
+                    "file_hash": new.file_hash,
+                    "control_hash": old.file_hash,
+                    "file_permission": None,
+                    "detected_at": time.monotonic(),
+                },
             )
+        )
+
+    for move in group_moves(baseline, changes.moved):
+        report_move(move, message_queue, baseline)
+
+    for file_path in changes.deleted:
+        check_deleted_file(file_path, message_queue, baseline)
+
+    # Record the new hashes and refreshed stat data
+    for records in (changes.added, changes.copied, changes.unchanged):
+        for file_path, record in records.items():
+            baseline.set(file_path, record)
+
+    for file_path, (_, record) in changes.modified.items():
+        baseline.set(file_path, record)
+
+
+def report_move(move, message_queue, baseline):
+    """Queues the File_moved event of a file or directory and applies it"""
+
+    if move.is_directory:
+        print(f"Directory moved: {move.old_path} -> {move.new_path} ({len(move.files)} files)")
+        file_hash = None
+    else:
+        file_hash = move.files[0][2].file_hash
+
+    message_queue.put(
+        (
+            "File_moved",
+            {
+                "file_path": move.new_path,
+                "old_path": move.old_path,
+                "file_hash": file_hash,
+                "control_hash": file_hash,
+                "is_directory": move.is_directory,
+                "moved_files": [
+                    (old_path, new_path, record.file_hash)
+                    for old_path, new_path, record in move.files
+                ],
+                "detected_at": time.monotonic(),
+            },
+        )
+    )
+
+    for old_path, new_path, record in move.files:
+        baseline.remove(old_path)
+        baseline.set(new_path, record)
+
+
+def report_new_file(event, file_path, record, message_queue):
+    """Queues the File_added or File_copied event of a new file"""
+
+    # Get file permission
+    file_permission = fh.get_file_permission(file_path)
+
+    if file_permission == "None":
+        raise Exception(
+            f"Unable to get file permission for {file_path}"
+        )
+
+    # The hash and control hash are the same for new files,
+    # a copied file has the same hash as the original
+    message_queue.put(
+        (
+            event,
+            {
+                "file_path": file_path,
+                "file_hash": record.file_hash,
+                "control_hash": record.file_hash,
+                "file_permission": file_permission,
+                "detected_at": time.monotonic(),
+            },
+        )
+    )
+
+
+def check_deleted_file(file_path, message_queue, baseline):
+    """Reports a baseline file that no longer exists"""
+
+    record = baseline.remove(file_path)
+    if record is None:
+        return
+
+    file_abs_path = os.path.abspath(file_path)
+
+    print(f"File deleted: {file_path}")
+    message_queue.put(
+        (
+            "File_deleted",
+            {
+                "file_path": file_abs_path,
+                "file_hash": record.file_hash,
+                "control_hash": record.file_hash,
+                "detected_at": time.monotonic(),
+            },
+        )
+    )
+
+
+def check_deleted_subtree(directory, message_queue, baseline):
+    """Reports every baseline file under a directory that was removed"""
+
+    for file_path in baseline.paths_under(directory):
+        if not os.path.exists(file_path):
+            check_deleted_file(file_path, message_queue, baseline)
+
+
+def select_changed_files(files, baseline, paranoid, throttle, hash_pool, moved=None):
+    """Yields the (path, stat) entries that need hashing, within budget
+
+    New files moved from a baseline path go to `moved` instead.
+    """
+
+    claimed = set()
+
+    for file_path, file_stat in files:
+        throttle.walked()
+
+        record = baseline.get(file_path)
+
+        # Only rehash files whose size, mtime, ctime
+        # or inode changed since they were last hashed
+        if not paranoid and is_unchanged(record, file_stat):
+            continue
+
+        if record is None and moved is not None:
+            old_path = find_moved_from(baseline, file_path, file_stat, claimed)
+
+            if old_path is not None:
+                old = baseline.get(old_path)
+                moved[file_path] = (old_path, BaselineRecord.from_stat(old.file_hash, file_stat, old.fingerprint))
+                claimed.add(old_path)
+                continue
+
+        # Large files are charged for their fingerprint
+        # here and for a full hash once one is needed
+        throttle.consume(hash_pool.read_size(file_stat.st_size))
+
+        yield file_path, file_stat
+
+
+def create_throttle() -> Throttle:
+    """Creates a hashing throttle from the configured budget"""
+
+    return Throttle(
+        bytes_per_sec=config.get("PT_HASH_BYTES_PER_SEC"),
+        files_per_sec=config.get("PT_HASH_FILES_PER_SEC"),
+    )
+
+
+def create_shard_pool():
+    """Creates a pool of scan workers, or None to walk in this thread"""
+
+    workers = int(config.get("PT_SCAN_WORKERS") or 1)
+
+    return shards.ShardPool(workers) if workers > 1 else None
+
+
+def report_pass(throttle):
+    """Reports the throughput of the last pass against the budget"""
+
+    if throttle.is_limited:
+        print(throttle.report())
+    else:
+        utils.verbose_print(throttle.report())
+
+
+def is_unchanged(record, file_stat) -> bool:
+    """Checks whether a file's stat data matches its baseline record"""
+    return record is not None and record.matches_stat(file_stat)
+
+
+def is_audit_pass_due(last_audit_pass) -> bool:
+    """Checks whether a full hash of fingerprinted files is due"""
+
+    interval = float(config.get("PT_FINGERPRINT_AUDIT_INTERVAL") or 0)
+
+    return (
+        interval > 0
+        and int(config.get("PT_FINGERPRINT_THRESHOLD") or 0) > 0
+        and time.monotonic() - last_audit_pass >= interval
+    )
+
+
+def is_paranoid_pass_due(last_paranoid_pass) -> bool:
+    """Checks whether a full rehash of every file is due"""
+
+    interval = float(config.get("PT_PARANOID_INTERVAL") or 0)
 
-        finally:
-            fh.hash_calc_queue.task_done()
+    return interval > 0 and time.monotonic() - last_paranoid_pass >= interval
@@ -25,8 +25,13 @@
 
 #  File Integrity Monitor (FIM)
 
-import json
-from lib import log_listener, utils
+import time
+
+#  Launch time, before the imports, to measure the cold start
+started = time.perf_counter()
+
+import sys
+from lib import daemon, log_listener, scheduler, utils
 from config import Config
 from queue import Queue
 from cli import parse_arguments, handle_command, show_menu
@@ -43,20 +48,21 @@ if __name__ == "__main__":
     args = parse_arguments()
     handle_command(args)
 
-    #  Initialize loaded baseline
-    config.set("PT_LOADED_BASELINE", json.dumps({}))
+    #  Lower priority before any worker thread starts
+    scheduler.lower_priority(config.get("PT_NICE"), config.get("PT_IONICE_CLASS"))
 
     # Queue for messages to be processed by a separate event handler
     message_queue = Queue()
 
-    # Queue for hash calculations to offload heavy processing
-    hash_calc_queue = Queue()
-
     # Directory to monitor:
     monitor_dirs = config.get("PT_MONITOR_DIRS")
 
     curFile = utils.get_absolute_dirname("__file__")
 
+    #  Monitor without the menu until stopped
+    if args.daemon:
+        sys.exit(daemon.run_daemon(args.baseline, curFile, message_queue, started))
+
     #  Display the main menu
     show_menu(curFile, message_queue)
 